@@ -1,12 +1,15 @@
 # backend/app_flask.py
-from flask import Flask, jsonify, request
-from schemas import Salon, AsistenciaAlumno, AsistenciaProfesor, Horario, Desconocido, Matricula, Curso, Alumno, Profesor, Computadora
+from flask import Flask, g, jsonify, request
+from sqlalchemy import event, literal, select, text, union_all
+from schemas import (Salon, AsistenciaAlumno, AsistenciaProfesor, Horario, Desconocido, Matricula, Curso, Alumno, Profesor, Computadora,
+                     EmbeddingAlumno, EmbeddingProfesor)
 from database import db
 import os
 import pandas as pd
 import cv2  # For image processing if needed, DeepFace uses it
-from deepface import DeepFace
-import tempfile  # For temporarily storing the uploaded image
+import numpy as np
+import deepface
+from deepface.modules import verification
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -15,13 +18,33 @@ from email import encoders
 from twilio.rest import Client
 from datetime import datetime, timedelta
 import shutil
+import tempfile
 import os
 import re # For a more robust parsing
+import hashlib
+import json
 from dotenv import load_dotenv
-import urllib.request
 from concurrent.futures import ThreadPoolExecutor  # Para descarga concurrent
+from concurrent.futures import TimeoutError as TimeoutInferencia
 import asyncio
 import psycopg2
+import threading
+import time
+import multiprocessing
+from asistencias import guardar_asistencias, indices_faltantes
+from migrar_desconocido import falta_columna_cantidad
+from cache_imagenes import CacheImagenes, ESTADO_FALLIDA
+from cache_resultados import CacheResultados, huella_cara, huella_perceptual
+from desconocidos import AgrupadorDesconocidos
+from galeria import GaleriaVersionada, entradas_desde_carpeta, serializar_embedding, deserializar_embedding
+from modelos import (MotorReconocimiento, decodificar_imagen, ESTADO_REAL, ESTADO_SPOOF, ESTADO_SIN_CARA,
+                     ESTADO_NO_DETECTADO, ESTADO_ERROR, ESTADO_IMAGEN_INVALIDA)
+from indice_compacto import IndiceCompacto
+from indice_ivf import IndiceIVF
+from metricas import RegistroMetricas
+from planificador import PlanificadorLotes
+from precarga import PrecargaHorarios
+from trabajadores import PoolInferencia, ColaLlena
 load_dotenv()
 
 app = Flask(__name__)
@@ -38,6 +61,65 @@ MODEL_NAME = "VGG-Face"
 DETECTOR_BACKEND = "opencv" # O "ssd", "dlib", "mtcnn", "retinaface", "mediapipe", "yolov8", "yunet", "fastmtcnn"
 DISTANCE_METRIC = 'cosine' # 'cosine', 'euclidean', 'euclidean_l2'
 DISTANCE_THRESHOLD = 0.65 # Umbral de distancia. Ajusta esto según tus pruebas. Para VGG-Face y cosine.
+# 'tensorflow' (el modelo de DeepFace) u 'onnx' (RUTA_MODELO_ONNX con ONNX Runtime en CPU, ver exportar_onnx.py)
+MOTOR_INFERENCIA = os.getenv('MOTOR_INFERENCIA', 'tensorflow')
+RUTA_MODELO_ONNX = os.getenv('RUTA_MODELO_ONNX', os.path.join('modelos_onnx', f"{MODEL_NAME}.onnx"))
+HILOS_ONNX = int(os.getenv('HILOS_ONNX', 0))
+MAX_IMAGENES_LOTE = int(os.getenv('MAX_IMAGENES_LOTE', 32)) # Máximo de imágenes aceptadas por /ia/batch
+# Micro-batching de /ia: caras por lote y espera máxima (ms) del primer trabajo antes de ejecutar el lote
+MICROLOTE_MAX = int(os.getenv('MICROLOTE_MAX', 16))
+MICROLOTE_ESPERA_MS = float(os.getenv('MICROLOTE_ESPERA_MS', 5))
+# Pool de procesos de inferencia: 0 ejecuta el reconocimiento en el proceso de Flask (con micro-batching).
+# Con N > 0 la detección, el anti-spoofing y el embedding corren en N procesos con los modelos precargados.
+TRABAJADORES_IA = int(os.getenv('TRABAJADORES_IA', 0))
+MAX_COLA_IA = int(os.getenv('MAX_COLA_IA', 32)) # Trabajos en espera antes de responder 503 con Retry-After
+TIMEOUT_INFERENCIA = float(os.getenv('TIMEOUT_INFERENCIA', 10)) # Menor que el timeout de 15 s del kiosco
+# Segundos que se reutiliza la lista de candidatos (alumnos matriculados + profesor) de cada horario
+TTL_CANDIDATOS_S = float(os.getenv('TTL_CANDIDATOS_S', 300))
+# Segundos que se reutiliza el horario semanal de cada salón de /salon. Los cambios hechos por este proceso lo
+# invalidan al instante; el TTL cubre los hechos fuera de él (otro proceso del backend o directamente en la base)
+TTL_HORARIOS_SALON_S = float(os.getenv('TTL_HORARIOS_SALON_S', 300))
+# Caché de /ia para frames repetidos de la misma persona (solo con id_horario): segundos que se reutiliza una
+# identificación (0: deshabilitada), entradas máximas y bits de diferencia tolerados entre huellas perceptuales (de 256)
+TTL_CACHE_RESULTADOS_S = float(os.getenv('TTL_CACHE_RESULTADOS_S', 3))
+MAX_CACHE_RESULTADOS = int(os.getenv('MAX_CACHE_RESULTADOS', 512))
+DISTANCIA_HUELLA_MAX = int(os.getenv('DISTANCIA_HUELLA_MAX', 12))
+# Distancia máxima entre el embedding de un desconocido y un grupo de desconocidos para contarlo como la misma persona
+UMBRAL_DESCONOCIDOS = float(os.getenv('UMBRAL_DESCONOCIDOS', DISTANCE_THRESHOLD))
+# Un roster (horario) que no se refresca en este tiempo deja de mantenerse en la galería
+TTL_ROSTER_S = float(os.getenv('TTL_ROSTER_S', 6 * 3600))
+# Carpeta donde se publica la galería (matriz .npy + galeria.json) para que todos los procesos del backend
+# la mapeen en memoria sin copiarla. Vacío: cada proceso mantiene su propia galería en memoria.
+RUTA_GALERIA_COMPARTIDA = os.getenv('RUTA_GALERIA_COMPARTIDA', 'galeria_compartida')
+# Caché persistente de las fotos de matrícula (por URL y por contenido) y descargas simultáneas permitidas
+RUTA_CACHE_IMAGENES = os.getenv('RUTA_CACHE_IMAGENES', 'cache_imagenes')
+DESCARGAS_CONCURRENTES = int(os.getenv('DESCARGAS_CONCURRENTES', 8))
+TIMEOUT_DESCARGA_S = float(os.getenv('TIMEOUT_DESCARGA_S', 15))
+# Precarga de galerías: cada PRECARGA_INTERVALO_S se preparan los horarios que empiezan en los próximos
+# PRECARGA_ANTICIPACION_MIN minutos (0: sin precarga), hasta PRECARGA_CONCURRENCIA a la vez, siempre que no haya
+# más de PRECARGA_MAX_IA_EN_CURSO reconocimientos en curso
+PRECARGA_ANTICIPACION_MIN = int(os.getenv('PRECARGA_ANTICIPACION_MIN', 45))
+PRECARGA_INTERVALO_S = float(os.getenv('PRECARGA_INTERVALO_S', 60))
+PRECARGA_CONCURRENCIA = int(os.getenv('PRECARGA_CONCURRENCIA', 2))
+PRECARGA_MAX_IA_EN_CURSO = int(os.getenv('PRECARGA_MAX_IA_EN_CURSO', 4))
+# 'exacto' compara cada consulta con toda la galería; 'ivf' solo con las IVF_SONDAS listas más cercanas de IVF_LISTAS
+# (0: ~sqrt(N)), pensado para identificar contra todo el campus. Las búsquedas por horario siempre son exactas.
+# 'compacto' busca sobre embeddings proyectados con PCA a DIMENSION_COMPACTA y cuantizados (CUANTIZACION_COMPACTA:
+# 'int8' o 'float16'), y reordena los REORDENAR_TOP_K mejores con la distancia exacta (0: distancia aproximada).
+TIPO_INDICE = os.getenv('TIPO_INDICE', 'exacto')
+IVF_LISTAS = int(os.getenv('IVF_LISTAS', 0))
+IVF_SONDAS = int(os.getenv('IVF_SONDAS', 16))
+DIMENSION_COMPACTA = int(os.getenv('DIMENSION_COMPACTA', 128))
+CUANTIZACION_COMPACTA = os.getenv('CUANTIZACION_COMPACTA', 'int8')
+REORDENAR_TOP_K = int(os.getenv('REORDENAR_TOP_K', 10))
+# Los embeddings guardados en la base de datos solo se usan si se calcularon con la misma versión
+VERSION_EMBEDDINGS = os.getenv('VERSION_EMBEDDINGS', f"deepface-{deepface.__version__}-{DETECTOR_BACKEND}" + (
+    f"-onnx-{os.path.splitext(os.path.basename(RUTA_MODELO_ONNX))[0]}" if MOTOR_INFERENCIA == 'onnx' else ""))
+FORMATO_EMBEDDINGS = os.getenv('FORMATO_EMBEDDINGS', 'float16') # 'float16' o 'float32'
+# Construir y calentar los modelos al arrancar, en vez de hacerlo en la primera llamada a /ia
+PRECARGAR_MODELOS = os.getenv('PRECARGAR_MODELOS', '1') == '1'
+# Umbral con el que DeepFace.find descartaba candidatos; por encima de este valor se considera que no hubo coincidencia.
+UMBRAL_BUSQUEDA = verification.find_threshold(MODEL_NAME, DISTANCE_METRIC)
 
 if not os.path.exists(RUTA_CARPETA_IMAGENES):
     os.makedirs(RUTA_CARPETA_IMAGENES)
@@ -98,6 +180,495 @@ def parse_identity_filename(filename):
         app.logger.warning(f"Formato de nombre de archivo no reconocido: {filename}. No se pudo extraer ID/Rol.")
         return None, None
 
+# Detector + modelo de embeddings compartidos por todas las peticiones
+motor = MotorReconocimiento(MODEL_NAME, DETECTOR_BACKEND, ruta_onnx=RUTA_MODELO_ONNX if MOTOR_INFERENCIA == 'onnx' else None,
+                            hilos_onnx=HILOS_ONNX)
+# Hilos para la detección + anti-spoofing de /ia/batch (OpenCV y el modelo anti-spoofing liberan el GIL)
+executor_deteccion = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+# Agrupa las caras de peticiones /ia concurrentes en un solo forward del modelo de embeddings
+planificador_embeddings = PlanificadorLotes(motor.embeber_caras, max_lote=MICROLOTE_MAX, max_espera_ms=MICROLOTE_ESPERA_MS)
+# Un grupo (una imagen + cantidad de frames) por cada persona no reconocida de la clase actual
+agrupador_desconocidos = AgrupadorDesconocidos(RUTA_DESCONOCIDOS_CLASE_ACTUAL, UMBRAL_DESCONOCIDOS, DISTANCIA_HUELLA_MAX)
+# Identificaciones recientes por horario, para no repetir la inferencia con frames casi iguales
+cache_resultados = CacheResultados(TTL_CACHE_RESULTADOS_S, MAX_CACHE_RESULTADOS, DISTANCIA_HUELLA_MAX)
+# Fotos de matrícula ya descargadas: solo se vuelven a bajar si el servidor indica que cambiaron
+cache_imagenes = CacheImagenes(RUTA_CACHE_IMAGENES, DESCARGAS_CONCURRENTES, TIMEOUT_DESCARGA_S)
+# Se crea en el primer uso (ver obtener_pool_inferencia) para que los procesos "spawn" no lo repliquen al importar
+pool_inferencia = None
+lock_pool_inferencia = threading.Lock()
+
+# Galería con doble buffer: /ia busca en la generación publicada mientras /usuarios construye la siguiente
+# aparte y la publica con un cambio atómico de referencia (y, con RUTA_GALERIA_COMPARTIDA, de archivo)
+def construir_indice_busqueda(indice, anterior, auxiliares):
+    if TIPO_INDICE == 'compacto':
+        return IndiceCompacto.reconstruir(indice, anterior, auxiliares, dimension_reducida=DIMENSION_COMPACTA,
+                                          cuantizacion=CUANTIZACION_COMPACTA, reordenar=REORDENAR_TOP_K)
+    return IndiceIVF.reconstruir(indice, anterior, auxiliares, n_listas=IVF_LISTAS or None, n_sondas=IVF_SONDAS)
+
+galeria = GaleriaVersionada(metrica=DISTANCE_METRIC, ttl_roster_s=TTL_ROSTER_S, ruta_compartida=RUTA_GALERIA_COMPARTIDA or None,
+                            fabrica_indice=construir_indice_busqueda if TIPO_INDICE in ('ivf', 'compacto') else None)
+
+# Métricas expuestas en /metrics (formato Prometheus). La ruta es la regla de Flask ("/ia", "/usuarios/<id_horario>")
+# para que la cantidad de series no crezca con los ids.
+metricas = RegistroMetricas()
+metrica_peticiones = metricas.contador("backend_peticiones_total", "Peticiones atendidas por ruta, método y código HTTP.",
+                                       ("ruta", "metodo", "codigo"))
+metrica_en_curso = metricas.medidor("backend_peticiones_en_curso", "Peticiones en curso por ruta.", ("ruta",))
+metrica_duracion = metricas.histograma("backend_peticion_segundos", "Duración de las peticiones por ruta.", ("ruta",))
+metrica_etapas = metricas.histograma("backend_ia_etapa_segundos", "Duración de cada etapa del reconocimiento.", ("ruta", "etapa"))
+metrica_resultados = metricas.contador("backend_ia_resultados_total", "Resultados del reconocimiento por frame.", ("ruta", "resultado"))
+metrica_descargas = metricas.contador("backend_descargas_imagen_total", "Fotos de matrícula pedidas, por resultado.", ("estado",))
+metrica_duracion_descargas = metricas.histograma("backend_descarga_imagen_segundos", "Duración de cada descarga o revalidación de foto.")
+metricas.medidor("backend_galeria_identidades", "Identidades en la generación publicada de la galería.",
+                 funcion=lambda: len(galeria.actual()))
+metricas.medidor("backend_galeria_generacion", "Generación publicada de la galería.", funcion=lambda: galeria.generacion)
+metricas.medidor("backend_pool_inferencia_pendientes", "Trabajos en el pool de procesos de inferencia (en curso + en cola).",
+                 funcion=lambda: pool_inferencia.estadisticas()["pendientes"] if pool_inferencia is not None else 0)
+
+@app.before_request
+def iniciar_metricas_peticion():
+    g.inicio_peticion = time.perf_counter()
+    g.ruta_metricas = request.url_rule.rule if request.url_rule is not None else "sin_ruta"
+    metrica_en_curso.sumar(g.ruta_metricas)
+
+@app.after_request
+def registrar_metricas_peticion(respuesta):
+    if "ruta_metricas" in g:
+        metrica_peticiones.incrementar(g.ruta_metricas, request.method, respuesta.status_code)
+        metrica_duracion.observar(g.ruta_metricas, valor=time.perf_counter() - g.inicio_peticion)
+        for etapa, segundos in g.get("tiempos_ia", {}).items():
+            metrica_etapas.observar(g.ruta_metricas, etapa, valor=segundos)
+    return respuesta
+
+@app.teardown_request
+def terminar_metricas_peticion(error=None):
+    if "ruta_metricas" in g:
+        metrica_en_curso.sumar(g.ruta_metricas, cantidad=-1)
+
+def contar_resultado_ia(estado, respuesta):
+    """Cuenta el resultado de un frame: clasificado, reintentar, spoof, sin_cara, desconocido o error."""
+    if respuesta.get("id", "unknown") != "unknown":
+        resultado = "clasificado"
+    elif respuesta.get("clasificado"):
+        resultado = "reintentar" # Hubo coincidencia pero la distancia supera DISTANCE_THRESHOLD
+    elif estado == ESTADO_SPOOF:
+        resultado = "spoof"
+    elif estado in (ESTADO_SIN_CARA, ESTADO_NO_DETECTADO):
+        resultado = "sin_cara"
+    elif estado in (ESTADO_ERROR, ESTADO_IMAGEN_INVALIDA):
+        resultado = "error"
+    else:
+        resultado = "desconocido"
+    metrica_resultados.incrementar(g.get("ruta_metricas", "sin_ruta"), resultado)
+
+def representar_imagen(img):
+    """
+    Calcula el embedding de la primera cara detectada en img (ruta o arreglo BGR).
+    Lanza ValueError si DeepFace no detecta ningún rostro.
+    """
+    return motor.representar(img)
+
+def guardar_desconocido(datos, resultado=None):
+    """
+    Agrega el frame a los desconocidos de RUTA_DESCONOCIDOS_CLASE_ACTUAL: si es la misma persona que un
+    desconocido anterior (por embedding o, sin cara, por huella perceptual) solo se cuenta y se conserva la
+    imagen de mejor calidad. Devuelve (ruta de la imagen, cantidad de frames de esa persona).
+    Es el único punto del reconocimiento que toca el disco.
+    """
+    resultado = resultado or {}
+    huella = huella_perceptual(datos) # Del frame completo: también agrupa los frames sin cara
+    return agrupador_desconocidos.registrar(datos, resultado.get("embedding"), huella, resultado.get("calidad", 0.0))
+
+def adjuntar_tiempos(respuesta, tiempos, inicio):
+    """
+    En modo debug añade a la respuesta el desglose de tiempos por etapa (en ms)
+    para poder medir el costo de cada paso del reconocimiento.
+    """
+    if app.debug:
+        tiempos["total"] = time.perf_counter() - inicio
+        respuesta["tiempos_ms"] = {etapa: round(segundos * 1000, 2) for etapa, segundos in tiempos.items()}
+    return respuesta
+
+def clave_persona(persona):
+    return f"persona_{persona['id']}_tipo_{persona['tipo']}"
+
+def ruta_imagen_persona(persona, carpeta=RUTA_CARPETA_IMAGENES):
+    return os.path.join(carpeta, f"{clave_persona(persona)}.jpg") # Usa .jpg
+
+def entradas_desde_roster(lista_personas, indice, carpeta_descargas, guardados):
+    """
+    Convierte la lista de usuarios de /usuarios en entradas para sincronizar la galería, con la URL de la foto como fuente.
+    - Si hay un embedding guardado en la base de datos para la URL actual, se usa directamente.
+    - Si la URL no cambió respecto a la galería, la entrada no lleva archivo (se reutiliza el embedding).
+    - Si la foto se acaba de descargar, se usa la copia de carpeta_descargas.
+    - Si no, se usa la copia de RUTA_CARPETA_IMAGENES, si existe; si no hay ninguna, la persona se omite.
+    """
+    entradas = []
+    for persona in lista_personas:
+        clave = clave_persona(persona)
+        user_id, user_rol = parse_identity_filename(f"{clave}.jpg")
+        if user_id is None:
+            continue
+
+        guardado = guardados.get(clave)
+        if guardado is not None and guardado[0] == persona.get('url_img'):
+            entradas.append({
+                "clave": clave,
+                "id": user_id,
+                "rol": user_rol,
+                "ruta": None,
+                "fuente": persona.get('url_img'),
+                "embedding": guardado[1]
+            })
+            continue
+
+        if persona.get('url_img') and indice.fuente(clave) == persona['url_img']:
+            ruta = None
+        elif os.path.exists(ruta_imagen_persona(persona, carpeta_descargas)):
+            ruta = ruta_imagen_persona(persona, carpeta_descargas)
+        elif os.path.exists(ruta_imagen_persona(persona)):
+            ruta = ruta_imagen_persona(persona)
+        else:
+            continue
+
+        entradas.append({
+            "clave": clave,
+            "id": user_id,
+            "rol": user_rol,
+            "ruta": ruta,
+            "fuente": persona.get('url_img')
+        })
+    return entradas
+
+def publicar_imagenes(carpeta_descargas):
+    """
+    Mueve las fotos descargadas a RUTA_CARPETA_IMAGENES con os.replace (renombrado atómico),
+    así nunca hay un JPEG a medio escribir en la carpeta en uso, y elimina la carpeta de descargas.
+    """
+    for nombre_archivo in os.listdir(carpeta_descargas):
+        os.replace(os.path.join(carpeta_descargas, nombre_archivo), os.path.join(RUTA_CARPETA_IMAGENES, nombre_archivo))
+    shutil.rmtree(carpeta_descargas, ignore_errors=True)
+
+def roster_horario(id_horario):
+    """
+    Alumnos matriculados en el horario y todos los profesores en una sola consulta (sin cargar cada alumno por
+    separado), ordenados por tipo e id para que la versión del roster no dependa del orden de la base de datos.
+    """
+    alumnos = (select(Matricula.id_alumno.label("id"), Alumno.url_img.label("url_img"), literal(0).label("tipo"))
+               .join(Alumno, Matricula.id_alumno == Alumno.id)
+               .where(Matricula.id_horario == id_horario))
+    profesores = select(Profesor.id.label("id"), Profesor.url_img.label("url_img"), literal(1).label("tipo"))
+    consulta = union_all(alumnos, profesores).order_by(text("tipo"), text("id"))
+    return [{"id": fila.id, "url_img": fila.url_img, "tipo": fila.tipo} for fila in db.session.execute(consulta)]
+
+def personas_con_foto(lista_personas):
+    """{clave: url_img} de las personas que tienen foto; sin url_img no hay nada que cargar en la galería."""
+    return {clave_persona(persona): persona['url_img'] for persona in lista_personas if persona.get('url_img')}
+
+def version_roster(lista_personas):
+    """
+    Hash estable de todo el roster, incluidas las personas sin foto (están en el cuerpo de /usuarios aunque no
+    en la galería); es el ETag de /usuarios.
+    """
+    personas = sorted(lista_personas, key=lambda persona: (persona['tipo'], persona['id']))
+    contenido = json.dumps(personas, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+def roster_residente(id_horario, lista_personas):
+    """
+    True si la galería tiene el roster del horario vigente y preparado con las fotos (URLs) actuales.
+    Una foto que no se pudo descargar o sin rostro detectable cuenta como resuelta hasta que cambie su URL.
+    """
+    return galeria.roster_vigente(f"horario_{id_horario}", personas_con_foto(lista_personas))
+
+# Un lock por horario: si el kiosco pide /usuarios mientras la precarga prepara ese mismo horario, espera a que
+# termine en lugar de descargar y embeber lo mismo otra vez
+locks_horarios = {}
+lock_locks_horarios = threading.Lock()
+
+def preparar_galeria_horario(id_horario, usuarios_list=None):
+    """
+    Deja en la galería el roster del horario (roster "horario_<id>"): lee los embeddings guardados, descarga
+    (o revalida) solo las fotos que faltan, embebe las nuevas y publica la nueva generación.
+    Devuelve True si hubo que cargar el roster y False si ya estaba residente.
+    """
+    id_horario = str(id_horario)
+    with lock_locks_horarios:
+        lock_horario = locks_horarios.setdefault(id_horario, threading.Lock())
+    with lock_horario:
+        if usuarios_list is None:
+            usuarios_list = roster_horario(id_horario)
+        if roster_residente(id_horario, usuarios_list):
+            return False
+
+        cache_candidatos.pop(id_horario, None) # El roster pudo cambiar: recalcular candidatos del horario
+
+        # Los embeddings se leen de la base de datos; solo se descargan las fotos sin embedding guardado
+        # cuya URL además cambió respecto a la galería. Se descargan en una carpeta aparte para no tocar
+        # los archivos en uso mientras se construye la nueva generación.
+        guardados = cargar_embeddings_guardados(usuarios_list)
+        indice = obtener_indice_galeria()
+        por_descargar = [
+            persona for persona in usuarios_list
+            if guardados.get(clave_persona(persona), (None,))[0] != persona['url_img']
+            and indice.fuente(clave_persona(persona)) != persona['url_img']
+        ]
+        carpeta_descargas = tempfile.mkdtemp(prefix=".descargas_", dir=RUTA_CARPETA_IMAGENES)
+        try:
+            descargar_imagenes_concurrente(por_descargar, carpeta_descargas)  # Descarga las imágenes
+            # Solo se embeben las fotos nuevas o modificadas; la nueva generación se publica de forma atómica
+            entradas = entradas_desde_roster(usuarios_list, indice, carpeta_descargas, guardados)
+            nuevo_indice = actualizar_indice_galeria(f"horario_{id_horario}", entradas, personas_con_foto(usuarios_list))
+            publicar_imagenes(carpeta_descargas)
+        finally:
+            shutil.rmtree(carpeta_descargas, ignore_errors=True)
+        guardar_embeddings_nuevos(usuarios_list, nuevo_indice, guardados)
+        return True
+
+DIAS_SEMANA = ('lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo') # Los de Horario.dia_semana
+
+def horarios_proximos(minutos):
+    """Ids de los horarios de todos los salones que empiezan hoy dentro de los próximos minutos (sin cruzar la medianoche)."""
+    ahora = datetime.now()
+    limite = min(ahora + timedelta(minutes=minutos), datetime.combine(ahora.date(), datetime.max.time()))
+    filas = (db.session.query(Horario.id)
+             .join(Salon, Horario.id_salon == Salon.id)
+             .filter(Horario.dia_semana == DIAS_SEMANA[ahora.weekday()],
+                     Horario.hora_inicio >= ahora.time(), Horario.hora_inicio <= limite.time())
+             .order_by(Horario.hora_inicio)
+             .all())
+    return [str(id_horario) for (id_horario,) in filas]
+
+def reconocimiento_ocupado():
+    en_curso = metrica_en_curso.valor('/ia') + metrica_en_curso.valor('/ia/batch')
+    return en_curso > PRECARGA_MAX_IA_EN_CURSO
+
+def precargar_horario(id_horario):
+    with app.app_context():
+        cargado = preparar_galeria_horario(id_horario)
+    if cargado:
+        app.logger.info(f"Galería del horario {id_horario} precargada.")
+    return cargado
+
+def horarios_proximos_precarga():
+    with app.app_context():
+        return horarios_proximos(PRECARGA_ANTICIPACION_MIN)
+
+precarga_horarios = PrecargaHorarios(
+    horarios_proximos_precarga, precargar_horario, ocupado=reconocimiento_ocupado, intervalo_s=PRECARGA_INTERVALO_S,
+    max_concurrentes=PRECARGA_CONCURRENCIA,
+    ruta_bloqueo=os.path.join(RUTA_GALERIA_COMPARTIDA, ".precarga.lock") if RUTA_GALERIA_COMPARTIDA else None)
+
+def modelo_embedding(tipo):
+    """Tabla de embeddings y columna con el id de la persona según el tipo (0 alumno, 1 profesor)."""
+    if int(tipo) == 0:
+        return EmbeddingAlumno, EmbeddingAlumno.id_alumno
+    return EmbeddingProfesor, EmbeddingProfesor.id_profesor
+
+def cargar_embeddings_guardados(lista_personas):
+    """
+    Lee de la base de datos, en una consulta por tipo de persona, los embeddings guardados del roster
+    para el modelo y la versión actuales. Devuelve {clave: (url_img, embedding)}.
+    """
+    guardados = {}
+    for tipo in (0, 1):
+        ids = [persona['id'] for persona in lista_personas if persona['tipo'] == tipo]
+        if not ids:
+            continue
+        tabla, columna_id = modelo_embedding(tipo)
+        filas = db.session.query(columna_id, tabla.url_img, tabla.formato, tabla.vector).filter(
+            columna_id.in_(ids),
+            tabla.modelo == MODEL_NAME,
+            tabla.version == VERSION_EMBEDDINGS
+        ).all()
+        for id_persona, url_img, formato, vector in filas:
+            guardados[clave_persona({"id": id_persona, "tipo": tipo})] = (url_img, deserializar_embedding(vector, formato))
+    return guardados
+
+def guardar_embedding(tipo, id_persona, url_img, embedding):
+    """Crea o reemplaza (sin hacer commit) el embedding de una persona para el modelo actual."""
+    tabla, columna_id = modelo_embedding(tipo)
+    db.session.merge(tabla(**{
+        columna_id.key: id_persona,
+        "modelo": MODEL_NAME,
+        "version": VERSION_EMBEDDINGS,
+        "url_img": url_img,
+        "formato": FORMATO_EMBEDDINGS,
+        "dimension": len(embedding),
+        "vector": serializar_embedding(embedding, FORMATO_EMBEDDINGS),
+        "fecha": datetime.now()
+    }))
+
+def guardar_embeddings_nuevos(lista_personas, indice, guardados):
+    """
+    Guarda en la base de datos los embeddings que se calcularon a partir de fotos descargadas
+    (personas sin embedding guardado para su URL actual), para no volver a calcularlos.
+    """
+    nuevos = 0
+    for persona in lista_personas:
+        clave = clave_persona(persona)
+        guardado = guardados.get(clave)
+        if not persona.get('url_img') or (guardado is not None and guardado[0] == persona['url_img']):
+            continue
+        posicion = indice.posicion_de(clave)
+        if posicion is None or indice.fuentes[posicion] != persona['url_img']:
+            continue
+        guardar_embedding(persona['tipo'], persona['id'], persona['url_img'], indice.embeddings[posicion])
+        nuevos += 1
+    if nuevos:
+        db.session.commit()
+        app.logger.info(f"{nuevos} embeddings guardados en la base de datos")
+
+# Si existen los índices únicos de asistencia (lo comprueba actualizar_esquema al arrancar)
+estado_esquema = {"asistencia_idempotente": False}
+
+def actualizar_esquema():
+    """
+    Crea las tablas de embeddings si todavía no existen en la base de datos. Las columnas e índices nuevos de
+    tablas existentes no se tocan aquí (los agregan los scripts migrar_*.py): solo se avisa si faltan.
+    """
+    with app.app_context():
+        for tabla in (EmbeddingAlumno, EmbeddingProfesor):
+            tabla.__table__.create(bind=db.engine, checkfirst=True)
+        if falta_columna_cantidad(db.engine):
+            app.logger.warning("Falta la columna desconocido.cantidad: /desconocido y /reporte fallarán. "
+                               "Ejecutar: python migrar_desconocido.py --aplicar")
+        # Los índices únicos de /asistencia no se crean aquí: hay que borrar antes los duplicados (migrar_asistencia.py)
+        faltantes = indices_faltantes(db.engine)
+        estado_esquema["asistencia_idempotente"] = not faltantes
+        if faltantes:
+            app.logger.warning(f"Faltan los índices {', '.join(faltantes)}: /asistencia inserta sin ON CONFLICT y un "
+                               f"reintento del kiosco duplica filas. Ejecutar: python migrar_asistencia.py --aplicar")
+
+# Candidatos por horario: id_horario -> (instante, claves "persona_{id}_tipo_{tipo}")
+cache_candidatos = {}
+
+def claves_candidatas_horario(id_horario):
+    """
+    Claves de la galería que pueden aparecer en el horario: sus alumnos matriculados y su profesor.
+    Devuelve None si el horario no existe. El resultado se reutiliza durante TTL_CANDIDATOS_S segundos.
+    """
+    id_horario = str(id_horario)
+    ahora = time.monotonic()
+    en_cache = cache_candidatos.get(id_horario)
+    if en_cache and ahora - en_cache[0] < TTL_CANDIDATOS_S:
+        return en_cache[1]
+
+    horario = Horario.query.filter_by(id=id_horario).first()
+    if not horario:
+        return None
+    matriculas = db.session.query(Matricula.id_alumno).filter(Matricula.id_horario == id_horario).all()
+    claves = {clave_persona({"id": id_alumno, "tipo": 0}) for (id_alumno,) in matriculas}
+    if horario.id_profesor is not None:
+        claves.add(clave_persona({"id": horario.id_profesor, "tipo": 1}))
+
+    cache_candidatos[id_horario] = (ahora, claves)
+    return claves
+
+def actualizar_indice_galeria(nombre_roster="carpeta", entradas=None, personas=None):
+    """
+    Reemplaza las entradas de un roster (por defecto, las imágenes de RUTA_CARPETA_IMAGENES) y publica
+    una nueva generación de la galería. Solo se embeben las fotos nuevas o modificadas; las personas que
+    ya no están en el roster (ni en otro roster vigente) se quitan. Las búsquedas no esperan a este proceso.
+    personas ({clave: url_img}) son todas las personas pedidas para el roster (ver GaleriaVersionada.actualizar_roster).
+    """
+    if entradas is None:
+        entradas = entradas_desde_carpeta(RUTA_CARPETA_IMAGENES, parse_identity_filename)
+    nuevo_indice, resumen = galeria.actualizar_roster(nombre_roster, entradas, representar_imagen, personas)
+    errores = resumen.pop("errores", [])
+    for error in errores:
+        app.logger.warning(f"Galería ({nombre_roster}): {error['clave']} omitida ({error['ruta']}): {error['error']}")
+    app.logger.info(f"Galería generación {galeria.generacion} publicada ({nombre_roster}) con {len(nuevo_indice)} identidades: {resumen}")
+    return nuevo_indice
+
+# Estado de la fase de arranque, consultado por /ready
+estado_arranque = {"listo": False, "error": None, "tiempos_carga_s": {}}
+
+def iniciar_modelos():
+    """
+    Fase de arranque: construye el detector, el anti-spoofing y el modelo de reconocimiento, los calienta
+    con una inferencia de prueba (también en el pool de procesos, si está habilitado) y carga la galería
+    que haya en disco. Al terminar, /ready empieza a responder 200.
+    """
+    try:
+        app.logger.info("Precargando modelos...")
+        tiempos = motor.precargar()
+
+        pool = obtener_pool_inferencia()
+        if pool is not None:
+            t0 = time.perf_counter()
+            pool.calentar()
+            tiempos["pool_inferencia"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        obtener_indice_galeria()
+        tiempos["galeria"] = time.perf_counter() - t0
+
+        estado_arranque["tiempos_carga_s"] = {paso: round(segundos, 3) for paso, segundos in tiempos.items()}
+        estado_arranque["listo"] = True
+        app.logger.info(f"Modelos listos: {estado_arranque['tiempos_carga_s']}")
+    except Exception as e:
+        estado_arranque["error"] = str(e)
+        app.logger.error(f"Error precargando los modelos: {e}", exc_info=True)
+
+def obtener_indice_galeria():
+    """
+    Devuelve la generación publicada de la galería. Si todavía no se construyó (por ejemplo, tras reiniciar
+    el backend con imágenes ya descargadas) la construye una vez a partir de la carpeta.
+    """
+    if not galeria.construida:
+        return actualizar_indice_galeria()
+    return galeria.actual()
+
+# Horario semanal por salón: etiqueta -> (instante, versión, horarios). La versión sube con cada cambio
+# de Horario, Curso o Salon hecho por este proceso, lo que invalida todas las entradas construidas antes.
+cache_horarios_salon = {}
+estado_horarios = {"version": 0}
+
+def invalidar_horarios_salon(mapper, connection, objetivo):
+    estado_horarios["version"] += 1
+
+for modelo in (Horario, Curso, Salon):
+    for evento in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(modelo, evento, invalidar_horarios_salon)
+
+def horarios_salon(etiqueta):
+    """
+    Horarios de la semana del salón (con el nombre del curso) en una sola consulta.
+    Devuelve None si el salón no existe y una lista vacía si no tiene horarios.
+    El resultado se reutiliza hasta que cambie un Horario, Curso o Salon, o durante TTL_HORARIOS_SALON_S segundos.
+    """
+    ahora = time.monotonic()
+    version = estado_horarios["version"] # Leída antes de consultar: un cambio durante la consulta invalida el resultado
+    en_cache = cache_horarios_salon.get(etiqueta)
+    if en_cache and en_cache[1] == version and ahora - en_cache[0] < TTL_HORARIOS_SALON_S:
+        return en_cache[2]
+
+    filas = (db.session.query(Salon.id, Horario.id, Horario.dia_semana, Horario.hora_inicio, Horario.hora_fin,
+                              Horario.id_curso, Curso.nombre)
+             .select_from(Salon)
+             .outerjoin(Horario, Horario.id_salon == Salon.id)
+             .outerjoin(Curso, Curso.id == Horario.id_curso)
+             .filter(Salon.etiqueta == etiqueta)
+             .order_by(Salon.id, Horario.id)
+             .all())
+    if not filas:
+        return None
+
+    id_salon = filas[0][0] # Como la consulta anterior con .first(), si la etiqueta se repite se usa un solo salón
+    horarios = [{
+        "id": id_horario,
+        "dia_semana": dia,
+        "hora_inicio": hora_inicio.strftime("%H:%M"),
+        "hora_fin": hora_fin.strftime("%H:%M"),
+        "curso": nombre_curso,
+        "id_curso": id_curso
+    } for salon, id_horario, dia, hora_inicio, hora_fin, id_curso, nombre_curso in filas
+        if salon == id_salon and id_horario is not None]
+
+    cache_horarios_salon[etiqueta] = (ahora, version, horarios)
+    return horarios
+
 # sirve para consultar si el salon existe para guardar la configuracion y para consultar el horario de acuerdo al salon y devolver todos los horarios para verificar que curso se encuentra dando en este momento, esto se llama luego de que se haya guardado la configuracion y al iniciar el reconocimiento
 @app.route('/salon', methods=['POST'])
 def obtener_salones():
@@ -107,26 +678,20 @@ def obtener_salones():
         return jsonify({"message": "El campo 'salon' es requerido."}), 400
 
     salon_etiqueta = data['salon']
+    dia_semana = data.get('dia_semana') # Opcional: solo los horarios de ese día
+    if dia_semana is not None and dia_semana not in DIAS_SEMANA:
+        # Un kiosco que no reconoce el día (por ejemplo, con otro idioma del sistema) recibe la semana completa
+        app.logger.warning(f"dia_semana no reconocido en /salon: {dia_semana!r}; se devuelve la semana completa")
+        dia_semana = None
 
-    salon = Salon.query.filter_by(etiqueta=salon_etiqueta).first()
+    horarios = horarios_salon(salon_etiqueta)
 
-    if salon:
-        salon_db = Salon.query.filter_by(id=salon.id).first()
-        horarios = salon_db.horarios
+    if horarios is not None:
         if not horarios:
             return jsonify({"message": "No hay horarios registrados para este salon."}), 404
 
-        horarios_list = []
-
-        for horario in horarios:
-            horarios_list.append({
-                "id": horario.id,
-                "dia_semana": horario.dia_semana,
-                "hora_inicio": horario.hora_inicio.strftime("%H:%M"),
-                "hora_fin": horario.hora_fin.strftime("%H:%M"),
-                "curso": horario.curso.nombre,
-                "id_curso": horario.id_curso
-            })
+        # Con dia_semana, un día sin clases devuelve una lista vacía: el salón existe y tiene horarios otros días
+        horarios_list = [horario for horario in horarios if dia_semana is None or horario["dia_semana"] == dia_semana]
 
         return jsonify({
             "mensaje": "Horarios encontrados.",
@@ -155,32 +720,12 @@ async def registrar_asistencia(id_horario):
     if not horario:
         return jsonify({"message": "Horario no encontrado."}), 404
 
-    new_asistencias_alumnos = []
-    new_asistencias_profesores = []
-    # si es alumno 0 y si es profesor 1
-    for item in data:
-        fecha = datetime.now().strftime('%Y-%m-%d')
-        if item['rol'] == 0:
-            new_asistencias_alumnos.append(AsistenciaAlumno(
-                id_horario=id_horario,
-                id_alumno=item['id'],
-                fecha=fecha,
-                estado=item['estado'],
-                tiempo_permanencia=str(item["tiempo"])
-            ))
-        elif item['rol'] == 1:
-            new_asistencias_profesores.append(AsistenciaProfesor(
-                id_horario=id_horario,
-                id_profesor=item['id'],
-                fecha=fecha,
-                estado=item['estado'],
-                tiempo_permanencia=str(item["tiempo"])
-            ))
+    fecha = datetime.now().date() # La misma fecha para todo el grupo
     try:
-        db.session.add_all(new_asistencias_alumnos)
-        db.session.add_all(new_asistencias_profesores)
+        # si es alumno 0 y si es profesor 1. Reenviar el mismo grupo actualiza las filas en lugar de duplicarlas
+        escritas = guardar_asistencias(db.session, horario.id, data, fecha, estado_esquema["asistencia_idempotente"])
         db.session.commit()
-        return jsonify({'message': f'{len(new_asistencias_alumnos)} y {len(new_asistencias_profesores)} asistencias agregadas en grupo exitosamente'}), 201
+        return jsonify({'message': f'{escritas[0]} y {escritas[1]} asistencias agregadas en grupo exitosamente'}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Error al insertar el grupo de asistencias: {str(e)}'}), 500
@@ -198,12 +743,17 @@ async def registrar_desconocido(id_horario):
         return jsonify({"message": "Horario no encontrado."}), 404
 
     new_desconocidos = []
+    # Opcional: cantidad de frames agrupados en cada imagen, en el mismo orden que url_img
+    cantidades = data.get("cantidades") or [1] * len(data["url_img"])
+    if len(cantidades) != len(data["url_img"]):
+        return jsonify({"message": "cantidades debe tener un valor por cada url_img."}), 400
 
-    for url in data["url_img"]:
+    for url, cantidad in zip(data["url_img"], cantidades):
         new_desconocidos.append(Desconocido(
             id_horario=id_horario,
             url_img=url,
             fecha=datetime.now().strftime("%Y-%m-%d"),
+            cantidad=cantidad,
             )
         )
 
@@ -254,8 +804,8 @@ async def enviar_reporte(salon, id_horario):
             print(f"No se encontró un correo de docente para el horario {id_horario}")
 
         # --- Creación del Excel (sin cambios) ---
-        df_desconocidos = pd.DataFrame([(d.id_horario, d.url_img, d.fecha.strftime('%Y-%m-%d')) for d in desconocidos],
-                                       columns=['Seccion', 'Imagen', 'Fecha de Detección'])
+        df_desconocidos = pd.DataFrame([(d.id_horario, d.url_img, d.fecha.strftime('%Y-%m-%d'), d.cantidad or 1) for d in desconocidos],
+                                       columns=['Seccion', 'Imagen', 'Fecha de Detección', 'Frames'])
         df_alumnos = pd.DataFrame([(a.id, a.id_horario, a.id_alumno, a.estado, a.fecha.strftime('%Y-%m-%d'), a.tiempo_permanencia) for a in alumnos],
                                   columns=['ID', 'Seccion', 'Código', 'Estado', 'Fecha de Detección', 'Tiempo Asistencia (min)'])
         df_docentes = pd.DataFrame([(d.id, d.id_horario, d.id_profesor, d.estado, d.fecha.strftime('%Y-%m-%d'), d.tiempo_permanencia) for d in profesores],
@@ -409,224 +959,454 @@ async def enviar_mensaje(id_horario):
     return jsonify({'mensaje': 'No hay alumnos ausentes para notificar.'}), 200
 
 
-@app.route('/ia', methods=['POST'])
-async def ia_recognize_face(): # id_horario no se usa en el nuevo flujo, pero lo mantengo si lo necesitas para otra cosa
-    if 'image_file' not in request.files:
-        return jsonify({"error": "No image file provided"}), 400
-
-    image_file = request.files['image_file']
-    if image_file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
-
-    fd, captured_face_path = tempfile.mkstemp(suffix=".jpg")
-    os.close(fd)
-
-    best_match_response = {
+def respuesta_ia_inicial():
+    return {
         "id": "unknown",
         "rol": "NA",
         "clasificado": False,
         "distance": float('inf') # Inicializar con infinito para la distancia
     }
 
+
+def analizar_frame_local(datos_imagen, tiempos):
+    """
+    Decodifica el frame en memoria (sin archivos temporales) y ejecuta detección + anti-spoofing
+    en el proceso actual. Devuelve el dict de MotorReconocimiento.analizar_imagen.
+    """
+    t0 = time.perf_counter()
+    captured_face = decodificar_imagen(datos_imagen)
+    tiempos["carga"] = time.perf_counter() - t0
+    if captured_face is None:
+        return {"estado": ESTADO_IMAGEN_INVALIDA}
+
+    app.logger.info("Iniciando prueba anti-spoofing...")
+    # La cara detectada y alineada aquí es la misma que luego se pasa al modelo de embeddings.
+    t0 = time.perf_counter()
+    resultado = motor.analizar_imagen(captured_face)
+    tiempos["deteccion_anti_spoofing"] = time.perf_counter() - t0
+    return resultado
+
+def obtener_pool_inferencia():
+    """Crea el pool de procesos la primera vez que se usa (None si TRABAJADORES_IA es 0)."""
+    global pool_inferencia
+    if TRABAJADORES_IA > 0 and pool_inferencia is None:
+        with lock_pool_inferencia:
+            if pool_inferencia is None:
+                pool_inferencia = PoolInferencia(TRABAJADORES_IA, MAX_COLA_IA, MODEL_NAME, DETECTOR_BACKEND, motor.ruta_onnx)
+                app.logger.info(f"Pool de inferencia iniciado con {TRABAJADORES_IA} procesos y cola de {MAX_COLA_IA}.")
+    return pool_inferencia
+
+def esperar_resultado_pool(future, tiempos):
+    """
+    Espera el resultado de un trabajo del pool y agrega sus tiempos por etapa.
+    Lanza TimeoutInferencia si no termina dentro de TIMEOUT_INFERENCIA segundos.
+    """
     try:
-        image_file.save(captured_face_path)
-        app.logger.info(f"Imagen capturada guardada temporalmente en: {captured_face_path}")
+        resultado = future.result(timeout=TIMEOUT_INFERENCIA)
+    except TimeoutInferencia:
+        future.cancel()
+        raise
+    tiempos.update(resultado.pop("tiempos", {}))
+    return resultado
+
+def analizar_frame(datos_imagen, tiempos):
+    """
+    Detección + anti-spoofing de un frame: en el pool de procesos si está habilitado (que además
+    devuelve el "embedding") o en el proceso actual (que devuelve la "cara" para el micro-batching).
+    Lanza ColaLlena si la cola del pool está llena.
+    """
+    pool = obtener_pool_inferencia()
+    if pool is None:
+        return analizar_frame_local(datos_imagen, tiempos)
+    t0 = time.perf_counter()
+    future = pool.enviar(datos_imagen)
+    resultado = esperar_resultado_pool(future, tiempos)
+    tiempos["pool"] = time.perf_counter() - t0
+    return resultado
+
+def respuesta_sobrecarga(reintentar_en):
+    """Respuesta rápida cuando no hay capacidad de inferencia: 503 con Retry-After."""
+    app.logger.warning(f"Inferencia saturada: se rechaza la petición (Retry-After={reintentar_en}s).")
+    respuesta = jsonify({
+        "error": "El servidor está ocupado, vuelve a intentar en unos segundos.",
+        "clasificado": False,
+        "retry_after": reintentar_en
+    })
+    respuesta.headers["Retry-After"] = str(reintentar_en)
+    return respuesta, 503
+
+def aplicar_anti_spoofing(resultado, best_match_response):
+    """
+    1. Traduce el resultado de la detección + anti-spoofing a la respuesta de /ia.
+    Devuelve el código HTTP si la respuesta debe devolverse ya, o None para continuar
+    (con la búsqueda solo si el estado es ESTADO_REAL; si no, se guarda como desconocido).
+    """
+    estado = resultado["estado"]
+
+    if estado == ESTADO_SIN_CARA: # No se detectaron caras
+        app.logger.warning("Anti-spoofing: No se detectaron caras en la imagen.")
+        # Si no hay caras, no podemos clasificar, pero no necesariamente es un error de spoofing
+        # Podríamos considerarlo "unknown" o un error específico.
+        # Por ahora, lo tratamos como "unknown" y se guardará en desconocidos.
+        best_match_response["message"] = "No se detectó ninguna cara real."
+        return None
+
+    elif estado == ESTADO_SPOOF:
+        app.logger.warning("Anti-spoofing: Se detectó una posible imagen falsa (spoof).")
+        best_match_response["message"] = "La imagen parece ser un intento de spoofing (falsa)."
+        # Para un intento de spoof, no procedemos a la búsqueda
+        return 200 # O un 403 Forbidden si es más apropiado
+
+    elif estado == ESTADO_NO_DETECTADO:
+        detalle = resultado.get("detalle", "")
+        if "Face could not be detected" in detalle:
+            app.logger.warning(f"Anti-spoofing: No se pudo detectar cara en la imagen: {detalle}")
+        else:
+            app.logger.error(f"Anti-spoofing: ValueError durante extract_faces: {detalle}")
+        # No se procede con la búsqueda si no hay cara
+        best_match_response["message"] = "No se pudo detectar el rostro correctamente"
+        return 400 # O un 403 Forbidden si es más apropiado
+
+    elif estado == ESTADO_ERROR:
+        app.logger.error(f"Error inesperado durante anti-spoofing: {resultado.get('detalle')}")
+        best_match_response["message"] = "No se pudo detectar el rostro correctamente"
+        # No se procede con la búsqueda y se guarda en desconocidos.
+        return None
+
+    app.logger.info("Anti-spoofing: La imagen parece ser real.")
+    best_match_response["message"] = "La imagen parece ser real."
+    return None
+
+def clasificar_coincidencia(best_match_response, indice, posicion, distance, tiempos=None):
+    """
+    2. Interpreta el resultado de la búsqueda en la galería (posición y distancia del mejor candidato)
+    y completa la respuesta de /ia. Si se pasa tiempos, suma ahí el tiempo de la consulta del profesor.
+    """
+    # Igual que DeepFace.find: los candidatos por encima del umbral de búsqueda no cuentan como coincidencia
+    if posicion is None or distance > UMBRAL_BUSQUEDA:
+        app.logger.info("No se encontraron coincidencias en la base de datos de caras conocidas.")
+        best_match_response["message"] = "No se encontro al usuario (posible desconocido)."
+        return
+
+    user_id, user_rol = indice.identidad(posicion)
+    identity_path = f"{user_rol} {user_id}"
+
+    app.logger.info(f"Mejor candidato encontrado: {identity_path} con distancia: {distance:.4f}")
+
+    if distance < DISTANCE_THRESHOLD:
+        best_match_response["id"] = user_id
+        best_match_response["rol"] = user_rol
+        best_match_response["clasificado"] = True
+        best_match_response["distance"] = round(float(distance), 4)
+        best_match_response["message"] = "Se identificó correctamente al usuario."
+        app.logger.info(f"✅ Persona clasificada: ID={user_id}, Rol={user_rol}, Distancia={distance:.4f}")
+
+        # ✅ Solo si es profesor, buscar datos adicionales
+        if user_rol == 'profesor':
+            t0 = time.perf_counter()
+            try:
+                profesor = db.session.query(Profesor, Horario, Curso).join(Horario, Profesor.id == Horario.id_profesor).join(Curso, Horario.id_curso == Curso.id).filter(Profesor.id == int(user_id)).first()
+                if profesor:
+                    p, h, c = profesor
+                    best_match_response["correo"] = p.codigo
+                    best_match_response["contrasena"] = p.contrasena
+                    app.logger.info(f"📤 Datos del profesor añadidos: correo={p.correo}, curso={c.nombre}")
+                else:
+                    app.logger.warning(f"⚠️ No se encontraron datos del profesor con ID {user_id} en la base de datos.")
+            except Exception as db_error:
+                app.logger.error(f"❌ Error consultando datos del profesor en la BD: {db_error}", exc_info=True)
+            if tiempos is not None:
+                tiempos["bd_profesor"] = tiempos.get("bd_profesor", 0.0) + time.perf_counter() - t0
+
+        best_match_response["message"] = "Se identifico correctamente al usuario."
+    else:
+        best_match_response["clasificado"] = True
+        app.logger.info(f"❌ Coincidencia encontrada ({identity_path}) pero la distancia ({distance:.4f}) supera el umbral ({DISTANCE_THRESHOLD}).")
+        best_match_response["message"] = "Vuelve a intentar, por favor."
+        best_match_response["distance"] = round(float(distance), 4)
 
-        # 1. Anti-spoofing test
+def finalizar_respuesta_ia(best_match_response, datos_imagen, resultado=None):
+    """
+    3. Guarda el frame como desconocido si no se clasificó y limpia la respuesta.
+    resultado es el de la detección (con "embedding" y "calidad" si hubo cara), para agrupar al desconocido.
+    """
+    if not best_match_response["clasificado"]:
         try:
-            app.logger.info("Iniciando prueba anti-spoofing...")
-            # Nota: extract_faces puede encontrar múltiples caras.
-            # Aquí asumimos que la imagen capturada debería tener predominantemente una cara real.
-            face_objs = DeepFace.extract_faces(
-                img_path=captured_face_path,
-                detector_backend=DETECTOR_BACKEND,
-                enforce_detection=True, # Asegura que se detecte al menos una cara
-                anti_spoofing=True,
-                align=True
-            )
+            destination_path, cantidad = guardar_desconocido(datos_imagen, resultado)
+            app.logger.info(f"Imagen no clasificada guardada en: {destination_path} ({cantidad} frames)")
+            if "message" not in best_match_response: # Si no hay un mensaje más específico
+                best_match_response["message"] = "Es un desconocido, imagen guardada."
+            best_match_response["saved_unknown_path"] = destination_path # Opcional: informar dónde se guardó
+            best_match_response["unknown_count"] = cantidad
+        except Exception as e_save:
+            app.logger.error(f"Error guardando imagen desconocida: {e_save}", exc_info=True)
+
+    # Si hay un mensaje pero no distancia (porque no se llegó a la búsqueda), quitar la distancia infinita
+    if best_match_response["distance"] == float('inf') and "message" in best_match_response:
+         del best_match_response["distance"]
+    return best_match_response
 
-            if not face_objs: # No se detectaron caras
-                app.logger.warning("Anti-spoofing: No se detectaron caras en la imagen.")
-                # Si no hay caras, no podemos clasificar, pero no necesariamente es un error de spoofing
-                # Podríamos considerarlo "unknown" o un error específico.
-                # Por ahora, lo tratamos como "unknown" y se guardará en desconocidos.
-                best_match_response["message"] = "No se detectó ninguna cara real."
-
-            elif not all(face_obj.get("is_real", False) for face_obj in face_objs):
-                app.logger.warning("Anti-spoofing: Se detectó una posible imagen falsa (spoof).")
-                best_match_response["message"] = "La imagen parece ser un intento de spoofing (falsa)."
-                # Para un intento de spoof, no procedemos a DeepFace.find
-                return jsonify(best_match_response), 200 # O un 403 Forbidden si es más apropiado
-            else:
-                app.logger.info("Anti-spoofing: La imagen parece ser real.")
-                best_match_response["message"] = "La imagen parece ser real."
-
-        except ValueError as ve: # DeepFace puede lanzar ValueError si no detecta cara
-            if "Face could not be detected" in str(ve):
-                app.logger.warning(f"Anti-spoofing: No se pudo detectar cara en la imagen: {ve}")
-                best_match_response["message"] = "No se pudo detectar el rostro correctamente"
-                # No se procede con find si no hay cara
-            else:
-                app.logger.error(f"Anti-spoofing: ValueError durante extract_faces: {ve}")
-                best_match_response["message"] = "No se pudo detectar el rostro correctamente"
 
+@app.route('/ia', methods=['POST'])
+async def ia_recognize_face(): # id_horario no se usa en el nuevo flujo, pero lo mantengo si lo necesitas para otra cosa
+    if 'image_file' not in request.files:
+        return jsonify({"error": "No image file provided"}), 400
 
-            best_match_response["message"] = "No se pudo detectar el rostro correctamente"
-            return jsonify(best_match_response), 400 # O un 403 Forbidden si es más apropiado
+    image_file = request.files['image_file']
+    if image_file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
 
-        except Exception as e:
-            app.logger.error(f"Error inesperado durante anti-spoofing: {e}", exc_info=True)
-            best_match_response["message"] = "No se pudo detectar el rostro correctamente"
-            # No se procede con find y se guarda en desconocidos.
+    inicio = time.perf_counter()
+    # Hasta aquí Flask recibió y separó el formulario con la imagen
+    tiempos = {"subida": inicio - g.inicio_peticion}
+    g.tiempos_ia = tiempos # Se registran en las métricas al terminar la petición
 
-        # Solo proceder a DeepFace.find si el anti-spoofing fue exitoso (o no concluyente pero sin error grave)
-        # y si no hay un mensaje de error previo que indique no continuar.
-        if "message" not in best_match_response or "La imagen parece ser real." in best_match_response.get("message", ""):
-            # 2. Usar DeepFace.find para encontrar coincidencias
-            app.logger.info(f"Buscando coincidencias en: {RUTA_CARPETA_IMAGENES}")
-            if not os.path.exists(RUTA_CARPETA_IMAGENES) or not os.listdir(RUTA_CARPETA_IMAGENES):
+    best_match_response = respuesta_ia_inicial()
+
+    try:
+        # Si se indica el horario, la búsqueda se limita a sus alumnos matriculados y su profesor
+        id_horario = request.form.get('id_horario') or request.args.get('id_horario')
+        claves_candidatas = None
+        if id_horario:
+            t0 = time.perf_counter()
+            claves_candidatas = claves_candidatas_horario(id_horario)
+            tiempos["candidatos"] = time.perf_counter() - t0
+            if claves_candidatas is None:
+                return jsonify({"message": "Horario no encontrado."}), 404
+
+        datos_imagen = image_file.read()
+
+        # 1. Anti-spoofing test (en el pool de procesos o en el proceso actual)
+        try:
+            resultado = analizar_frame(datos_imagen, tiempos)
+        except ColaLlena as cl:
+            return respuesta_sobrecarga(cl.reintentar_en)
+        except TimeoutInferencia:
+            return respuesta_sobrecarga(obtener_pool_inferencia().estimar_reintento())
+
+        if resultado["estado"] == ESTADO_IMAGEN_INVALIDA:
+            contar_resultado_ia(ESTADO_IMAGEN_INVALIDA, {})
+            return jsonify({"error": "Invalid image file"}), 400
+
+        codigo = aplicar_anti_spoofing(resultado, best_match_response)
+        if codigo is not None:
+            contar_resultado_ia(resultado["estado"], best_match_response)
+            return jsonify(adjuntar_tiempos(best_match_response, tiempos, inicio)), codigo
+
+        huella, generacion = None, galeria.generacion
+        # Solo proceder a la búsqueda si el anti-spoofing fue exitoso
+        if resultado["estado"] == ESTADO_REAL:
+            # Si la misma cara ya se identificó hace un momento en este horario, se devuelve ese resultado
+            # (la detección y el anti-spoofing ya se ejecutaron; solo se evitan el embedding y la búsqueda)
+            if id_horario and TTL_CACHE_RESULTADOS_S > 0:
+                t0 = time.perf_counter()
+                huella = resultado["huella"] if "huella" in resultado else huella_cara(resultado.get("cara"))
+                en_cache = cache_resultados.buscar(id_horario, huella, generacion)
+                tiempos["cache"] = time.perf_counter() - t0
+                if en_cache is not None:
+                    en_cache["cache"] = True
+                    contar_resultado_ia(ESTADO_REAL, en_cache)
+                    return jsonify(adjuntar_tiempos(en_cache, tiempos, inicio)), 200
+
+            # 2. Buscar la cara en el índice de la galería (en memoria)
+            indice = obtener_indice_galeria()
+            app.logger.info(f"Buscando coincidencias en la galería ({len(indice)} identidades)")
+            if len(indice) == 0:
                 app.logger.warning(f"El directorio de caras conocidas '{RUTA_CARPETA_IMAGENES}' no existe o está vacío.")
                 best_match_response["message"] = "La base de datos de caras conocidas está vacía o no se encuentra."
             else:
                 try:
-                    # DeepFace.find devuelve una lista de DataFrames.
-                    # Si la imagen de entrada (captured_face_path) tiene múltiples caras,
-                    # habrá un DataFrame por cada cara detectada en la imagen de entrada.
-                    # Asumimos que nos interesa la primera (o única) cara detectada en la imagen de entrada.
-                    dfs = DeepFace.find(
-                        img_path=captured_face_path,
-                        db_path=RUTA_CARPETA_IMAGENES,
-                        model_name=MODEL_NAME,
-                        distance_metric=DISTANCE_METRIC,
-                        enforce_detection=True, # Asegura que se detecte cara en img_path
-                        detector_backend=DETECTOR_BACKEND,
-                        align=True,
-                        silent=True # Para menos output en consola de DeepFace
-                    )
-
-                    # dfs es una lista de dataframes. Usualmente, si solo hay una cara en img_path, dfs tendrá 1 elemento.
-                    if dfs and not dfs[0].empty:
-                        # Tomamos el primer DataFrame (correspondiente a la primera cara detectada en captured_face_path)
-                        # y de ese DataFrame, la primera fila (la coincidencia más cercana)
-                        best_match_candidate_df = dfs[0]
-
-                        # La columna de distancia se nombra usualmente como 'model_metric', e.g., 'VGG-Face_cosine'
-                        # o puede ser simplemente 'distance' si se usa un wrapper o una versión específica.
-                        # Intentemos obtenerla dinámicamente o usar una columna conocida.
-                        # distance_col_name = f"{MODEL_NAME}_{DISTANCE_METRIC}"
-                        distance_col_name = "distance"
-                        if distance_col_name not in best_match_candidate_df.columns:
-                             # DeepFace a veces usa solo la métrica como nombre de columna si el modelo es obvio por el contexto
-                             # o si usa un nombre genérico. Hay que revisar la salida exacta.
-                             # Si no encuentra la columna específica, intentamos con 'distance' o la primera numérica después de 'identity'
-                             # Por ahora, asumimos que la columna existe o DeepFace usa un default conocido.
-                             # Si es cosine, euclidean, euclidean_l2 y está en columnas, la tomamos.
-                            if DISTANCE_METRIC in best_match_candidate_df.columns:
-                                distance_col_name = DISTANCE_METRIC
-                            else: # Fallback a un nombre genérico si la construcción falla
-                                app.logger.warning(f"Columna de distancia '{distance_col_name}' no encontrada. Verifique las columnas: {best_match_candidate_df.columns}")
-                                # Buscamos una columna que pueda ser de distancia
-                                possible_dist_cols = [col for col in best_match_candidate_df.columns if col not in ['identity', 'target_x', 'target_y', 'target_w', 'target_h', 'source_x', 'source_y', 'source_w', 'source_h']]
-                                if possible_dist_cols:
-                                    distance_col_name = possible_dist_cols[0] # Tomar la primera como heurística
-                                    app.logger.warning(f"Usando heurística para columna de distancia: '{distance_col_name}'")
-                                else:
-                                    raise KeyError(f"No se pudo determinar la columna de distancia en el DataFrame. Cols: {best_match_candidate_df.columns}")
-
-                        # El DataFrame ya viene ordenado por distancia por DeepFace.find
-                        top_match = best_match_candidate_df.iloc[0]
-                        identity_path = top_match['identity']
-                        distance = top_match[distance_col_name]
-
-                        app.logger.info(f"Mejor candidato encontrado: {identity_path} con distancia: {distance:.4f}")
-
-                        if distance < DISTANCE_THRESHOLD:
-                            filename_only = os.path.basename(identity_path)
-                            user_id, user_rol = parse_identity_filename(filename_only)
-
-                            if user_id is not None and user_rol is not None:
-                                best_match_response["id"] = user_id
-                                best_match_response["rol"] = user_rol
-                                best_match_response["clasificado"] = True
-                                best_match_response["distance"] = round(float(distance), 4)
-                                best_match_response["message"] = "Se identificó correctamente al usuario."
-                                app.logger.info(f"✅ Persona clasificada: ID={user_id}, Rol={user_rol}, Distancia={distance:.4f}")
-
-                                # ✅ Solo si es profesor, buscar datos adicionales
-                                if user_rol == 'profesor':
-                                    try:
-                                        profesor = db.session.query(Profesor, Horario, Curso).join(Horario, Profesor.id == Horario.id_profesor).join(Curso, Horario.id_curso == Curso.id).filter(Profesor.id == int(user_id)).first()
-                                        if profesor:
-                                            p, h, c = profesor
-                                            best_match_response["correo"] = p.codigo
-                                            best_match_response["contrasena"] = p.contrasena
-                                            app.logger.info(f"📤 Datos del profesor añadidos: correo={p.correo}, curso={c.nombre}")
-                                        else:
-                                            app.logger.warning(f"⚠️ No se encontraron datos del profesor con ID {user_id} en la base de datos.")
-                                    except Exception as db_error:
-                                        app.logger.error(f"❌ Error consultando datos del profesor en la BD: {db_error}", exc_info=True)
-
-
-
-                                best_match_response["message"] = "Se identifico correctamente al usuario."
-                            else:
-                                app.logger.warning(f"Formato de nombre de archivo no reconocido para {identity_path}. No se pudo extraer ID/Rol.")
-                                best_match_response["message"] = "No se reconoce al usuario."
-                                best_match_response["distance"] = round(float(distance), 4) # Aún así informamos la distancia
-                        else:
-                            best_match_response["clasificado"] = True
-                            app.logger.info(f"❌ Coincidencia encontrada ({identity_path}) pero la distancia ({distance:.4f}) supera el umbral ({DISTANCE_THRESHOLD}).")
-                            best_match_response["message"] = "Vuelve a intentar, por favor."
-                            best_match_response["distance"] = round(float(distance), 4)
-                    else:
-                        app.logger.info("No se encontraron coincidencias en la base de datos de caras conocidas.")
-                        best_match_response["message"] = "No se encontro al usuario (posible desconocido)."
-
-                except ValueError as ve: # DeepFace.find puede lanzar ValueError si no detecta cara en img_path
-                    if "Face could not be detected" in str(ve) or "model instance" in str(ve).lower(): # A veces es "model instance is not built"
-                        app.logger.warning(f"DeepFace.find: No se pudo detectar cara en la imagen de entrada: {ve}")
-                        best_match_response["message"] = "No se encontro al usuario."
-                    else:
-                        app.logger.error(f"DeepFace.find: ValueError: {ve}", exc_info=True)
-                        best_match_response["message"] = "No se encontro al usuario."
+                    embedding = resultado.get("embedding")
+                    if embedding is None:
+                        # Se reutiliza la cara ya detectada y alineada en el anti-spoofing (sin segunda detección).
+                        # El planificador la agrupa con las de otras peticiones concurrentes en un solo lote.
+                        t0 = time.perf_counter()
+                        embedding = planificador_embeddings.procesar(resultado["cara"])
+                        resultado["embedding"] = embedding # Para agrupar al desconocido si no hay coincidencia
+                        tiempos["embedding"] = time.perf_counter() - t0
+
+                    t0 = time.perf_counter()
+                    candidatos = indice.posiciones_de(claves_candidatas) if claves_candidatas is not None else None
+                    posicion, distance = indice.buscar(embedding, candidatos)
+                    tiempos["busqueda"] = time.perf_counter() - t0
+
+                    clasificar_coincidencia(best_match_response, indice, posicion, distance, tiempos)
+
+                except ValueError as ve:
+                    app.logger.error(f"Búsqueda en galería: ValueError: {ve}", exc_info=True)
+                    best_match_response["message"] = "No se encontro al usuario."
                 except Exception as e:
-                    app.logger.error(f"Error durante DeepFace.find: {e}", exc_info=True)
+                    app.logger.error(f"Error durante la búsqueda en la galería: {e}", exc_info=True)
                     best_match_response["message"] = "No se encontro al usuario."
 
         # 3. Si no se clasificó, guardar la imagen en la carpeta de desconocidos
-        if not best_match_response["clasificado"]:
-            try:
-                os.makedirs(RUTA_DESCONOCIDOS_CLASE_ACTUAL, exist_ok=True)
-                # Usar un nombre único para la imagen guardada
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                unknown_filename = f"unknown_{timestamp}.jpg"
-                destination_path = os.path.join(RUTA_DESCONOCIDOS_CLASE_ACTUAL, unknown_filename)
-                shutil.copy(captured_face_path, destination_path)
-                app.logger.info(f"Imagen no clasificada guardada en: {destination_path}")
-                if "message" not in best_match_response: # Si no hay un mensaje más específico
-                    best_match_response["message"] = "Es un desconocido, imagen guardada."
-                best_match_response["saved_unknown_path"] = destination_path # Opcional: informar dónde se guardó
-            except Exception as e_save:
-                app.logger.error(f"Error guardando imagen desconocida: {e_save}", exc_info=True)
-
-        # Si hay un mensaje pero no distancia (porque no se llegó a find), quitar la distancia infinita
-        if best_match_response["distance"] == float('inf') and "message" in best_match_response:
-             del best_match_response["distance"]
-
-
-        return jsonify(best_match_response), 200
+        finalizar_respuesta_ia(best_match_response, datos_imagen, resultado)
+        if best_match_response["id"] != "unknown": # Solo se reutilizan las identificaciones
+            cache_resultados.guardar(id_horario, huella, best_match_response, generacion)
+
+        contar_resultado_ia(resultado["estado"], best_match_response)
+        return jsonify(adjuntar_tiempos(best_match_response, tiempos, inicio)), 200
 
     except Exception as e:
         app.logger.error(f"Error general en el endpoint /ia: {e}", exc_info=True)
         return jsonify({"error": f"Ocurrió un error interno: {str(e)}", "clasificado": False}), 500
-    finally:
-        # 4. Limpiar el archivo temporal
-        if os.path.exists(captured_face_path):
-            try:
-                os.remove(captured_face_path)
-                app.logger.info(f"Archivo temporal eliminado: {captured_face_path}")
-            except Exception as e_rm:
-                app.logger.error(f"Error eliminando archivo temporal {captured_face_path}: {e_rm}")
+
+# Reconocimiento por lotes: recibe varias imágenes ("image_files") en una sola petición.
+# La detección + anti-spoofing de cada imagen se reparte en hilos (o en el pool de procesos), los embeddings
+# de todas las caras se calculan en un solo forward del modelo y la búsqueda en la galería es una sola
+# multiplicación de matrices.
+# Cada elemento de "resultados" tiene la misma forma que la respuesta de /ia, más el "status" que /ia habría devuelto.
+@app.route('/ia/batch', methods=['POST'])
+async def ia_recognize_faces_batch():
+    image_files = [f for f in request.files.getlist('image_files') if f.filename != '']
+    if not image_files:
+        return jsonify({"error": "No image files provided"}), 400
+    if len(image_files) > MAX_IMAGENES_LOTE:
+        return jsonify({"error": f"Se permiten como máximo {MAX_IMAGENES_LOTE} imágenes por lote"}), 400
+
+    inicio = time.perf_counter()
+    tiempos = {"subida": inicio - g.inicio_peticion}
+    g.tiempos_ia = tiempos
+
+    try:
+        # Igual que en /ia: id_horario opcional para limitar la búsqueda a los candidatos del horario
+        id_horario = request.form.get('id_horario') or request.args.get('id_horario')
+        claves_candidatas = None
+        if id_horario:
+            t0 = time.perf_counter()
+            claves_candidatas = claves_candidatas_horario(id_horario)
+            tiempos["candidatos"] = time.perf_counter() - t0
+            if claves_candidatas is None:
+                return jsonify({"message": "Horario no encontrado."}), 404
+
+        datos_imagenes = [f.read() for f in image_files]
+        respuestas = [respuesta_ia_inicial() for _ in datos_imagenes]
+        codigos = [200] * len(datos_imagenes)
+        resultados = [None] * len(datos_imagenes)
+        tiempos_imagen = [{} for _ in datos_imagenes]
+
+        # 1. Detección + anti-spoofing de todas las imágenes en paralelo
+        t0 = time.perf_counter()
+        pool = obtener_pool_inferencia()
+        futures = []
+        try:
+            for i, datos in enumerate(datos_imagenes):
+                if pool is None:
+                    futures.append(executor_deteccion.submit(analizar_frame_local, datos, tiempos_imagen[i]))
+                else:
+                    futures.append(pool.enviar(datos))
+        except ColaLlena as cl:
+            for future in futures:
+                future.cancel()
+            return respuesta_sobrecarga(cl.reintentar_en)
+
+        try:
+            for i, future in enumerate(futures):
+                if pool is None:
+                    resultados[i] = future.result()
+                else:
+                    resultados[i] = esperar_resultado_pool(future, tiempos_imagen[i])
+        except TimeoutInferencia:
+            for future in futures:
+                future.cancel()
+            return respuesta_sobrecarga(pool.estimar_reintento())
+        tiempos["deteccion_anti_spoofing"] = time.perf_counter() - t0
+
+        for i, resultado in enumerate(resultados):
+            if resultado["estado"] == ESTADO_IMAGEN_INVALIDA:
+                respuestas[i] = {"error": "Invalid image file", "clasificado": False}
+                codigos[i] = 400
+            else:
+                codigo = aplicar_anti_spoofing(resultado, respuestas[i])
+                if codigo is not None:
+                    codigos[i] = codigo
+
+        # 2. Embeddings en un solo lote y búsqueda matricial contra la galería
+        pendientes = [i for i, resultado in enumerate(resultados) if resultado["estado"] == ESTADO_REAL and codigos[i] == 200]
+        if pendientes:
+            indice = obtener_indice_galeria()
+            if len(indice) == 0:
+                app.logger.warning(f"El directorio de caras conocidas '{RUTA_CARPETA_IMAGENES}' no existe o está vacío.")
+                for i in pendientes:
+                    respuestas[i]["message"] = "La base de datos de caras conocidas está vacía o no se encuentra."
+            else:
+                try:
+                    # Las caras analizadas localmente se embeben juntas; las del pool ya traen su embedding
+                    sin_embedding = [i for i in pendientes if resultados[i].get("embedding") is None]
+                    if sin_embedding:
+                        t0 = time.perf_counter()
+                        nuevos = motor.embeber_caras([resultados[i]["cara"] for i in sin_embedding])
+                        for i, embedding in zip(sin_embedding, nuevos):
+                            resultados[i]["embedding"] = embedding
+                        tiempos["embedding"] = time.perf_counter() - t0
+
+                    t0 = time.perf_counter()
+                    embeddings = np.stack([resultados[i]["embedding"] for i in pendientes])
+                    candidatos = indice.posiciones_de(claves_candidatas) if claves_candidatas is not None else None
+                    posiciones, distancias = indice.buscar_lote(embeddings, candidatos)
+                    tiempos["busqueda"] = time.perf_counter() - t0
+
+                    for i, posicion, distance in zip(pendientes, posiciones, distancias):
+                        clasificar_coincidencia(respuestas[i], indice, int(posicion), float(distance), tiempos)
+                except Exception as e:
+                    app.logger.error(f"Error durante la búsqueda en la galería (lote): {e}", exc_info=True)
+                    for i in pendientes:
+                        respuestas[i]["message"] = "No se encontro al usuario."
+
+        # 3. Guardar desconocidos (solo imágenes que /ia también habría guardado)
+        for i, respuesta in enumerate(respuestas):
+            if codigos[i] == 200:
+                finalizar_respuesta_ia(respuesta, datos_imagenes[i], resultados[i])
+            elif respuesta.get("distance") == float('inf'):
+                del respuesta["distance"]
+            respuesta["status"] = codigos[i]
+            contar_resultado_ia(resultados[i]["estado"], respuesta)
+            adjuntar_tiempos(respuesta, tiempos_imagen[i], inicio)
+
+        app.logger.info(f"Lote de {len(datos_imagenes)} imágenes procesado en {time.perf_counter() - inicio:.3f}s")
+        return jsonify(adjuntar_tiempos({"resultados": respuestas}, tiempos, inicio)), 200
+
+    except Exception as e:
+        app.logger.error(f"Error general en el endpoint /ia/batch: {e}", exc_info=True)
+        return jsonify({"error": f"Ocurrió un error interno: {str(e)}", "clasificado": False}), 500
+
+# Estado del micro-batching de /ia (profundidad de cola, tamaño de lote y espera en cola) para ajustar
+# MICROLOTE_MAX y MICROLOTE_ESPERA_MS según la latencia p99 y el throughput observados.
+# Si el pool de procesos está habilitado, también informa su ocupación y los trabajos rechazados.
+@app.route('/ia/planificador', methods=['GET'])
+def estado_planificador():
+    estado = planificador_embeddings.estadisticas()
+    if pool_inferencia is not None:
+        estado["pool"] = pool_inferencia.estadisticas()
+    return jsonify(estado), 200
+
+# Estado de la precarga de galerías de los horarios próximos
+@app.route('/precarga', methods=['GET'])
+def estado_precarga():
+    return jsonify(precarga_horarios.estadisticas()), 200
+
+# Aciertos y fallos de la caché de resultados de /ia
+@app.route('/ia/cache', methods=['GET'])
+def estado_cache_resultados():
+    return jsonify(cache_resultados.estadisticas()), 200
+
+# Métricas en formato de texto de Prometheus: latencia por ruta y por etapa del reconocimiento, peticiones
+# en curso, tamaño de la galería y resultados del reconocimiento
+@app.route('/metrics', methods=['GET'])
+def exponer_metricas():
+    return metricas.exponer(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# Readiness: 503 mientras los modelos se cargan y calientan, 200 cuando el backend puede recibir tráfico
+@app.route('/ready', methods=['GET'])
+def ready():
+    codigo = 200 if estado_arranque["listo"] else 503
+    return jsonify({
+        "listo": estado_arranque["listo"],
+        "error": estado_arranque["error"],
+        "modelo": MODEL_NAME,
+        "detector": DETECTOR_BACKEND,
+        "tiempos_carga_s": estado_arranque["tiempos_carga_s"]
+    }), codigo
 
 @app.route('/computadora-ip/<nombre>', methods=['GET'])
 def obtener_ip_por_nombre(nombre):
@@ -640,54 +1420,77 @@ def obtener_ip_por_nombre(nombre):
     except Exception as e:
         return jsonify({'mensaje': f'Error al obtener IP: {str(e)}'}), 500
 
+def registrar_informes_descarga(informes):
+    for informe in informes:
+        metrica_descargas.incrementar(informe["estado"])
+        metrica_duracion_descargas.observar(valor=informe["ms"] / 1000)
+        app.logger.debug(f"Imagen {informe['url']}: {informe['estado']}, {informe['bytes']} bytes en {informe['ms']} ms")
+        if informe["estado"] == ESTADO_FALLIDA:
+            app.logger.warning(f"No se pudo descargar la imagen {informe['url']}: {informe['error']}")
+
 def descargar_imagen(url, nombre_archivo):
     """
-    Descarga una imagen desde una URL y la guarda con un nombre de archivo.
-    Maneja los errores de descarga.
+    Deja en nombre_archivo la foto de url, desde la caché de imágenes si el servidor indica que no cambió.
+    Devuelve el informe de CacheImagenes.descargar (con "estado", "bytes", "ms" y "error").
     """
-    try:
-        # Añade un encabezado User-Agent para evitar problemas con algunos servidores que bloquean descargas de scripts.
-        req = urllib.request.Request(
-            url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req) as response:
-            with open(nombre_archivo, 'wb') as f:
-                f.write(response.read())
-        print(f"Imagen descargada: {nombre_archivo}")
-        return True
-    except Exception as e:
-        print(f"Error al descargar la imagen {url}: {e}")
-        return False
+    informe = cache_imagenes.descargar(url, nombre_archivo)
+    cache_imagenes.guardar_indice()
+    registrar_informes_descarga([informe])
+    return informe
 
-def descargar_imagenes_concurrente(lista_personas):
+def descargar_imagenes_concurrente(lista_personas, carpeta_destino=RUTA_CARPETA_IMAGENES):
     """
-    Descarga las imágenes de los alumnos de forma concurrente usando un ThreadPoolExecutor.
+    Descarga (o revalida) las fotos de las personas con url_img, con hasta DESCARGAS_CONCURRENTES a la vez.
+    Devuelve un resumen con la cantidad por estado, los bytes descargados, la duración y las fallidas.
     """
-    print("Iniciando descarga de imágenes...")
-    # Limita el número de hilos para no saturar el sistema
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = []
-        for persona in lista_personas:
-            # Obtén la URL de la imagen, maneja el caso de que no exista
-            url_imagen = persona.get('url_img', '')
-            print(f"Procesando persona: {persona['id']} con tipo {persona['tipo']} y URL: {url_imagen}")
-            if url_imagen:
-                nombre_archivo = os.path.join(
-                    # Usa .jpg
-                    RUTA_CARPETA_IMAGENES, f"persona_{persona['id']}_tipo_{persona['tipo']}.jpg")
-                print(f"Preparando descarga de imagen: {nombre_archivo} desde {url_imagen}")
-                futures.append(executor.submit(
-                    descargar_imagen, url_imagen, nombre_archivo))
-                print(f"Descarga programada para: {nombre_archivo}")
-
-        # Espera a que todas las descargas se completen y verifica si hubo errores
-        all_downloads_successful = all(
-            futures[i].result() for i in range(len(futures)))
-
-        if all_downloads_successful:
-            print("Todas las imágenes descargadas exitosamente.")
-        else:
-            print("Algunas descargas de imágenes fallaron.")
-    print("Descarga de imágenes completada.")
+    inicio = time.perf_counter()
+    con_foto = [persona for persona in lista_personas if persona.get('url_img')]
+    informes = cache_imagenes.descargar_lote(
+        [(persona['url_img'], ruta_imagen_persona(persona, carpeta_destino)) for persona in con_foto])
+    registrar_informes_descarga(informes)
+
+    resumen = {"duracion_s": round(time.perf_counter() - inicio, 3),
+               "bytes": sum(informe["bytes"] for informe in informes), "fallidas": []}
+    for persona, informe in zip(con_foto, informes):
+        resumen[informe["estado"]] = resumen.get(informe["estado"], 0) + 1
+        if informe["estado"] == ESTADO_FALLIDA:
+            resumen["fallidas"].append({"id": persona["id"], "tipo": persona["tipo"], "error": informe["error"]})
+    app.logger.info(f"Descarga de {len(informes)} imágenes: {resumen}")
+    return resumen
+
+# Calcula y guarda el embedding de la foto de una persona; se llama al registrar o cambiar su foto (url_img)
+@app.route('/embedding/<tipo>/<id_persona>', methods=['POST'])
+def registrar_embedding(tipo, id_persona):
+    tipos = {"alumno": (0, Alumno), "profesor": (1, Profesor)}
+    if tipo not in tipos:
+        return jsonify({"message": "El tipo debe ser 'alumno' o 'profesor'"}), 400
+    tipo_persona, modelo_persona = tipos[tipo]
+
+    persona = modelo_persona.query.filter_by(id=id_persona).first()
+    if not persona:
+        return jsonify({"message": f"No existe el {tipo} {id_persona}"}), 404
+    if not persona.url_img:
+        return jsonify({"message": f"El {tipo} {id_persona} no tiene foto"}), 400
+
+    carpeta_descargas = tempfile.mkdtemp(prefix=".registro_", dir=RUTA_CARPETA_IMAGENES)
+    try:
+        ruta = os.path.join(carpeta_descargas, "foto.jpg")
+        informe = descargar_imagen(persona.url_img, ruta)
+        if informe["estado"] == ESTADO_FALLIDA:
+            return jsonify({"message": "No se pudo descargar la foto"}), 502
+        try:
+            embedding = representar_imagen(ruta)
+        except ValueError:
+            return jsonify({"message": "No se detectó un rostro en la foto"}), 400
+        guardar_embedding(tipo_persona, persona.id, persona.url_img, embedding)
+        db.session.commit()
+        return jsonify({"message": "Embedding guardado", "modelo": MODEL_NAME, "dimension": len(embedding)}), 200
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error al registrar el embedding del {tipo} {id_persona}: {e}", exc_info=True)
+        return jsonify({"message": f"Error al registrar el embedding: {str(e)}"}), 500
+    finally:
+        shutil.rmtree(carpeta_descargas, ignore_errors=True)
 
 # Obtener la lista de usuarios (alumnos y profesores) de un horario específico
 @app.route('/usuarios/<id_horario>', methods=['GET'])
@@ -695,32 +1498,39 @@ async def obtener_usuarios(id_horario):
     """
     Obtiene la lista de alumnos y profesores para un horario,
     guarda la información en la variable global y descarga las imágenes.
+    La respuesta lleva el ETag del roster: si el kiosco envía If-None-Match con esa versión y la galería ya
+    tiene el roster cargado, se responde 304 sin descargar ni embeber nada.
     """
     try:
-        alumnos = Matricula.query.filter_by(id_horario=id_horario).all()
-        profesores = Profesor.query.all()
-
-        usuarios_list = []
-
-        for alumno in alumnos:
-            usuarios_list.append({
-                "id": alumno.id_alumno,
-                "url_img": alumno.alumno.url_img,
-                "tipo": 0  # 0 para alumnos
-            })
-
-        for profesor in profesores:
-            usuarios_list.append({
-                "id": profesor.id,
-                "url_img": profesor.url_img,
-                "tipo": 1  # 1 para profesores
-            })
-
-        descargar_imagenes_concurrente(usuarios_list)  # Descarga las imágenes
-        return jsonify({"usuarios": usuarios_list}), 200
+        usuarios_list = roster_horario(id_horario) # tipo 0 para alumnos, 1 para profesores
+        version = version_roster(usuarios_list)
+        if request.if_none_match.contains(version) and roster_residente(id_horario, usuarios_list):
+            respuesta = app.response_class(status=304)
+            respuesta.set_etag(version)
+            return respuesta
+
+        # Si la precarga ya dejó el roster en la galería, aquí no se descarga ni se embebe nada
+        preparar_galeria_horario(id_horario, usuarios_list)
+        respuesta = jsonify({"usuarios": usuarios_list})
+        respuesta.set_etag(version)
+        return respuesta, 200
     except Exception as e:
         return jsonify({'mensaje': f'Error al obtener usuarios: {str(e)}'}), 500
 
+# La precarga corre en segundo plano para que /ready pueda responder mientras tanto.
+# Solo en el proceso principal: los procesos "spawn" del pool de inferencia también importan este módulo.
+if multiprocessing.parent_process() is None:
+    try:
+        actualizar_esquema()
+    except Exception as e:
+        app.logger.error(f"No se pudo actualizar el esquema de la base de datos: {e}")
+    if PRECARGAR_MODELOS:
+        threading.Thread(target=iniciar_modelos, name="precarga-modelos", daemon=True).start()
+    else:
+        estado_arranque["listo"] = True # Sin precarga, los modelos se construyen en la primera llamada a /ia
+    if PRECARGA_ANTICIPACION_MIN > 0:
+        precarga_horarios.iniciar()
+
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,13 @@
+# backend/archivos.py
+# Utilidades de archivos compartidas por los módulos que guardan estado en disco (desconocidos.py,
+# cache_imagenes.py): escribir sin que un lector o una caída a mitad de camino vea el archivo a medias.
+import os
+import tempfile
+
+
+def escribir_atomico(ruta, datos):
+    """Escribe los bytes en un archivo temporal de la misma carpeta y lo renombra sobre ruta (os.replace)."""
+    descriptor, ruta_temporal = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(ruta) or ".")
+    with os.fdopen(descriptor, 'wb') as f:
+        f.write(datos)
+    os.replace(ruta_temporal, ruta)
@@ -0,0 +1,160 @@
+# backend/asgi.py
+# Modo de servicio ASGI:  uvicorn asgi:application --host 0.0.0.0 --port 5000
+# El bucle de eventos del servidor atiende todas las conexiones; la app Flask corre detrás del adaptador
+# WSGI -> ASGI de asgiref, dentro de un grupo de hilos acotado según la ruta: reconocimiento (/ia), E/S lenta
+# (correo SMTP, Twilio, descargas de fotos) y el resto. Así, muchos kioscos esperando un correo o una descarga
+# lenta no ocupan los hilos que necesita el reconocimiento. Si la cola de un grupo está llena se responde 503
+# con Retry-After de inmediato, sin dejar la conexión esperando.
+# La base de datos sigue usando la sesión síncrona de Flask-SQLAlchemy, dentro del hilo de cada petición.
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgiInstance
+
+from app_flask import app
+
+HILOS_RECONOCIMIENTO = int(os.getenv('HILOS_RECONOCIMIENTO', 32))
+HILOS_IO = int(os.getenv('HILOS_IO', 16))
+HILOS_GENERAL = int(os.getenv('HILOS_GENERAL', 8))
+MAX_COLA_GRUPO = int(os.getenv('MAX_COLA_GRUPO', 64)) # Peticiones en espera por grupo antes de responder 503
+MAX_CUERPO_BYTES = int(os.getenv('MAX_CUERPO_BYTES', 64 * 1024 * 1024))
+
+# Prefijos de ruta de cada grupo; las rutas que no coinciden van al grupo "general"
+RUTAS_RECONOCIMIENTO = ('/ia',)
+RUTAS_IO = ('/reporte', '/mensaje', '/usuarios', '/desconocido', '/embedding')
+
+
+def coincide_prefijo(ruta, prefijos):
+    return any(ruta == prefijo or ruta.startswith(prefijo + '/') for prefijo in prefijos)
+
+
+class CuerpoDemasiadoGrande(Exception):
+    pass
+
+
+class ClienteDesconectado(Exception):
+    pass
+
+
+class GrupoHilos:
+    """Hilos dedicados a un tipo de petición, con un límite de peticiones en ejecución + en espera."""
+
+    def __init__(self, nombre, hilos, max_cola):
+        self.nombre = nombre
+        self.executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix=f"asgi-{nombre}")
+        self._cupos = threading.BoundedSemaphore(hilos + max_cola)
+
+    def intentar_ocupar(self):
+        return self._cupos.acquire(blocking=False)
+
+    def liberar(self):
+        self._cupos.release()
+
+    def cerrar(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class InstanciaWSGI(WsgiToAsgiInstance):
+    """
+    WsgiToAsgiInstance de asgiref que ejecuta la app en los hilos de un grupo: asgiref, por defecto, ejecuta
+    todas las peticiones en un único hilo compartido. La respuesta se envía por partes, como la devuelve Flask.
+    El hilo se toma con run_in_executor y no con sync_to_async: sync_to_async deja registrado en el hilo el bucle
+    de uvicorn, y el async_to_sync con el que Flask ejecuta las rutas "async def" mandaría la corrutina a ese
+    bucle, una petición a la vez. Sin él, async_to_sync crea un bucle propio para cada llamada.
+    """
+
+    def __init__(self, wsgi_app, executor):
+        super().__init__(wsgi_app)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        ejecutar = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func # La función sin el sync_to_async de asgiref
+        contexto = contextvars.copy_context()
+        await asyncio.get_running_loop().run_in_executor(self.executor, contexto.run, ejecutar, self, body)
+
+    def build_environ(self, scope, body):
+        environ = super().build_environ(scope, body)
+        # asgiref ya leyó el cuerpo completo: su largo es el real aunque el cliente haya usado chunked
+        body.seek(0, os.SEEK_END)
+        environ["CONTENT_LENGTH"] = str(body.tell())
+        body.seek(0)
+        environ["wsgi.input_terminated"] = True
+        return environ
+
+
+class AplicacionASGI:
+    """Middleware ASGI que elige el grupo de hilos de cada petición según su ruta y limita su cuerpo."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.grupos = {
+            "reconocimiento": GrupoHilos("reconocimiento", HILOS_RECONOCIMIENTO, MAX_COLA_GRUPO),
+            "io": GrupoHilos("io", HILOS_IO, MAX_COLA_GRUPO),
+            "general": GrupoHilos("general", HILOS_GENERAL, MAX_COLA_GRUPO),
+        }
+
+    def grupo_de(self, ruta):
+        if coincide_prefijo(ruta, RUTAS_RECONOCIMIENTO):
+            return self.grupos["reconocimiento"]
+        if coincide_prefijo(ruta, RUTAS_IO):
+            return self.grupos["io"]
+        return self.grupos["general"]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._ciclo_de_vida(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        grupo = self.grupo_de(scope["path"])
+        if not grupo.intentar_ocupar():
+            await self._responder(send, 503, [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+                                  b'{"error": "El servidor est\\u00e1 ocupado, vuelve a intentar en unos segundos."}')
+            return
+        try:
+            await InstanciaWSGI(self.wsgi_app, grupo.executor)(scope, self._receive_limitado(receive), send)
+        except CuerpoDemasiadoGrande: # asgiref lee el cuerpo completo antes de llamar a la app: aún no se respondió
+            await self._responder(send, 413, [(b"content-type", b"application/json")],
+                                  b'{"error": "La petici\\u00f3n es demasiado grande."}')
+        except ClienteDesconectado:
+            pass
+        finally:
+            grupo.liberar()
+
+    @staticmethod
+    def _receive_limitado(receive):
+        total = 0
+
+        async def receive_limitado():
+            nonlocal total
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                raise ClienteDesconectado()
+            total += len(mensaje.get("body", b""))
+            if total > MAX_CUERPO_BYTES:
+                raise CuerpoDemasiadoGrande()
+            return mensaje
+        return receive_limitado
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                for grupo in self.grupos.values():
+                    grupo.cerrar()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _responder(send, estado, encabezados, cuerpo):
+        await send({"type": "http.response.start", "status": estado, "headers": encabezados})
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+application = AplicacionASGI(app)
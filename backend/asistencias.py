@@ -0,0 +1,83 @@
+# backend/asistencias.py
+# Registro de las asistencias que el kiosco envía al terminar la clase. En lugar de un objeto del ORM por fila,
+# cada tabla se escribe con un solo INSERT ... ON CONFLICT de varias filas sobre el índice único
+# (id_horario, persona, fecha): si el kiosco reintenta el envío (por ejemplo, después de un timeout), las filas ya
+# guardadas se actualizan en lugar de duplicarse. Con psycopg2, SQLAlchemy agrupa las filas en sentencias
+# INSERT ... VALUES de hasta 1000 filas (insertmanyvalues), así que un lote grande son pocos viajes a la base.
+# Los índices únicos se crean con migrar_asistencia.py (borra antes los duplicados que ya existan); mientras
+# falten, se inserta sin ON CONFLICT, como antes.
+from sqlalchemy import inspect, insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from schemas import AsistenciaAlumno, AsistenciaProfesor
+
+# rol que envía el kiosco (0 alumno, 1 profesor) -> (modelo, columna de la persona)
+TABLAS_POR_ROL = {
+    0: (AsistenciaAlumno, "id_alumno"),
+    1: (AsistenciaProfesor, "id_profesor"),
+}
+
+
+def indices_faltantes(engine):
+    """Nombres de los índices únicos de asistencia que todavía no existen en la base de datos."""
+    inspector = inspect(engine)
+    faltantes = []
+    for modelo, _ in TABLAS_POR_ROL.values():
+        existentes = {indice["name"] for indice in inspector.get_indexes(modelo.__tablename__)}
+        faltantes += [indice.name for indice in modelo.__table__.indexes if indice.name not in existentes]
+    return faltantes
+
+
+def sentencia_insert(sesion, tabla):
+    """INSERT del dialecto de la base, el único que permite ON CONFLICT."""
+    dialecto = sesion.get_bind().dialect.name
+    if dialecto == "postgresql":
+        return postgresql.insert(tabla)
+    if dialecto == "sqlite":
+        return sqlite.insert(tabla)
+    raise NotImplementedError(f"INSERT ... ON CONFLICT no soportado para {dialecto}")
+
+
+def filas_por_rol(id_horario, items, fecha):
+    """
+    Filas de cada tabla a partir de los items del kiosco ({"id", "rol", "estado", "tiempo"}). Los roles
+    desconocidos se ignoran y, si una persona se repite, queda su último item: una misma sentencia
+    ON CONFLICT DO UPDATE no puede tocar dos veces la misma fila.
+    """
+    filas = {rol: {} for rol in TABLAS_POR_ROL}
+    for item in items:
+        if item['rol'] not in TABLAS_POR_ROL:
+            continue
+        columna = TABLAS_POR_ROL[item['rol']][1]
+        filas[item['rol']][item['id']] = {
+            "id_horario": id_horario,
+            columna: item['id'],
+            "fecha": fecha,
+            "estado": item['estado'],
+            "tiempo_permanencia": str(item["tiempo"]),
+        }
+    return {rol: list(por_persona.values()) for rol, por_persona in filas.items()}
+
+
+def guardar_asistencias(sesion, id_horario, items, fecha, idempotente=True):
+    """
+    Inserta o actualiza las asistencias del horario en fecha (una sentencia por tabla). No hace commit.
+    Con idempotente=False (sin los índices únicos) solo inserta, así que un reintento duplica las filas.
+    Devuelve {rol: filas escritas}.
+    """
+    escritas = {}
+    for rol, filas in filas_por_rol(id_horario, items, fecha).items():
+        escritas[rol] = len(filas)
+        if not filas:
+            continue
+        modelo, columna = TABLAS_POR_ROL[rol]
+        if not idempotente:
+            sesion.execute(insert(modelo.__table__), filas)
+            continue
+        sentencia = sentencia_insert(sesion, modelo.__table__)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=["id_horario", columna, "fecha"],
+            set_={"estado": sentencia.excluded.estado, "tiempo_permanencia": sentencia.excluded.tiempo_permanencia},
+        )
+        sesion.execute(sentencia, filas)
+    return escritas
@@ -0,0 +1,5 @@
+# backend/benchmarks
+# Mediciones de rendimiento que corren sin cámara ni modelos. Se ejecutan desde backend/, por ejemplo:
+#   python -m benchmarks.ann
+#   python -m benchmarks.reconocimiento   (busqueda, /ia y /ia/batch con galería y modelo sintéticos)
+#   python -m benchmarks.asistencia     (/asistencia: ORM fila por fila contra INSERT ... ON CONFLICT)
@@ -0,0 +1,48 @@
+# backend/benchmarks/ann.py
+# Compara la búsqueda exacta de IndiceGaleria con la aproximada de IndiceIVF en galerías sintéticas.
+# Cada consulta es el embedding de una identidad de la galería con ruido (otra "foto" de la misma persona),
+# así que la respuesta correcta se conoce y recall@1 = aciertos de IVF / aciertos de la búsqueda exacta.
+# La galería y las consultas son las de sintetico.py.
+#   python -m benchmarks.ann --tamanos 1000 10000 100000 --sondas 4 8 16
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.sintetico import consultas_galeria, galeria_sintetica, medir_consultas
+from indice_ivf import IndiceIVF
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Búsqueda exacta contra IndiceIVF (recall@1 y ms por consulta) en galerías sintéticas.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dimension", type=int, default=512, help="VGG-Face usa 4096")
+    parser.add_argument("--rango", type=int, default=64, help="Dimensiones latentes de la galería sintética")
+    parser.add_argument("--consultas", type=int, default=500)
+    parser.add_argument("--ruido", type=float, default=0.6, help="Norma del ruido añadido a cada consulta")
+    parser.add_argument("--listas", type=int, default=None, help="Listas IVF (por defecto ~sqrt(N))")
+    parser.add_argument("--sondas", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'identidades':>11} {'índice':>12} {'construcción s':>14} {'ms/consulta':>11} {'recall@1':>8} {'acierto':>7}")
+    for tamano in args.tamanos:
+        exacto = galeria_sintetica(tamano, args.dimension, args.semilla, args.rango)
+        consultas, esperadas = consultas_galeria(exacto, min(args.consultas, tamano), args.ruido, args.semilla)
+
+        posiciones_exactas, _, ms_exacto = medir_consultas(exacto, consultas)
+        print(f"{tamano:>11} {'exacto':>12} {0.0:>14.2f} {ms_exacto:>11.3f} {1.0:>8.3f} "
+              f"{np.mean(posiciones_exactas == esperadas):>7.3f}")
+
+        inicio = time.perf_counter()
+        ivf = IndiceIVF.desde_indice(exacto, n_listas=args.listas)
+        construccion = time.perf_counter() - inicio
+        for sondas in args.sondas:
+            ivf.n_sondas = sondas
+            posiciones, _, ms_ivf = medir_consultas(ivf, consultas)
+            print(f"{tamano:>11} {f'ivf {sondas}/{ivf.n_listas}':>12} {construccion:>14.2f} {ms_ivf:>11.3f} "
+                  f"{np.mean(posiciones == posiciones_exactas):>8.3f} {np.mean(posiciones == esperadas):>7.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# backend/benchmarks/compacto.py
+# Compara IndiceCompacto (PCA + float16/int8, con y sin reordenamiento exacto) con la búsqueda exacta en
+# float32: memoria por identidad, ms por consulta, coincidencia del top-1 y de la decisión frente al umbral.
+# Los embeddings de caras se concentran cerca de un subespacio de pocas dimensiones; la galería sintética lo
+# imita con --rango dimensiones latentes más ruido isotrópico (con datos sin estructura la PCA pierde mucho más);
+# la galería y las consultas son las de sintetico.py.
+#   python -m benchmarks.compacto --tamanos 1000 10000 --dimension 4096
+import argparse
+
+import numpy as np
+
+from benchmarks.sintetico import consultas_galeria, galeria_sintetica, medir_consultas
+from indice_compacto import IndiceCompacto
+
+DISTANCE_THRESHOLD = 0.65 # El de app_flask.py para VGG-Face y cosine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IndiceCompacto (PCA + float16/int8) contra la búsqueda exacta en float32.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--dimension", type=int, default=4096, help="VGG-Face usa 4096")
+    parser.add_argument("--rango", type=int, default=96, help="Dimensiones latentes de la galería sintética")
+    parser.add_argument("--dimensiones-reducidas", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--reordenar", type=int, nargs="+", default=[0, 10])
+    parser.add_argument("--consultas", type=int, default=300)
+    parser.add_argument("--ruido", type=float, default=0.8, help="Norma del ruido añadido a cada consulta")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'identidades':>11} {'índice':>22} {'bytes/id':>8} {'memoria/id':>10} {'ms/consulta':>11} {'top-1':>6} "
+          f"{'umbral':>6} {'error dist':>10}")
+    for tamano in args.tamanos:
+        exacto = galeria_sintetica(tamano, args.dimension, args.semilla, args.rango)
+        consultas, _ = consultas_galeria(exacto, min(args.consultas, tamano), args.ruido, args.semilla)
+        posiciones_exactas, distancias_exactas, ms_exacto = medir_consultas(exacto, consultas)
+        print(f"{tamano:>11} {'exacto float32':>22} {exacto.dimension * 4:>8} {exacto.dimension * 4:>10} {ms_exacto:>11.3f} {1.0:>6.3f} "
+              f"{1.0:>6.3f} {0.0:>10.4f}")
+
+        for dimension_reducida in args.dimensiones_reducidas:
+            for cuantizacion in ('float16', 'int8'):
+                compacto = IndiceCompacto.reconstruir(exacto, dimension_reducida=dimension_reducida, cuantizacion=cuantizacion)
+                for reordenar in args.reordenar:
+                    compacto.reordenar = reordenar
+                    posiciones, distancias, ms = medir_consultas(compacto, consultas)
+                    mismo_top1 = np.mean(posiciones == posiciones_exactas)
+                    misma_decision = np.mean((distancias < DISTANCE_THRESHOLD) == (distancias_exactas < DISTANCE_THRESHOLD))
+                    error = np.max(np.abs(distancias - distancias_exactas))
+                    nombre = f"pca{compacto.codigos.shape[1]} {cuantizacion} top{reordenar}"
+                    print(f"{tamano:>11} {nombre:>22} {compacto.bytes_codigos_por_identidad:>8} "
+                          f"{compacto.bytes_por_identidad:>10} {ms:>11.3f} "
+                          f"{mismo_top1:>6.3f} {misma_decision:>6.3f} {error:>10.4f}")
+
+
+if __name__ == '__main__':
+    main()
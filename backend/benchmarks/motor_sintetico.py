@@ -0,0 +1,47 @@
+# backend/benchmarks/motor_sintetico.py
+# Reemplazo de MotorReconocimiento para medir /ia sin modelos: la "detección" lee la identidad escrita en el
+# frame (ver sintetico.frame_sintetico) y el "embedding" es embedding_consulta de esa identidad.
+# ms_deteccion y ms_embedding simulan el costo de los modelos con esperas que, como la inferencia real,
+# liberan el GIL; así se puede medir el micro-batching y la concurrencia sin CPU ocupada por los modelos.
+import time
+
+import numpy as np
+
+from benchmarks.sintetico import embedding_consulta, leer_identidad
+from modelos import ESTADO_REAL, ESTADO_SIN_CARA
+
+
+class MotorSintetico:
+    def __init__(self, embeddings, ruido=0.6, semilla=0, ms_deteccion=0.0, ms_embedding_lote=0.0, ms_embedding_cara=0.0):
+        self.embeddings = embeddings
+        self.ruido = ruido
+        self.semilla = semilla
+        self.ms_deteccion = ms_deteccion
+        self.ms_embedding_lote = ms_embedding_lote
+        self.ms_embedding_cara = ms_embedding_cara
+        self.ruta_onnx = None
+
+    def precargar(self):
+        return {}
+
+    def analizar_imagen(self, img):
+        if self.ms_deteccion > 0:
+            time.sleep(self.ms_deteccion / 1000)
+        identidad = leer_identidad(img)
+        if identidad is None:
+            return {"estado": ESTADO_SIN_CARA}
+        return {"estado": ESTADO_REAL, "cara": identidad, "calidad": 1.0}
+
+    def embeber_caras(self, caras):
+        if len(caras) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        espera = self.ms_embedding_lote + self.ms_embedding_cara * len(caras)
+        if espera > 0:
+            time.sleep(espera / 1000)
+        return np.stack([embedding_consulta(self.embeddings, identidad, self.ruido, self.semilla) for identidad in caras])
+
+    def representar(self, img):
+        resultado = self.analizar_imagen(img)
+        if resultado["estado"] != ESTADO_REAL:
+            raise ValueError("Face could not be detected in the synthetic frame")
+        return self.embeber_caras([resultado["cara"]])[0]
@@ -0,0 +1,275 @@
+# backend/benchmarks/reconocimiento.py
+# Suite de rendimiento del reconocimiento que corre sin fotos reales, sin base de datos y sin descargar modelos:
+# - busqueda: búsqueda en la galería (exacta, IVF y compacta), de a una consulta y por lotes (buscar_lote).
+# - ia: la ruta completa de POST /ia con el cliente de prueba de Flask (decodificación, "detección", micro-batching
+#   de embeddings, búsqueda y desconocidos), con varias peticiones concurrentes.
+# - ia_batch: POST /ia/batch con lotes de frames.
+# La galería y los frames son sintéticos (ver sintetico.py) y el modelo se reemplaza por MotorSintetico.
+# Para busqueda, "acierto" es el top-1 correcto entre las consultas de la galería; para ia / ia_batch, la fracción
+# de frames con la respuesta esperada (su id, o "unknown" para desconocidos y frames sin cara).
+# Los resultados (throughput y p50/p95/p99) se escriben en JSON junto con el commit, para comparar entre commits:
+#   python -m benchmarks.reconocimiento --tamanos 1000 10000 --salida base.json
+#   python -m benchmarks.reconocimiento --tamanos 1000 10000 --salida nuevo.json --comparar base.json
+import argparse
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.sintetico import (embedding_consulta, frame_sintetico, galeria_sintetica, identidades_consulta,
+                                  resumen_latencias)
+from indice_compacto import IndiceCompacto
+from indice_ivf import IndiceIVF
+
+ESCENARIOS = ('busqueda', 'ia', 'ia_batch')
+TIPOS_INDICE = ('exacto', 'ivf', 'compacto')
+
+
+def construir_indice(tipo, exacto):
+    if tipo == 'ivf':
+        return IndiceIVF.desde_indice(exacto, n_sondas=16)
+    if tipo == 'compacto':
+        return IndiceCompacto.reconstruir(exacto)
+    return exacto
+
+
+def respuesta_esperada(identidad, tamano):
+    return str(identidad) if identidad is not None and identidad < tamano else "unknown"
+
+
+def medir_busqueda(indice, consultas, identidades, lote):
+    """Busca las consultas en grupos de lote (1: indice.buscar, como /ia). Devuelve (resumen, acierto)."""
+    latencias, aciertos, conocidas = [], 0, 0
+    inicio = time.perf_counter()
+    for i in range(0, len(consultas), lote):
+        t0 = time.perf_counter()
+        if lote == 1:
+            posiciones = [indice.buscar(consultas[i])[0]]
+        else:
+            posiciones, _ = indice.buscar_lote(consultas[i:i + lote])
+        latencias.append(time.perf_counter() - t0)
+        for posicion, identidad in zip(posiciones, identidades[i:i + lote]):
+            if identidad < len(indice):
+                conocidas += 1
+                aciertos += int(posicion == identidad)
+    return resumen_latencias(latencias, time.perf_counter() - inicio, len(consultas)), aciertos / max(conocidas, 1)
+
+
+def escenario_busqueda(args, tamano, exacto):
+    identidades = identidades_consulta(tamano, args.consultas, args.fraccion_desconocidos, 0.0, args.semilla)
+    consultas = np.stack([embedding_consulta(exacto.embeddings, identidad, args.ruido, args.semilla)
+                          for identidad in identidades])
+    resultados = []
+    for tipo in args.indices:
+        inicio = time.perf_counter()
+        indice = construir_indice(tipo, exacto)
+        construccion = time.perf_counter() - inicio
+        for lote in args.lotes:
+            resumen, acierto = medir_busqueda(indice, consultas, identidades, lote)
+            resultados.append(dict(escenario='busqueda', indice=tipo, tamano=tamano, dimension=exacto.dimension, lote=lote,
+                                   concurrencia=1, acierto=round(acierto, 4), construccion_s=round(construccion, 3), **resumen))
+    return resultados
+
+
+def preparar_app(args):
+    """
+    Importa app_flask aislado: base de datos en memoria (o --bd), sin precarga de modelos ni de horarios, sin pool
+    de procesos, sin galería compartida en disco y con los desconocidos en una carpeta temporal.
+    """
+    os.environ["SQLALCHEMY_DATABASE_URI"] = args.bd
+    os.environ["PRECARGAR_MODELOS"] = "0"
+    os.environ["PRECARGA_ANTICIPACION_MIN"] = "0" # Sin el hilo de precarga consultando la base durante la medición
+    os.environ["TRABAJADORES_IA"] = "0"
+    os.environ["RUTA_GALERIA_COMPARTIDA"] = ""
+    os.environ["TIPO_INDICE"] = args.indice_ia
+    os.environ["TTL_CACHE_RESULTADOS_S"] = "0" # La caché solo se usa con id_horario, que estas peticiones no envían
+    import app_flask
+    app_flask.app.logger.setLevel(logging.ERROR) # Los avisos por frame a la consola distorsionan la medición
+    app_flask.agrupador_desconocidos.carpeta = tempfile.mkdtemp(prefix="benchmark_desconocidos_")
+    return app_flask
+
+
+def instalar_galeria(app_flask, args, exacto):
+    """Publica la galería sintética como roster y reemplaza el modelo por MotorSintetico."""
+    from benchmarks.motor_sintetico import MotorSintetico
+    motor = MotorSintetico(exacto.embeddings, args.ruido, args.semilla, args.ms_deteccion,
+                           args.ms_embedding_lote, args.ms_embedding_cara)
+    app_flask.motor = motor
+    app_flask.planificador_embeddings.funcion_lote = motor.embeber_caras
+    entradas = [{"clave": exacto.claves[i], "id": exacto.ids[i], "rol": exacto.roles[i], "ruta": None, "fuente": None,
+                 "embedding": exacto.embeddings[i]} for i in range(len(exacto))]
+    app_flask.galeria.actualizar_roster("benchmark", entradas, app_flask.representar_imagen)
+
+
+def medir_peticiones(app, peticiones, concurrencia):
+    """
+    Envía las peticiones (ruta, frames) desde concurrencia hilos, cada uno con su cliente de prueba.
+    Devuelve (latencias, duración total, ids respondidos por frame).
+    """
+    latencias = [0.0] * len(peticiones)
+    ids = [None] * len(peticiones)
+    siguiente = itertools.count()
+
+    def trabajar():
+        cliente = app.test_client()
+        while True:
+            i = next(siguiente)
+            if i >= len(peticiones):
+                return
+            ruta, frames = peticiones[i]
+            if ruta == '/ia':
+                datos = {"image_file": (io.BytesIO(frames[0]), "frame.jpg")}
+            else:
+                datos = {"image_files": [(io.BytesIO(frame), f"frame_{j}.jpg") for j, frame in enumerate(frames)]}
+            t0 = time.perf_counter()
+            respuesta = cliente.post(ruta, data=datos, content_type="multipart/form-data")
+            latencias[i] = time.perf_counter() - t0
+            cuerpo = respuesta.get_json(silent=True) or {}
+            respuestas = [cuerpo] if ruta == '/ia' else cuerpo.get("resultados", [{}] * len(frames))
+            ids[i] = [r.get("id", "error") for r in respuestas]
+
+    hilos = [threading.Thread(target=trabajar) for _ in range(concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return latencias, time.perf_counter() - inicio, ids
+
+
+def escenario_ia(args, app_flask, tamano, exacto, escenario):
+    instalar_galeria(app_flask, args, exacto)
+    identidades = identidades_consulta(tamano, args.consultas, args.fraccion_desconocidos, args.fraccion_sin_cara, args.semilla)
+    frames = [frame_sintetico(identidad) for identidad in identidades]
+    esperadas = [respuesta_esperada(identidad, tamano) for identidad in identidades]
+
+    if escenario == 'ia':
+        configuraciones = [(1, concurrencia) for concurrencia in args.concurrencia]
+    else:
+        configuraciones = [(lote, 1) for lote in args.lotes if lote <= app_flask.MAX_IMAGENES_LOTE]
+    resultados = []
+    for lote, concurrencia in configuraciones:
+        ruta = '/ia' if escenario == 'ia' else '/ia/batch'
+        peticiones = [(ruta, frames[i:i + lote]) for i in range(0, len(frames), lote)]
+        medir_peticiones(app_flask.app, peticiones[:concurrencia], concurrencia) # Calentamiento
+        latencias, duracion, ids = medir_peticiones(app_flask.app, peticiones, concurrencia)
+        respondidas = [id_respuesta for ids_peticion in ids for id_respuesta in ids_peticion]
+        acierto = np.mean([respondida == esperada for respondida, esperada in zip(respondidas, esperadas)])
+        resultados.append(dict(escenario=escenario, indice=args.indice_ia, tamano=tamano, dimension=exacto.dimension,
+                               lote=lote, concurrencia=concurrencia, acierto=round(float(acierto), 4),
+                               **resumen_latencias(latencias, duracion, len(frames))))
+    return resultados
+
+
+def metadatos(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "argumentos": vars(args),
+    }
+
+
+def clave_resultado(resultado):
+    return tuple(resultado[campo] for campo in ("escenario", "indice", "tamano", "dimension", "lote", "concurrencia"))
+
+
+def imprimir(resultado):
+    print(f"{resultado['escenario']:>9} {resultado['indice']:>9} {resultado['tamano']:>9} {resultado['lote']:>5} "
+          f"{resultado['concurrencia']:>5} {resultado['elementos_s']:>12.1f} {resultado['p50_ms']:>9.3f} "
+          f"{resultado['p95_ms']:>9.3f} {resultado['p99_ms']:>9.3f} {resultado['acierto']:>7.3f}")
+
+
+def comparar(resultados, ruta_base, tolerancia):
+    """
+    Compara con los resultados de otro commit. Es regresión si el p99 sube o el throughput baja más que tolerancia.
+    Devuelve la cantidad de regresiones.
+    """
+    with open(ruta_base, encoding='utf-8') as f:
+        base = json.load(f)
+    anteriores = {clave_resultado(resultado): resultado for resultado in base["resultados"]}
+    print(f"\nComparación con {ruta_base} (commit {base['metadatos'].get('commit')}):")
+    print(f"{'escenario':>9} {'índice':>9} {'tamaño':>9} {'lote':>5} {'conc':>5} {'Δ elem/s':>9} {'Δ p50':>8} {'Δ p99':>8}")
+    regresiones = 0
+    for resultado in resultados:
+        anterior = anteriores.get(clave_resultado(resultado))
+        if anterior is None:
+            continue
+        cambio_elementos = resultado["elementos_s"] / anterior["elementos_s"] - 1 if anterior["elementos_s"] else 0.0
+        cambio_p50 = resultado["p50_ms"] / anterior["p50_ms"] - 1 if anterior["p50_ms"] else 0.0
+        cambio_p99 = resultado["p99_ms"] / anterior["p99_ms"] - 1 if anterior["p99_ms"] else 0.0
+        regresion = cambio_p99 > tolerancia or cambio_elementos < -tolerancia
+        regresiones += int(regresion)
+        print(f"{resultado['escenario']:>9} {resultado['indice']:>9} {resultado['tamano']:>9} {resultado['lote']:>5} "
+              f"{resultado['concurrencia']:>5} {cambio_elementos:>+9.1%} {cambio_p50:>+8.1%} {cambio_p99:>+8.1%}"
+              f"{'  REGRESIÓN' if regresion else ''}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento del reconocimiento con galería y modelo sintéticos.")
+    parser.add_argument("--escenarios", nargs="+", choices=ESCENARIOS, default=list(ESCENARIOS))
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--dimension", type=int, default=4096, help="VGG-Face usa 4096")
+    parser.add_argument("--consultas", type=int, default=300, help="Consultas (o frames) por medición")
+    parser.add_argument("--indices", nargs="+", choices=TIPOS_INDICE, default=list(TIPOS_INDICE), help="Índices para busqueda")
+    parser.add_argument("--indice-ia", choices=TIPOS_INDICE, default='exacto', help="TIPO_INDICE para ia / ia_batch")
+    parser.add_argument("--lotes", type=int, nargs="+", default=[1, 8, 32], help="Tamaños de lote de busqueda e ia_batch")
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 8], help="Peticiones /ia simultáneas")
+    parser.add_argument("--ruido", type=float, default=0.6, help="Norma del ruido de cada consulta")
+    parser.add_argument("--fraccion-desconocidos", type=float, default=0.2)
+    parser.add_argument("--fraccion-sin-cara", type=float, default=0.05)
+    parser.add_argument("--ms-deteccion", type=float, default=0.0, help="Costo simulado de detección + anti-spoofing")
+    parser.add_argument("--ms-embedding-lote", type=float, default=0.0, help="Costo simulado fijo de cada forward")
+    parser.add_argument("--ms-embedding-cara", type=float, default=0.0, help="Costo simulado por cara de cada forward")
+    parser.add_argument("--bd", default="sqlite://", help="SQLALCHEMY_DATABASE_URI para importar app_flask")
+    parser.add_argument("--salida", default="resultados_benchmark.json")
+    parser.add_argument("--comparar", default=None, help="JSON de otro commit con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Cambio relativo aceptado antes de marcar regresión")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    app_flask = preparar_app(args) if set(args.escenarios) & {'ia', 'ia_batch'} else None
+
+    print(f"{'escenario':>9} {'índice':>9} {'tamaño':>9} {'lote':>5} {'conc':>5} {'elementos/s':>12} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'acierto':>7}")
+    resultados = []
+    for tamano in args.tamanos:
+        exacto = galeria_sintetica(tamano, args.dimension, args.semilla)
+        nuevos = []
+        if 'busqueda' in args.escenarios:
+            nuevos += escenario_busqueda(args, tamano, exacto)
+        for escenario in ('ia', 'ia_batch'):
+            if escenario in args.escenarios:
+                nuevos += escenario_ia(args, app_flask, tamano, exacto, escenario)
+        for resultado in nuevos:
+            imprimir(resultado)
+        resultados += nuevos
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump({"metadatos": metadatos(args), "resultados": resultados}, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar and comparar(resultados, args.comparar, args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
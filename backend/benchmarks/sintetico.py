@@ -0,0 +1,119 @@
+# backend/benchmarks/sintetico.py
+# Datos sintéticos para medir el reconocimiento sin fotos, sin cámara y sin descargar modelos:
+# - galeria_sintetica: identidades con embeddings cercanos a un subespacio de pocas dimensiones (como los de caras).
+# - embedding_consulta: "otra foto" de una identidad (su embedding con ruido), o un vector al azar si no está en la galería.
+# - consultas_galeria / medir_consultas: consultas de identidades conocidas y su búsqueda de una en una, como /ia.
+# - frame_sintetico / leer_identidad: frames JPEG que llevan la identidad escrita en una fila de bloques blancos
+#   y negros, para que un embedder de prueba sepa a quién "ve" después de la decodificación real de /ia.
+import time
+
+import cv2
+import numpy as np
+
+from galeria import IndiceGaleria, normalizar_l2
+
+LADO_BLOQUE = 16 # Píxeles de cada bloque de la marca
+BITS_IDENTIDAD = 24
+FIRMA = (255, 0) # Primeros dos bloques de la marca; sin ellos el frame se trata como "sin cara"
+
+
+def clave_sintetica(identidad):
+    return f"persona_{identidad}_tipo_0" # Mismo formato que clave_persona de app_flask.py
+
+
+def galeria_sintetica(tamano, dimension, semilla=0, rango=64):
+    """IndiceGaleria de tamano alumnos; la identidad i está en la fila i con id str(i)."""
+    rng = np.random.default_rng(semilla)
+    latentes = rng.standard_normal((tamano, rango), dtype=np.float32)
+    mezcla = rng.standard_normal((rango, dimension), dtype=np.float32)
+    ruido = rng.standard_normal((tamano, dimension), dtype=np.float32) * 0.3 * np.sqrt(rango / dimension)
+    embeddings = normalizar_l2(latentes @ mezcla + ruido)
+    return IndiceGaleria(embeddings, [str(i) for i in range(tamano)], ["alumno"] * tamano,
+                         claves=[clave_sintetica(i) for i in range(tamano)], normalizados=True)
+
+
+def embedding_consulta(embeddings, identidad, ruido=0.6, semilla=0):
+    """
+    Embedding determinista de un frame de identidad: la fila de la galería más ruido de norma ~ruido
+    (siempre el mismo para la misma identidad), o un vector al azar si identidad no está en la galería.
+    """
+    rng = np.random.default_rng((semilla, identidad))
+    dimension = embeddings.shape[1]
+    if identidad < len(embeddings):
+        base = np.asarray(embeddings[identidad], dtype=np.float32)
+        return normalizar_l2(base + rng.standard_normal(dimension, dtype=np.float32) * ruido / np.sqrt(dimension))[0]
+    return normalizar_l2(rng.standard_normal(dimension, dtype=np.float32))[0]
+
+
+def consultas_galeria(indice, cantidad, ruido=0.6, semilla=0):
+    """cantidad consultas de identidades distintas de la galería. Devuelve (consultas, posiciones esperadas)."""
+    esperadas = np.random.default_rng((semilla, len(indice))).choice(len(indice), cantidad, replace=False)
+    consultas = np.stack([embedding_consulta(indice.embeddings, int(i), ruido, semilla) for i in esperadas])
+    return consultas, esperadas
+
+
+def medir_consultas(indice, consultas):
+    """Busca las consultas de una en una, como /ia. Devuelve (posiciones, distancias, ms por consulta)."""
+    posiciones = np.empty(len(consultas), dtype=np.int64)
+    distancias = np.empty(len(consultas), dtype=np.float32)
+    inicio = time.perf_counter()
+    for i, consulta in enumerate(consultas):
+        posiciones[i], distancias[i] = indice.buscar(consulta)
+    return posiciones, distancias, (time.perf_counter() - inicio) * 1000 / len(consultas)
+
+
+def identidades_consulta(tamano, cantidad, fraccion_desconocidos=0.2, fraccion_sin_cara=0.0, semilla=0):
+    """
+    Identidades de cantidad consultas: de la galería, desconocidas (>= tamano) o None (frame sin cara).
+    """
+    rng = np.random.default_rng((semilla, tamano))
+    identidades = []
+    for i in range(cantidad):
+        sorteo = rng.random()
+        if sorteo < fraccion_sin_cara:
+            identidades.append(None)
+        elif sorteo < fraccion_sin_cara + fraccion_desconocidos:
+            identidades.append(tamano + i)
+        else:
+            identidades.append(int(rng.integers(tamano)))
+    return identidades
+
+
+def frame_sintetico(identidad, ancho=640, alto=480, calidad_jpeg=90):
+    """Frame JPEG con fondo suave (distinto por identidad) y la marca con la identidad (sin marca si es None)."""
+    rng = np.random.default_rng([0] if identidad is None else [1, identidad])
+    fondo = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    imagen = cv2.resize(fondo, (ancho, alto), interpolation=cv2.INTER_CUBIC)
+    if identidad is not None:
+        bits = [(identidad >> i) & 1 for i in range(BITS_IDENTIDAD)]
+        for posicion, valor in enumerate(list(FIRMA) + [255 * bit for bit in bits]):
+            x = posicion * LADO_BLOQUE
+            imagen[:LADO_BLOQUE, x:x + LADO_BLOQUE] = valor
+    correcto, datos = cv2.imencode(".jpg", imagen, [cv2.IMWRITE_JPEG_QUALITY, calidad_jpeg])
+    if not correcto:
+        raise ValueError("No se pudo codificar el frame sintético")
+    return datos.tobytes()
+
+
+def leer_identidad(imagen):
+    """Identidad escrita en un frame decodificado (BGR), o None si no tiene la marca."""
+    centro = LADO_BLOQUE // 2
+    valores = [int(imagen[centro, posicion * LADO_BLOQUE + centro].mean())
+               for posicion in range(len(FIRMA) + BITS_IDENTIDAD)]
+    if valores[0] < 170 or valores[1] > 85:
+        return None
+    return sum(1 << i for i, valor in enumerate(valores[len(FIRMA):]) if valor > 127)
+
+
+def resumen_latencias(latencias_s, duracion_s, elementos):
+    """p50 / p95 / p99 / media en ms y elementos por segundo."""
+    latencias_ms = np.asarray(latencias_s, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(latencias_ms, [50, 95, 99]) if len(latencias_ms) else (0.0, 0.0, 0.0)
+    return {
+        "operaciones": len(latencias_ms),
+        "elementos_s": round(elementos / duracion_s, 2) if duracion_s > 0 else 0.0,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "media_ms": round(float(latencias_ms.mean()), 3) if len(latencias_ms) else 0.0,
+    }
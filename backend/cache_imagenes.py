@@ -0,0 +1,159 @@
+# backend/cache_imagenes.py
+# Caché persistente de las fotos de matrícula (url_img), direccionada por contenido: cada foto se guarda una
+# sola vez como objetos/<sha256>.jpg y un índice (indice.json) relaciona cada URL con su hash y con el ETag /
+# Last-Modified que devolvió el servidor. Al volver a pedir una URL se revalida con If-None-Match /
+# If-Modified-Since: si la foto no cambió (304) no se descarga nada.
+# Las descargas comparten un pool de conexiones keep-alive (urllib3.PoolManager, seguro entre hilos), corren en
+# un ThreadPoolExecutor de max_conexiones hilos y escriben el cuerpo al disco por bloques mientras calculan el hash.
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+from archivos import escribir_atomico
+
+ARCHIVO_INDICE = "indice.json"
+TAMANO_BLOQUE = 64 * 1024
+
+# Estados de cada descarga (informe["estado"])
+ESTADO_DESCARGADA = "descargada"  # 200: contenido nuevo o distinto
+ESTADO_REVALIDADA = "revalidada"  # 304: se reutiliza el objeto de la caché
+ESTADO_FALLIDA = "fallida"
+
+
+class CacheImagenes:
+    """
+    - carpeta: dónde se guardan el índice y los objetos (persistente entre reinicios del backend).
+    - max_conexiones: descargas simultáneas y conexiones keep-alive por servidor.
+    - timeout_s: timeout de conexión y de lectura de cada descarga.
+    """
+
+    def __init__(self, carpeta, max_conexiones=8, timeout_s=15.0):
+        self.carpeta = carpeta
+        self.carpeta_objetos = os.path.join(carpeta, "objetos")
+        self.max_conexiones = max(1, int(max_conexiones))
+        self._http = urllib3.PoolManager(
+            maxsize=self.max_conexiones, block=True,
+            timeout=urllib3.Timeout(connect=timeout_s, read=timeout_s),
+            retries=urllib3.Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+            headers={'User-Agent': 'Mozilla/5.0'}, # Algunos servidores bloquean las descargas de scripts
+        )
+        self._lock = threading.Lock()
+        self._indice = self._leer_indice() # url -> {"sha256", "etag", "last_modified", "bytes"}
+
+    def _leer_indice(self):
+        try:
+            with open(os.path.join(self.carpeta, ARCHIVO_INDICE), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def guardar_indice(self):
+        with self._lock:
+            contenido = json.dumps(self._indice, ensure_ascii=False).encode('utf-8')
+        os.makedirs(self.carpeta, exist_ok=True)
+        escribir_atomico(os.path.join(self.carpeta, ARCHIVO_INDICE), contenido)
+
+    def ruta_objeto(self, sha256):
+        return os.path.join(self.carpeta_objetos, f"{sha256}.jpg")
+
+    def _entrada_vigente(self, url):
+        """Entrada del índice para url, solo si su objeto sigue en el disco."""
+        with self._lock:
+            entrada = self._indice.get(url)
+        if entrada is not None and os.path.exists(self.ruta_objeto(entrada["sha256"])):
+            return entrada
+        return None
+
+    def _descargar_objeto(self, url, entrada):
+        """
+        GET condicional de url. Devuelve (estado, sha256, bytes descargados).
+        El cuerpo se escribe a un temporal por bloques y se renombra a objetos/<sha256>.jpg.
+        """
+        encabezados = {}
+        if entrada is not None:
+            if entrada.get("etag"):
+                encabezados["If-None-Match"] = entrada["etag"]
+            if entrada.get("last_modified"):
+                encabezados["If-Modified-Since"] = entrada["last_modified"]
+
+        respuesta = self._http.request("GET", url, headers=encabezados, preload_content=False)
+        try:
+            if respuesta.status == 304 and entrada is not None:
+                return ESTADO_REVALIDADA, entrada["sha256"], 0
+            if respuesta.status != 200:
+                raise IOError(f"HTTP {respuesta.status}")
+
+            os.makedirs(self.carpeta_objetos, exist_ok=True)
+            resumen = hashlib.sha256()
+            total = 0
+            descriptor, ruta_temporal = tempfile.mkstemp(prefix=".tmp_", dir=self.carpeta_objetos)
+            try:
+                with os.fdopen(descriptor, 'wb') as f:
+                    for bloque in respuesta.stream(TAMANO_BLOQUE):
+                        resumen.update(bloque)
+                        f.write(bloque)
+                        total += len(bloque)
+                if total == 0:
+                    raise IOError("Respuesta vacía")
+                sha256 = resumen.hexdigest()
+                os.replace(ruta_temporal, self.ruta_objeto(sha256)) # Mismo contenido, mismo nombre: idempotente
+            except BaseException:
+                if os.path.exists(ruta_temporal):
+                    os.remove(ruta_temporal)
+                raise
+        finally:
+            respuesta.release_conn()
+
+        with self._lock:
+            anterior = self._indice.get(url)
+            self._indice[url] = {
+                "sha256": sha256,
+                "etag": respuesta.headers.get("ETag"),
+                "last_modified": respuesta.headers.get("Last-Modified"),
+                "bytes": total,
+            }
+            huerfano = anterior is not None and anterior["sha256"] != sha256 and not any(
+                otra["sha256"] == anterior["sha256"] for otra in self._indice.values())
+        if huerfano: # La foto de esa URL cambió y ninguna otra URL usa el contenido anterior
+            try:
+                os.remove(self.ruta_objeto(anterior["sha256"]))
+            except FileNotFoundError:
+                pass
+        return ESTADO_DESCARGADA, sha256, total
+
+    def descargar(self, url, destino):
+        """
+        Deja en destino la foto de url (enlace duro al objeto de la caché, o copia si no se puede enlazar).
+        Devuelve un informe {"url", "destino", "estado", "bytes", "ms", "sha256", "error"}; nunca lanza excepciones.
+        """
+        inicio = time.perf_counter()
+        informe = {"url": url, "destino": destino, "estado": ESTADO_FALLIDA, "bytes": 0, "sha256": None, "error": None}
+        try:
+            estado, sha256, total = self._descargar_objeto(url, self._entrada_vigente(url))
+            if os.path.exists(destino):
+                os.remove(destino)
+            try:
+                os.link(self.ruta_objeto(sha256), destino)
+            except OSError: # Otro sistema de archivos, o sin soporte de enlaces duros
+                shutil.copyfile(self.ruta_objeto(sha256), destino)
+            informe.update(estado=estado, sha256=sha256, bytes=total)
+        except Exception as e:
+            informe["error"] = str(e)
+        informe["ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        return informe
+
+    def descargar_lote(self, descargas):
+        """descargas: lista de (url, destino). Devuelve los informes en el mismo orden y guarda el índice."""
+        if not descargas:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_conexiones, len(descargas)), thread_name_prefix="descargas") as executor:
+            informes = list(executor.map(lambda descarga: self.descargar(*descarga), descargas))
+        self.guardar_indice()
+        return informes
@@ -0,0 +1,113 @@
+# backend/cache_resultados.py
+# Caché de resultados de /ia para frames repetidos: el kiosco vuelve a enviar un frame apenas termina el
+# anterior, así que la misma persona parada en la puerta se reconoce muchas veces en pocos segundos.
+# Cada cara se resume en una huella perceptual (dHash) del recorte alineado que devuelve la detección, después
+# del anti-spoofing: si en el mismo horario hay un resultado reciente con una huella casi igual, se devuelve ese
+# resultado y solo se evitan el embedding y la búsqueda. No se usa la huella del frame completo: con el mismo
+# fondo, una foto u otra persona en el mismo lugar pueden quedar a pocos bits y recibir la identidad anterior.
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+LADO_HUELLA = 16 # La huella tiene LADO_HUELLA * LADO_HUELLA bits
+
+
+def huella_gris(gris):
+    """
+    dHash de una imagen en escala de grises: se reduce a 17x16 y cada bit indica si un píxel es más claro que
+    su vecino. Devuelve un arreglo de LADO_HUELLA * LADO_HUELLA / 8 bytes.
+    """
+    reducida = cv2.resize(gris, (LADO_HUELLA + 1, LADO_HUELLA), interpolation=cv2.INTER_AREA)
+    return np.packbits(reducida[:, 1:] > reducida[:, :-1])
+
+
+def huella_perceptual(datos):
+    """
+    dHash del frame completo, decodificado en escala de grises a 1/4 de resolución (mucho más rápido que la
+    decodificación completa). Devuelve None si los bytes no son una imagen.
+    """
+    if not datos:
+        return None
+    gris = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gris is None:
+        return None
+    return huella_gris(gris)
+
+
+def huella_cara(cara):
+    """dHash de la cara recortada y alineada que devuelve la detección ("face": RGB en [0, 1])."""
+    if cara is None:
+        return None
+    return huella_gris(cv2.cvtColor(np.asarray(cara, dtype=np.float32), cv2.COLOR_RGB2GRAY))
+
+
+def distancia_hamming(huella_a, huella_b):
+    return int(np.unpackbits(np.bitwise_xor(huella_a, huella_b)).sum())
+
+
+class CacheResultados:
+    """
+    Resultados recientes por (ámbito, huella), con expiración (ttl_s) y desalojo LRU (max_entradas).
+    - ámbito: por ejemplo el id_horario, para no devolver el resultado de otro salón.
+    - max_distancia_bits: bits de diferencia tolerados entre huellas (ruido de cámara, pequeños movimientos).
+    - version: una entrada guardada con otra versión (por ejemplo, otra generación de la galería) no se usa.
+    """
+
+    def __init__(self, ttl_s=3.0, max_entradas=512, max_distancia_bits=12):
+        self.ttl_s = ttl_s
+        self.max_entradas = max_entradas
+        self.max_distancia_bits = max_distancia_bits
+        self._entradas = OrderedDict() # id -> (ámbito, instante, versión, huella, resultado)
+        self._siguiente_id = 0
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+
+    def buscar(self, ambito, huella, version=None):
+        """Resultado guardado más parecido (copia), o None."""
+        if huella is None or self.ttl_s <= 0:
+            return None
+        ahora = time.monotonic()
+        with self._lock:
+            # Las entradas están en orden LRU, no por antigüedad: se revisan todas (son pocas)
+            for id_entrada in [i for i, (_, instante, _, _, _) in self._entradas.items() if ahora - instante > self.ttl_s]:
+                del self._entradas[id_entrada]
+
+            mejor, mejor_distancia = None, self.max_distancia_bits + 1
+            for id_entrada, (ambito_entrada, _, version_entrada, huella_entrada, _) in self._entradas.items():
+                if ambito_entrada != ambito or version_entrada != version:
+                    continue
+                distancia = distancia_hamming(huella, huella_entrada)
+                if distancia < mejor_distancia:
+                    mejor, mejor_distancia = id_entrada, distancia
+
+            if mejor is None:
+                self._fallos += 1
+                return None
+            self._aciertos += 1
+            self._entradas.move_to_end(mejor)
+            return dict(self._entradas[mejor][4])
+
+    def guardar(self, ambito, huella, resultado, version=None):
+        if huella is None or self.ttl_s <= 0:
+            return
+        with self._lock:
+            self._entradas[self._siguiente_id] = (ambito, time.monotonic(), version, huella, dict(resultado))
+            self._siguiente_id += 1
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                "ttl_s": self.ttl_s,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+                "tasa_aciertos": round(self._aciertos / consultas, 4) if consultas else 0.0,
+            }
@@ -0,0 +1,113 @@
+# backend/desconocidos.py
+# Agrupa en línea los frames no clasificados: un visitante parado frente a la cámara genera decenas de frames
+# casi iguales, pero solo se guarda una imagen por persona (la de mejor calidad) junto con la cantidad de frames.
+# Los frames con cara se agrupan por embedding; los que no tienen cara (sin embedding), por huella perceptual.
+# Las cantidades se escriben en desconocidos.json, en la misma carpeta, para que el kiosco las envíe con las URLs.
+# Con varios procesos del backend cada uno agrupa sus propios frames, pero todos escriben sus cantidades en el
+# mismo desconocidos.json: cada escritura mezcla las del proceso con las del archivo, bajo un flock.
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import fcntl # Bloqueo entre procesos al escribir desconocidos.json (solo POSIX)
+except ImportError:
+    fcntl = None
+
+from archivos import escribir_atomico
+from cache_resultados import distancia_hamming
+from galeria import normalizar_l2
+
+ARCHIVO_CANTIDADES = "desconocidos.json"
+ARCHIVO_BLOQUEO = ".desconocidos.lock"
+
+
+class AgrupadorDesconocidos:
+    """
+    Grupos de desconocidos de la clase actual, cada uno con un archivo "unknown_{timestamp}.jpg" en carpeta.
+    - umbral_distancia: distancia coseno máxima entre un embedding y el centroide de un grupo para unirse a él.
+    - max_distancia_bits: bits de diferencia tolerados entre huellas perceptuales (frames sin embedding).
+    Cuando el kiosco borra las imágenes al terminar la clase, los grupos cuyo archivo ya no existe se descartan.
+    """
+
+    def __init__(self, carpeta, umbral_distancia, max_distancia_bits=12):
+        self.carpeta = carpeta
+        self.umbral_distancia = umbral_distancia
+        self.max_distancia_bits = max_distancia_bits
+        self._grupos = [] # dicts con "archivo", "centroide", "huella", "calidad" y "cantidad"
+        self._lock = threading.Lock()
+
+    def _grupo_de(self, embedding, huella):
+        if embedding is not None:
+            con_embedding = [grupo for grupo in self._grupos if grupo["centroide"] is not None]
+            if con_embedding:
+                distancias = 1.0 - np.stack([grupo["centroide"] for grupo in con_embedding]) @ embedding
+                mejor = int(np.argmin(distancias))
+                if distancias[mejor] < self.umbral_distancia:
+                    return con_embedding[mejor]
+        if huella is not None:
+            for grupo in self._grupos:
+                if grupo["huella"] is not None and distancia_hamming(huella, grupo["huella"]) <= self.max_distancia_bits:
+                    return grupo
+        return None
+
+    def registrar(self, datos, embedding=None, huella=None, calidad=0.0):
+        """
+        Agrega un frame desconocido. Si pertenece a un grupo existente solo se cuenta y, si tiene mejor calidad,
+        reemplaza la imagen del grupo; si no, se guarda como un grupo nuevo.
+        Devuelve (ruta de la imagen del grupo, cantidad de frames del grupo).
+        """
+        embedding = normalizar_l2(embedding)[0] if embedding is not None else None
+        with self._lock:
+            os.makedirs(self.carpeta, exist_ok=True)
+            self._grupos = [grupo for grupo in self._grupos if os.path.exists(os.path.join(self.carpeta, grupo["archivo"]))]
+
+            grupo = self._grupo_de(embedding, huella)
+            if grupo is None:
+                # Usar un nombre único para la imagen guardada
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                grupo = {"archivo": f"unknown_{timestamp}.jpg", "centroide": embedding, "huella": huella,
+                         "calidad": calidad, "cantidad": 1}
+                self._grupos.append(grupo)
+                escribir_atomico(os.path.join(self.carpeta, grupo["archivo"]), datos)
+            else:
+                grupo["cantidad"] += 1
+                if embedding is not None:
+                    # Centroide como media móvil de los embeddings del grupo
+                    anterior = grupo["centroide"] if grupo["centroide"] is not None else embedding
+                    grupo["centroide"] = normalizar_l2(anterior * (grupo["cantidad"] - 1) + embedding)[0]
+                if huella is not None:
+                    grupo["huella"] = huella # La persona se mueve de a poco: comparar con el último frame
+                if calidad > grupo["calidad"]:
+                    grupo["calidad"] = calidad
+                    escribir_atomico(os.path.join(self.carpeta, grupo["archivo"]), datos)
+
+            self._escribir_cantidades()
+            return os.path.join(self.carpeta, grupo["archivo"]), grupo["cantidad"]
+
+    def _escribir_cantidades(self):
+        """
+        Actualiza en desconocidos.json las cantidades de los grupos de este proceso, conservando las de los demás
+        procesos (salvo las de imágenes que ya no existen). El flock evita que dos procesos mezclen a la vez.
+        """
+        ruta = os.path.join(self.carpeta, ARCHIVO_CANTIDADES)
+        bloqueo = None
+        if fcntl is not None:
+            bloqueo = open(os.path.join(self.carpeta, ARCHIVO_BLOQUEO), 'a')
+            fcntl.flock(bloqueo, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(ruta, encoding='utf-8') as f:
+                    cantidades = json.load(f)
+            except (OSError, ValueError):
+                cantidades = {}
+            cantidades = {archivo: cantidad for archivo, cantidad in cantidades.items()
+                          if os.path.exists(os.path.join(self.carpeta, archivo))}
+            cantidades.update({g["archivo"]: g["cantidad"] for g in self._grupos})
+            escribir_atomico(ruta, json.dumps(cantidades).encode('utf-8'))
+        finally:
+            if bloqueo is not None:
+                bloqueo.close() # Cerrar el archivo libera el flock
@@ -0,0 +1,116 @@
+# backend/exportar_onnx.py
+# Exporta el modelo de reconocimiento de DeepFace (MODEL_NAME) a ONNX para ejecutarlo con ONNX Runtime en CPU
+# (MOTOR_INFERENCIA = 'onnx'), opcionalmente cuantizado a int8 (cuantización dinámica de pesos), y comprueba
+# que los embeddings de ambos motores coinciden antes de usarlo.
+# tf2onnx solo hace falta para exportar; como fija versiones de protobuf distintas a las del backend,
+# conviene instalarlo en un entorno aparte:  pip install tf2onnx
+#   python exportar_onnx.py --modelo VGG-Face --int8 --imagenes imagenes_temporales
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from modelos import MotorReconocimiento
+
+
+def exportar(model_name, ruta_salida, opset=13):
+    """Convierte el modelo Keras que usa DeepFace en un grafo ONNX con lote dinámico."""
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+
+    modelo = DeepFace.build_model(model_name)
+    alto, ancho = modelo.input_shape
+    firma = (tf.TensorSpec((None, alto, ancho, 3), tf.float32, name="entrada"),)
+    funcion = tf.function(lambda entrada: modelo.model(entrada, training=False))
+    os.makedirs(os.path.dirname(ruta_salida) or ".", exist_ok=True)
+    tf2onnx.convert.from_function(funcion, input_signature=firma, opset=opset, output_path=ruta_salida)
+    return ruta_salida
+
+
+def cuantizar_int8(ruta_onnx, ruta_salida):
+    """Cuantización dinámica: pesos en int8, activaciones cuantizadas en tiempo de ejecución."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(ruta_onnx, ruta_salida, weight_type=QuantType.QInt8)
+    return ruta_salida
+
+
+def caras_de_prueba(motor, carpeta, cantidad, semilla=0):
+    """Caras alineadas de las imágenes de carpeta (como las de la galería) o, si no hay, caras aleatorias."""
+    caras = []
+    if carpeta and os.path.isdir(carpeta):
+        for nombre_archivo in sorted(os.listdir(carpeta)):
+            if len(caras) >= cantidad:
+                break
+            try:
+                caras.append(motor.extraer_caras(os.path.join(carpeta, nombre_archivo), anti_spoofing=False)[0]["face"])
+            except Exception as e:
+                print(f"Se omite {nombre_archivo}: {e}")
+    if not caras:
+        rng = np.random.default_rng(semilla)
+        caras = list(rng.random((cantidad, 224, 224, 3), dtype=np.float32))
+    return caras
+
+
+def medir(motor, caras):
+    """Embeddings de las caras (de una en una, como /ia) y ms por cara."""
+    motor.embeber_caras(caras[:1]) # Calentamiento
+    inicio = time.perf_counter()
+    embeddings = np.concatenate([motor.embeber_caras([cara]) for cara in caras])
+    return embeddings, (time.perf_counter() - inicio) * 1000 / len(caras)
+
+
+def comprobar_paridad(model_name, detector_backend, rutas_onnx, carpeta_imagenes, cantidad, tolerancia):
+    """
+    Compara los embeddings de TensorFlow con los de cada grafo ONNX (similitud coseno por cara).
+    Devuelve True si la mínima similitud de todos los grafos es al menos tolerancia.
+    """
+    referencia = MotorReconocimiento(model_name, detector_backend)
+    caras = caras_de_prueba(referencia, carpeta_imagenes, cantidad)
+    embeddings_tf, ms_tf = medir(referencia, caras)
+    print(f"tensorflow: {ms_tf:.2f} ms/cara ({len(caras)} caras)")
+
+    correcto = True
+    for ruta_onnx in rutas_onnx:
+        embeddings_onnx, ms_onnx = medir(MotorReconocimiento(model_name, detector_backend, ruta_onnx=ruta_onnx), caras)
+        similitudes = np.sum(embeddings_tf * embeddings_onnx, axis=1) # Ambos normalizados (L2)
+        print(f"{ruta_onnx}: {ms_onnx:.2f} ms/cara, similitud coseno con tensorflow "
+              f"mín {similitudes.min():.6f} media {similitudes.mean():.6f}")
+        correcto = correcto and bool(similitudes.min() >= tolerancia)
+    return correcto
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta el modelo de reconocimiento a ONNX y comprueba la paridad.")
+    parser.add_argument("--modelo", default="VGG-Face")
+    parser.add_argument("--detector", default="opencv")
+    parser.add_argument("--salida", default=None, help="Por defecto modelos_onnx/<modelo>.onnx")
+    parser.add_argument("--int8", action="store_true", help="Genera también <salida>-int8.onnx")
+    parser.add_argument("--imagenes", default=None, help="Carpeta con fotos para la comprobación de paridad")
+    parser.add_argument("--caras", type=int, default=16)
+    parser.add_argument("--tolerancia", type=float, default=0.999, help="Similitud coseno mínima aceptada")
+    parser.add_argument("--tolerancia-int8", type=float, default=0.99)
+    args = parser.parse_args()
+
+    ruta_salida = args.salida or os.path.join("modelos_onnx", f"{args.modelo}.onnx")
+    print(f"Exportando {args.modelo} a {ruta_salida}...")
+    exportar(args.modelo, ruta_salida)
+
+    correcto = comprobar_paridad(args.modelo, args.detector, [ruta_salida], args.imagenes, args.caras, args.tolerancia)
+    if args.int8:
+        ruta_int8 = f"{os.path.splitext(ruta_salida)[0]}-int8.onnx"
+        print(f"Cuantizando a int8 en {ruta_int8}...")
+        cuantizar_int8(ruta_salida, ruta_int8)
+        correcto = comprobar_paridad(args.modelo, args.detector, [ruta_int8], args.imagenes, args.caras,
+                                     args.tolerancia_int8) and correcto
+
+    if not correcto:
+        print("Los embeddings de ONNX no coinciden con los de TensorFlow dentro de la tolerancia.")
+        sys.exit(1)
+    print("Paridad comprobada.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,483 @@
+# backend/galeria.py
+# Índice residente en memoria con los embeddings de las caras conocidas (galería).
+# Reemplaza el escaneo de carpeta + pickle + DataFrame que hace DeepFace.find en cada frame:
+# los embeddings se calculan una sola vez y la búsqueda es un único producto matricial.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+
+try:
+    import fcntl # Bloqueo entre procesos al publicar la galería compartida (solo POSIX)
+except ImportError:
+    fcntl = None
+
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png')
+
+
+def normalizar_l2(matriz):
+    """
+    Convierte a float32 y normaliza cada fila a norma 1.
+    Acepta un vector (D,) o una matriz (N, D) y siempre devuelve una matriz (N, D).
+    """
+    matriz = np.asarray(matriz, dtype=np.float32)
+    if matriz.ndim == 1:
+        matriz = matriz[np.newaxis, :]
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0 # Evita dividir entre cero con vectores vacíos
+    return matriz / normas
+
+
+def serializar_embedding(embedding, formato='float16'):
+    """Bytes compactos de un embedding para guardarlo en la base de datos (float16 ocupa la mitad que float32)."""
+    return np.asarray(embedding, dtype=formato).tobytes()
+
+
+def deserializar_embedding(datos, formato='float16'):
+    """Inversa de serializar_embedding: devuelve un vector float32."""
+    return np.frombuffer(datos, dtype=formato).astype(np.float32)
+
+
+class IndiceGaleria:
+    """
+    Galería de identidades conocidas.
+    - embeddings: matriz NxD float32 con los embeddings normalizados (L2).
+    - ids / roles: arreglos paralelos con el id (str) y rol ("alumno"/"profesor") de cada fila.
+    - claves / huellas / fuentes (opcionales): por fila, la clave "persona_{id}_tipo_{tipo}", la huella
+      (SHA-1) de la foto embebida y la URL de origen; permiten actualizar la galería de forma incremental.
+    - normalizados: si es True, embeddings se usa tal cual, sin copiarlo (por ejemplo, un np.memmap de solo lectura).
+    Con los vectores normalizados la similitud coseno es un producto punto, así que buscar
+    contra toda la galería es una sola multiplicación matriz-vector.
+    """
+
+    def __init__(self, embeddings=None, ids=None, roles=None, metrica='cosine', claves=None, huellas=None, fuentes=None,
+                 normalizados=False):
+        if metrica not in ('cosine', 'euclidean_l2'):
+            raise ValueError(f"Métrica no soportada por el índice de galería: {metrica}")
+        self.metrica = metrica
+
+        if embeddings is None or len(embeddings) == 0:
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        elif normalizados:
+            self.embeddings = embeddings
+        else:
+            self.embeddings = normalizar_l2(embeddings)
+        self.ids = np.asarray(ids if ids is not None else [], dtype=object)
+        self.roles = np.asarray(roles if roles is not None else [], dtype=object)
+
+        if not (len(self.embeddings) == len(self.ids) == len(self.roles)):
+            raise ValueError("embeddings, ids y roles deben tener la misma longitud.")
+
+        n = len(self.ids)
+        self.claves = list(claves) if claves is not None else [None] * n
+        self.huellas = list(huellas) if huellas is not None else [None] * n
+        self.fuentes = list(fuentes) if fuentes is not None else [None] * n
+        self._posiciones = {clave: i for i, clave in enumerate(self.claves) if clave is not None}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dimension(self):
+        return self.embeddings.shape[1] if len(self) else 0
+
+    def identidad(self, posicion):
+        """Devuelve (user_id, user_rol) de la fila indicada."""
+        return self.ids[posicion], self.roles[posicion]
+
+    def posicion_de(self, clave):
+        """Fila de la clave "persona_{id}_tipo_{tipo}", o None si no está en la galería."""
+        return self._posiciones.get(clave)
+
+    def posiciones_de(self, claves):
+        """Filas (ordenadas) de las claves dadas que están en la galería; sirve como máscara de candidatos."""
+        posiciones = [self._posiciones[clave] for clave in claves if clave in self._posiciones]
+        return np.asarray(sorted(posiciones), dtype=np.int64)
+
+    def fuente(self, clave):
+        """URL de origen con la que se embebió la foto de la clave (None si no se conoce)."""
+        posicion = self.posicion_de(clave)
+        return self.fuentes[posicion] if posicion is not None else None
+
+    def _similitud_a_distancia(self, similitudes):
+        if self.metrica == 'euclidean_l2':
+            # Para vectores unitarios: ||a - b|| = sqrt(2 - 2 cos)
+            return np.sqrt(np.maximum(2.0 - 2.0 * similitudes, 0.0))
+        return 1.0 - similitudes
+
+    def buscar_lote(self, consultas, candidatos=None):
+        """
+        Busca el vecino más cercano de cada consulta.
+        - candidatos (opcional): filas a las que se restringe la búsqueda (ver posiciones_de).
+        Devuelve (posiciones, distancias) como arreglos de longitud M.
+        Si no hay filas donde buscar las posiciones son -1 y las distancias infinitas.
+        """
+        consultas = normalizar_l2(consultas)
+        if len(self) == 0 or (candidatos is not None and len(candidatos) == 0):
+            return (np.full(len(consultas), -1, dtype=np.int64),
+                    np.full(len(consultas), np.inf, dtype=np.float32))
+        if consultas.shape[1] != self.dimension:
+            raise ValueError(f"Dimensión de consulta {consultas.shape[1]} distinta a la de la galería {self.dimension}.")
+
+        matriz = self.embeddings if candidatos is None else self.embeddings[candidatos]
+        similitudes = consultas @ matriz.T # (M, N) o (M, K) con K candidatos
+        posiciones = np.argmax(similitudes, axis=1)
+        mejores = similitudes[np.arange(len(consultas)), posiciones]
+        if candidatos is not None:
+            posiciones = np.asarray(candidatos)[posiciones]
+        return posiciones, self._similitud_a_distancia(mejores)
+
+    def arreglos_auxiliares(self):
+        """Arreglos propios del tipo de índice que se publican junto a la matriz (ver publicar_indice)."""
+        return {}
+
+    def buscar(self, embedding, candidatos=None):
+        """Busca una sola consulta. Devuelve (posicion, distancia); posicion es None si no hay dónde buscar."""
+        posiciones, distancias = self.buscar_lote(embedding, candidatos)
+        if posiciones[0] < 0:
+            return None, float('inf')
+        return int(posiciones[0]), float(distancias[0])
+
+
+def huella_archivo(ruta):
+    """SHA-1 del contenido de un archivo; identifica si una foto cambió sin volver a embeberla."""
+    sha = hashlib.sha1()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 16), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def entradas_desde_carpeta(ruta_carpeta, parsear_nombre):
+    """
+    Lista las imágenes "persona_{id}_tipo_{tipo}.jpg" de una carpeta como entradas para sincronizar_indice.
+    parsear_nombre(nombre_archivo) debe devolver (user_id, user_rol) o (None, None); las que no se
+    pueden parsear se omiten.
+    """
+    entradas = []
+    if not os.path.isdir(ruta_carpeta):
+        return entradas
+
+    for nombre_archivo in sorted(os.listdir(ruta_carpeta)):
+        if not nombre_archivo.lower().endswith(EXTENSIONES_IMAGEN):
+            continue
+        user_id, user_rol = parsear_nombre(nombre_archivo)
+        if user_id is None or user_rol is None:
+            continue
+        entradas.append({
+            "clave": os.path.splitext(nombre_archivo)[0],
+            "id": user_id,
+            "rol": user_rol,
+            "ruta": os.path.join(ruta_carpeta, nombre_archivo),
+            "fuente": None
+        })
+    return entradas
+
+
+def sincronizar_indice(indice_actual, entradas, representar, metrica='cosine', conservar=()):
+    """
+    Construye un nuevo IndiceGaleria con las entradas dadas (dicts con "clave", "id", "rol", "ruta" y "fuente").
+    - Si la clave ya estaba en indice_actual con la misma huella de archivo, se reutiliza su embedding.
+    - Una entrada con "embedding" (por ejemplo, leído de la base de datos) se usa tal cual, sin leer ningún archivo.
+    - Una entrada con "ruta" None reutiliza la fila existente sin leer ningún archivo, siempre que su
+      "fuente" (URL de la foto) sea la misma con la que se embebió.
+    - Solo las fotos nuevas o modificadas pasan por representar(ruta), que debe lanzar ValueError si no hay rostro.
+    - Las claves de conservar que están en indice_actual se copian tal cual, sin leer su archivo.
+    - El resto de claves de indice_actual quedan fuera del nuevo índice.
+    Devuelve (nuevo_indice, resumen) con los contadores "cargados", "reutilizados", "embebidos", "fallidos" y
+    "eliminados", y en "errores" una lista {"clave", "ruta", "error"} con el motivo de cada fallida.
+    """
+    embeddings, ids, roles, claves, huellas, fuentes = [], [], [], [], [], []
+    resumen = {"cargados": 0, "reutilizados": 0, "embebidos": 0, "fallidos": 0, "eliminados": 0, "errores": []}
+
+    def fallida(entrada, error):
+        resumen["fallidos"] += 1
+        resumen["errores"].append({"clave": entrada["clave"], "ruta": entrada.get("ruta"), "error": error})
+
+    claves_entradas = {entrada["clave"] for entrada in entradas}
+    for clave in conservar:
+        posicion = indice_actual.posicion_de(clave)
+        if posicion is None or clave in claves_entradas:
+            continue
+        embeddings.append(indice_actual.embeddings[posicion])
+        ids.append(indice_actual.ids[posicion])
+        roles.append(indice_actual.roles[posicion])
+        claves.append(clave)
+        huellas.append(indice_actual.huellas[posicion])
+        fuentes.append(indice_actual.fuentes[posicion])
+
+    for entrada in entradas:
+        posicion = indice_actual.posicion_de(entrada["clave"])
+
+        if entrada.get("embedding") is not None:
+            huella = None
+            embedding = entrada["embedding"]
+            resumen["cargados"] += 1
+        elif entrada.get("ruta") is None:
+            # Sin archivo: solo se puede reutilizar la fila existente si la foto de origen no cambió
+            if posicion is None or not entrada.get("fuente") or indice_actual.fuentes[posicion] != entrada["fuente"]:
+                fallida(entrada, "Sin archivo ni embedding de la foto actual")
+                continue
+            huella = indice_actual.huellas[posicion]
+            embedding = indice_actual.embeddings[posicion]
+            resumen["reutilizados"] += 1
+        else:
+            try:
+                huella = huella_archivo(entrada["ruta"])
+            except OSError as e:
+                fallida(entrada, f"No se pudo leer el archivo: {e}")
+                continue
+
+            if posicion is not None and indice_actual.huellas[posicion] == huella:
+                embedding = indice_actual.embeddings[posicion]
+                resumen["reutilizados"] += 1
+            else:
+                try:
+                    embedding = representar(entrada["ruta"])
+                except ValueError as ve:
+                    fallida(entrada, f"No se pudo obtener el embedding: {ve}")
+                    continue
+                resumen["embebidos"] += 1
+
+        embeddings.append(embedding)
+        ids.append(entrada["id"])
+        roles.append(entrada["rol"])
+        claves.append(entrada["clave"])
+        huellas.append(huella)
+        fuentes.append(entrada.get("fuente"))
+
+    vigentes = set(claves)
+    resumen["eliminados"] = sum(1 for clave in indice_actual.claves if clave is not None and clave not in vigentes)
+
+    nuevo_indice = IndiceGaleria(embeddings, ids, roles, metrica=metrica, claves=claves, huellas=huellas, fuentes=fuentes)
+    return nuevo_indice, resumen
+
+
+ARCHIVO_METADATOS = "galeria.json"
+
+
+def publicar_indice(indice, ruta_carpeta, generacion, rosters):
+    """
+    Guarda el índice en ruta_carpeta para que otros procesos lo mapeen en memoria (ver cargar_indice_publicado):
+    - la matriz de embeddings y los arreglos auxiliares del índice, cada uno en un .npy nuevo con nombre único;
+    - ids, roles, claves, huellas, fuentes, generación y rosters, en galeria.json, que apunta al .npy.
+    galeria.json se reemplaza con os.replace, así que un lector ve la generación anterior o la nueva completa.
+    Los .npy de generaciones anteriores se borran salvo los de la última (un lector puede estar abriéndolos).
+    """
+    os.makedirs(ruta_carpeta, exist_ok=True)
+
+    def guardar_arreglo(arreglo):
+        descriptor, ruta_arreglo = tempfile.mkstemp(prefix="galeria_", suffix=".npy", dir=ruta_carpeta)
+        with os.fdopen(descriptor, 'wb') as f:
+            np.save(f, np.ascontiguousarray(arreglo))
+        return os.path.basename(ruta_arreglo)
+
+    archivo_matriz = None
+    auxiliares = {}
+    if len(indice):
+        archivo_matriz = guardar_arreglo(np.asarray(indice.embeddings, dtype=np.float32))
+        auxiliares = {nombre: guardar_arreglo(arreglo) for nombre, arreglo in indice.arreglos_auxiliares().items()}
+
+    metadatos = {
+        "generacion": generacion,
+        "metrica": indice.metrica,
+        "matriz": archivo_matriz,
+        "auxiliares": auxiliares,
+        "ids": [str(user_id) for user_id in indice.ids],
+        "roles": [str(rol) for rol in indice.roles],
+        "claves": indice.claves,
+        "huellas": indice.huellas,
+        "fuentes": indice.fuentes,
+        "rosters": {nombre: [instante, personas] for nombre, (instante, personas) in rosters.items()},
+    }
+    ruta_metadatos = os.path.join(ruta_carpeta, ARCHIVO_METADATOS)
+    anterior = leer_metadatos(ruta_carpeta)
+    descriptor, ruta_temporal = tempfile.mkstemp(prefix=".galeria_", suffix=".json", dir=ruta_carpeta)
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+        json.dump(metadatos, f)
+    os.replace(ruta_temporal, ruta_metadatos)
+
+    conservar = {archivo_matriz, *auxiliares.values()}
+    if anterior:
+        conservar |= {anterior.get("matriz"), *anterior.get("auxiliares", {}).values()}
+    for nombre_archivo in os.listdir(ruta_carpeta):
+        if nombre_archivo.startswith("galeria_") and nombre_archivo.endswith(".npy") and nombre_archivo not in conservar:
+            try:
+                os.remove(os.path.join(ruta_carpeta, nombre_archivo))
+            except OSError:
+                pass
+
+
+def leer_metadatos(ruta_carpeta):
+    """Contenido de galeria.json, o None si todavía no se publicó ninguna galería."""
+    try:
+        with open(os.path.join(ruta_carpeta, ARCHIVO_METADATOS), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def cargar_indice_publicado(ruta_carpeta):
+    """
+    Abre la galería publicada en ruta_carpeta con la matriz mapeada en memoria en modo solo lectura:
+    no se copia nada al proceso, las páginas se comparten con los demás procesos a través de la caché del sistema.
+    Devuelve (indice, generacion, rosters, auxiliares) o None si no hay galería publicada;
+    auxiliares son los arreglos de arreglos_auxiliares(), también mapeados.
+    """
+    metadatos = leer_metadatos(ruta_carpeta)
+    if metadatos is None:
+        return None
+    if metadatos["matriz"] is None:
+        indice = IndiceGaleria(metrica=metadatos["metrica"])
+    else:
+        embeddings = np.load(os.path.join(ruta_carpeta, metadatos["matriz"]), mmap_mode='r')
+        indice = IndiceGaleria(embeddings, metadatos["ids"], metadatos["roles"], metrica=metadatos["metrica"],
+                               claves=metadatos["claves"], huellas=metadatos["huellas"], fuentes=metadatos["fuentes"],
+                               normalizados=True)
+    auxiliares = {
+        nombre: np.load(os.path.join(ruta_carpeta, archivo), mmap_mode='r')
+        for nombre, archivo in metadatos.get("auxiliares", {}).items()
+    }
+    rosters = {
+        nombre: (instante, personas if isinstance(personas, dict) else dict.fromkeys(personas)) # Antes: lista de claves
+        for nombre, (instante, personas) in metadatos["rosters"].items()
+    }
+    return indice, metadatos["generacion"], rosters, auxiliares
+
+
+class GaleriaVersionada:
+    """
+    Galería con doble buffer. Las búsquedas toman la generación publicada con actual() sin ningún lock.
+    Una actualización construye la siguiente generación aparte (reutilizando embeddings de la actual) y la
+    publica con un único cambio de referencia; las búsquedas en curso terminan contra la generación anterior.
+    Cada generación es la unión de los rosters vigentes (uno por horario, más la carpeta al arrancar), para que
+    refrescar el roster de un salón no quite de la galería a las personas de otro salón.
+    Con ruta_compartida, cada generación se publica en disco (ver publicar_indice) y todos los procesos que usan
+    la misma carpeta mapean la misma matriz: un proceso nuevo busca de inmediato sin cargar ni embeber nada.
+    fabrica_indice(indice, anterior, auxiliares) (opcional) convierte cada generación en el tipo de índice
+    con el que se busca (por ejemplo IndiceIVF); anterior es la generación previa y auxiliares los arreglos
+    publicados por ese tipo de índice ({} si no hay).
+    """
+
+    def __init__(self, metrica='cosine', ttl_roster_s=None, ruta_compartida=None, fabrica_indice=None):
+        self.metrica = metrica
+        self.fabrica_indice = fabrica_indice
+        self.ttl_roster_s = ttl_roster_s # Un roster que no se refresca en este tiempo deja de ser vigente
+        self.ruta_compartida = ruta_compartida
+        self.generacion = 0
+        self._actual = IndiceGaleria(metrica=metrica)
+        self._rosters = {} # nombre -> (instante de la última actualización, {clave: fuente} de las personas pedidas)
+        self._lock_actualizacion = threading.Lock() # Serializa a quienes construyen, nunca a quienes buscan
+        self._lock_carga = threading.Lock()
+        self._firma_publicada = None # (mtime, inodo) de galeria.json cargado
+
+    def actual(self):
+        if self.ruta_compartida:
+            self._cargar_publicada()
+        return self._actual
+
+    @property
+    def construida(self):
+        if self.ruta_compartida:
+            self._cargar_publicada()
+        return self.generacion > 0
+
+    def roster_vigente(self, nombre, personas):
+        """
+        True si el roster `nombre` de la generación publicada se preparó, sin expirar, con exactamente esas
+        personas ({clave: fuente}). Las fotos que fallaron con esa misma fuente no se reintentan hasta que
+        cambie la URL o expire el roster.
+        """
+        self.actual() # Con ruta_compartida, mapea la última generación publicada
+        roster = self._rosters.get(nombre)
+        if roster is None:
+            return False
+        instante, personas_roster = roster
+        if self.ttl_roster_s is not None and time.time() - instante >= self.ttl_roster_s:
+            return False
+        return personas_roster == personas
+
+    def _cargar_publicada(self):
+        """Si otro proceso publicó una generación nueva en ruta_compartida, la mapea (un os.stat por llamada)."""
+        try:
+            estado = os.stat(os.path.join(self.ruta_compartida, ARCHIVO_METADATOS))
+        except FileNotFoundError:
+            return
+        firma = (estado.st_mtime_ns, estado.st_ino)
+        if firma == self._firma_publicada:
+            return
+        with self._lock_carga:
+            if firma == self._firma_publicada:
+                return
+            publicada = cargar_indice_publicado(self.ruta_compartida)
+            if publicada is not None and publicada[1] >= self.generacion:
+                indice, generacion, rosters, auxiliares = publicada
+                if self.fabrica_indice is not None:
+                    indice = self.fabrica_indice(indice, self._actual, auxiliares)
+                self._actual, self.generacion, self._rosters = indice, generacion, rosters
+            self._firma_publicada = firma
+
+    def _bloquear_entre_procesos(self):
+        """Abre y bloquea (flock) el archivo de bloqueo de la carpeta compartida; devuelve el archivo o None."""
+        if not self.ruta_compartida or fcntl is None:
+            return None
+        os.makedirs(self.ruta_compartida, exist_ok=True)
+        archivo = open(os.path.join(self.ruta_compartida, ".galeria.lock"), 'a')
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        return archivo
+
+    def actualizar_roster(self, nombre, entradas, representar, personas=None):
+        """
+        Reemplaza las entradas del roster `nombre`, construye la nueva generación y la publica.
+        personas ({clave: fuente}) son las personas pedidas para el roster, incluidas las que no tienen entrada
+        porque su foto falló; por defecto, las de entradas. Es lo que compara roster_vigente.
+        Devuelve (indice_publicado, resumen) como sincronizar_indice.
+        """
+        if personas is None:
+            personas = {entrada["clave"]: entrada.get("fuente") for entrada in entradas}
+        with self._lock_actualizacion:
+            bloqueo = self._bloquear_entre_procesos()
+            try:
+                return self._actualizar_roster(nombre, entradas, representar, personas)
+            finally:
+                if bloqueo is not None:
+                    bloqueo.close() # Cerrar el archivo libera el flock
+
+    def _actualizar_roster(self, nombre, entradas, representar, personas):
+        if self.ruta_compartida:
+            self._cargar_publicada() # Partir de la última generación, aunque la haya publicado otro proceso
+        base = self._actual
+        ahora = time.time() # Reloj de pared: los instantes se comparten entre procesos
+        rosters = {
+            otro: (instante, personas_otro) for otro, (instante, personas_otro) in self._rosters.items()
+            if otro != nombre and (self.ttl_roster_s is None or ahora - instante < self.ttl_roster_s)
+        }
+        conservar = set()
+        for _, personas_otro in rosters.values():
+            conservar.update(personas_otro)
+
+        nuevo, resumen = sincronizar_indice(base, entradas, representar, metrica=self.metrica, conservar=conservar)
+        if self.fabrica_indice is not None:
+            nuevo = self.fabrica_indice(nuevo, base, {})
+
+        rosters[nombre] = (ahora, dict(personas))
+        generacion = self.generacion + 1
+        if self.ruta_compartida:
+            # Los demás procesos (y este, en la próxima llamada a actual()) la mapean desde el disco
+            publicar_indice(nuevo, self.ruta_compartida, generacion, rosters)
+        self._rosters = rosters
+        self._actual = nuevo # Publicación atómica: una sola asignación de referencia
+        self.generacion = generacion
+        return nuevo, resumen
+
+
+def construir_indice_desde_carpeta(ruta_carpeta, representar, parsear_nombre, metrica='cosine'):
+    """
+    Construye un IndiceGaleria desde cero a partir de las imágenes "persona_{id}_tipo_{tipo}.jpg" de una carpeta.
+    Las imágenes sin identidad válida o sin rostro detectable se omiten.
+    """
+    entradas = entradas_desde_carpeta(ruta_carpeta, parsear_nombre)
+    return sincronizar_indice(IndiceGaleria(metrica=metrica), entradas, representar, metrica=metrica)[0]
@@ -0,0 +1,182 @@
+# backend/indice_compacto.py
+# Índice con embeddings compactos: proyección PCA a pocas dimensiones + cuantización float16 o int8.
+# La búsqueda recorre los códigos compactos y, opcionalmente, reordena los top-k mejores con el
+# producto punto exacto contra la matriz completa, así que la distancia devuelta (y la decisión frente a
+# DISTANCE_THRESHOLD) es la exacta. Con la galería compartida (RUTA_GALERIA_COMPARTIDA) la matriz completa
+# queda mapeada desde el disco y solo se leen las filas que se reordenan; sin ella, la matriz completa sigue en
+# memoria (la galería la usa para armar la siguiente generación) y los códigos se suman a ella.
+import numpy as np
+
+from galeria import IndiceGaleria, normalizar_l2
+
+FILAS_POR_BLOQUE = 8192 # Filas por multiplicación al proyectar, para acotar la memoria temporal
+FILAS_MUESTRA_PCA = 20000 # Filas con que se entrena la PCA
+CRECIMIENTO_REENTRENAR = 2 # La PCA se reentrena cuando la galería supera este múltiplo de sus filas de entrenamiento
+CUANTIZACIONES = ('float16', 'int8')
+
+
+def entrenar_pca(matriz, dimension, filas_muestra=FILAS_MUESTRA_PCA, iteraciones=2, semilla=0):
+    """
+    PCA aleatorizado (Halko et al.) sobre una muestra de filas de matriz.
+    Devuelve (media (D,), proyeccion (D, d)) en float32; d puede ser menor que dimension si hay pocas filas.
+    """
+    rng = np.random.default_rng(semilla)
+    filas = np.sort(rng.choice(len(matriz), min(len(matriz), filas_muestra), replace=False))
+    muestra = np.asarray(matriz[filas], dtype=np.float32)
+    media = muestra.mean(axis=0)
+    muestra -= media
+
+    dimension = min(dimension, muestra.shape[0], muestra.shape[1])
+    aleatoria = rng.standard_normal((muestra.shape[1], min(dimension + 10, muestra.shape[1])), dtype=np.float32)
+    base, _ = np.linalg.qr(muestra @ aleatoria)
+    for _ in range(iteraciones): # Iteraciones de potencia: separan mejor las componentes principales
+        base, _ = np.linalg.qr(muestra @ (muestra.T @ base))
+    _, _, vt = np.linalg.svd(base.T @ muestra, full_matrices=False)
+    return media.astype(np.float32), np.ascontiguousarray(vt[:dimension].T, dtype=np.float32)
+
+
+class IndiceCompacto(IndiceGaleria):
+    """
+    IndiceGaleria que busca sobre códigos compactos.
+    - dimension_reducida: dimensiones de la proyección PCA (0 o >= D: sin PCA, solo cuantización).
+    - cuantizacion: 'float16' (2 bytes por dimensión) o 'int8' (1 byte, con una escala por dimensión).
+    - reordenar: top-k que se reordenan con la distancia exacta (0: se devuelve la distancia aproximada).
+    - media / proyeccion / codigos / escala (opcionales): ya calculados, por ejemplo al mapear una galería publicada.
+      Con media y proyeccion y sin codigos, solo se proyectan y cuantizan las filas.
+    - filas_pca: filas con que se entrenó la PCA recibida (para decidir cuándo reentrenarla).
+    """
+
+    def __init__(self, embeddings=None, ids=None, roles=None, metrica='cosine', claves=None, huellas=None, fuentes=None,
+                 normalizados=False, dimension_reducida=128, cuantizacion='int8', reordenar=10,
+                 media=None, proyeccion=None, codigos=None, escala=None, filas_pca=0):
+        super().__init__(embeddings, ids, roles, metrica=metrica, claves=claves, huellas=huellas, fuentes=fuentes,
+                         normalizados=normalizados)
+        if cuantizacion not in CUANTIZACIONES:
+            raise ValueError(f"Cuantización no soportada: {cuantizacion}")
+        self.cuantizacion = cuantizacion
+        self.reordenar = max(0, int(reordenar))
+
+        if len(self) == 0:
+            self.media, self.proyeccion = np.zeros(0, dtype=np.float32), None
+            self.codigos, self.escala = np.zeros((0, 0), dtype=cuantizacion), np.zeros(0, dtype=np.float32)
+            self.filas_pca = 0
+            return
+
+        self.filas_pca = int(filas_pca)
+        if media is None:
+            if dimension_reducida and dimension_reducida < self.dimension:
+                media, proyeccion = entrenar_pca(self.embeddings, dimension_reducida)
+                self.filas_pca = min(len(self), FILAS_MUESTRA_PCA)
+            else:
+                media, proyeccion = np.asarray(self.embeddings, dtype=np.float32).mean(axis=0), None
+        self.media = np.asarray(media, dtype=np.float32)
+        self.proyeccion = None if proyeccion is None or len(proyeccion) == 0 else np.asarray(proyeccion, dtype=np.float32)
+
+        if codigos is None:
+            codigos, escala = self._cuantizar(self._proyectar_filas(self.embeddings))
+        self.codigos = np.asarray(codigos)
+        self.escala = np.asarray(escala, dtype=np.float32)
+
+    @classmethod
+    def reconstruir(cls, indice, anterior=None, auxiliares=None, dimension_reducida=128, cuantizacion='int8', reordenar=10):
+        """
+        Fábrica para GaleriaVersionada: convierte una generación de la galería en IndiceCompacto.
+        - Con los códigos publicados (auxiliares) no se calcula nada.
+        - Si la generación anterior era compacta con la misma dimensión, se reutiliza su PCA y solo se cuantizan las
+          filas, salvo que la PCA haya quedado chica para la galería (ver pca_reutilizable).
+        """
+        auxiliares = auxiliares or {}
+        precalculado = {}
+        if len(auxiliares.get("codigos", ())) == len(indice) and "media" in auxiliares:
+            precalculado = {nombre: auxiliares[nombre] for nombre in ("media", "proyeccion", "codigos", "escala")}
+            if len(auxiliares.get("filas_pca", ())):
+                precalculado["filas_pca"] = int(auxiliares["filas_pca"][0])
+        elif cls.pca_reutilizable(anterior, indice, dimension_reducida):
+            precalculado = {"media": anterior.media, "proyeccion": anterior.proyeccion, "filas_pca": anterior.filas_pca}
+        return cls(indice.embeddings, indice.ids, indice.roles, metrica=indice.metrica, claves=indice.claves,
+                   huellas=indice.huellas, fuentes=indice.fuentes, normalizados=True, dimension_reducida=dimension_reducida,
+                   cuantizacion=cuantizacion, reordenar=reordenar, **precalculado)
+
+    @staticmethod
+    def pca_reutilizable(anterior, indice, dimension_reducida):
+        """
+        True si la PCA de anterior sirve para indice: misma dimensión y, con PCA, una proyección tan ancha como la
+        pedida (entrenar_pca la acota a las filas de la primera galería) y entrenada con suficientes filas.
+        """
+        if not isinstance(anterior, IndiceCompacto) or len(anterior.media) != indice.dimension:
+            return False
+        sin_pca = not dimension_reducida or dimension_reducida >= indice.dimension
+        if (anterior.proyeccion is None) != sin_pca:
+            return False
+        if sin_pca:
+            return True
+        if anterior.proyeccion.shape[1] < min(dimension_reducida, len(indice)):
+            return False
+        return (anterior.filas_pca >= FILAS_MUESTRA_PCA
+                or len(indice) <= CRECIMIENTO_REENTRENAR * anterior.filas_pca)
+
+    def arreglos_auxiliares(self):
+        proyeccion = self.proyeccion if self.proyeccion is not None else np.zeros((0, 0), dtype=np.float32)
+        return {"media": self.media, "proyeccion": proyeccion, "codigos": self.codigos, "escala": self.escala,
+                "filas_pca": np.array([self.filas_pca], dtype=np.int64)}
+
+    @property
+    def bytes_codigos_por_identidad(self):
+        """Bytes de los códigos compactos por fila (la matriz completa usa 4 * D)."""
+        return self.codigos.shape[1] * self.codigos.itemsize if len(self) else 0
+
+    @property
+    def bytes_por_identidad(self):
+        """Memoria por fila: los códigos más la fila completa si la matriz no está mapeada desde el disco."""
+        if len(self) == 0:
+            return 0
+        en_memoria = 0 if isinstance(self.embeddings, np.memmap) else self.dimension * self.embeddings.itemsize
+        return self.bytes_codigos_por_identidad + en_memoria
+
+    def _proyectar_filas(self, matriz):
+        proyectadas = []
+        for inicio in range(0, len(matriz), FILAS_POR_BLOQUE):
+            bloque = np.asarray(matriz[inicio:inicio + FILAS_POR_BLOQUE], dtype=np.float32) - self.media
+            proyectadas.append(bloque if self.proyeccion is None else bloque @ self.proyeccion)
+        return np.concatenate(proyectadas)
+
+    def _cuantizar(self, proyectadas):
+        if self.cuantizacion == 'float16':
+            return proyectadas.astype(np.float16), np.ones(proyectadas.shape[1], dtype=np.float32)
+        escala = np.abs(proyectadas).max(axis=0) / 127.0
+        escala[escala == 0] = 1.0
+        codigos = np.clip(np.rint(proyectadas / escala), -127, 127).astype(np.int8)
+        return codigos, escala.astype(np.float32)
+
+    def similitudes_aproximadas(self, consultas, candidatos=None):
+        """q·x ≈ q·media + (q P)·(escala * código), sin reconstruir ninguna fila completa."""
+        reducidas = consultas if self.proyeccion is None else consultas @ self.proyeccion
+        codigos = self.codigos if candidatos is None else self.codigos[candidatos]
+        return (consultas @ self.media)[:, np.newaxis] + (reducidas * self.escala) @ codigos.T.astype(np.float32)
+
+    def buscar_lote(self, consultas, candidatos=None):
+        consultas = normalizar_l2(consultas)
+        if len(self) == 0 or (candidatos is not None and len(candidatos) == 0):
+            return super().buscar_lote(consultas, candidatos)
+        if consultas.shape[1] != self.dimension:
+            raise ValueError(f"Dimensión de consulta {consultas.shape[1]} distinta a la de la galería {self.dimension}.")
+
+        filas = np.arange(len(self)) if candidatos is None else np.asarray(candidatos)
+        aproximadas = self.similitudes_aproximadas(consultas, candidatos)
+        if self.reordenar == 0:
+            mejores_locales = np.argmax(aproximadas, axis=1)
+            mejores = np.clip(aproximadas[np.arange(len(consultas)), mejores_locales], -1.0, 1.0)
+            return filas[mejores_locales], self._similitud_a_distancia(mejores)
+
+        # Reordenar los top-k de cada consulta con el producto punto exacto
+        k = min(self.reordenar, len(filas))
+        top = np.argpartition(-aproximadas, k - 1, axis=1)[:, :k]
+        posiciones = np.empty(len(consultas), dtype=np.int64)
+        mejores = np.empty(len(consultas), dtype=np.float32)
+        for i in range(len(consultas)):
+            filas_top = np.sort(filas[top[i]]) # Ordenadas: lectura secuencial de la matriz mapeada
+            exactas = np.asarray(self.embeddings[filas_top], dtype=np.float32) @ consultas[i]
+            mejor = int(np.argmax(exactas))
+            posiciones[i] = filas_top[mejor]
+            mejores[i] = exactas[mejor]
+        return posiciones, self._similitud_a_distancia(mejores)
@@ -0,0 +1,139 @@
+# backend/indice_ivf.py
+# Índice aproximado (IVF, "inverted file") para identificar contra toda la galería del campus.
+# Las filas se agrupan en listas alrededor de centroides (k-means esférico) y cada consulta solo
+# se compara con las filas de las n_sondas listas cuyos centroides están más cerca, en lugar de con todas.
+import numpy as np
+
+from galeria import IndiceGaleria, normalizar_l2
+
+FILAS_POR_BLOQUE = 8192 # Filas por multiplicación al asignar, para acotar la memoria temporal
+
+
+def listas_automaticas(num_filas):
+    """Cantidad de listas por defecto: ~sqrt(N), el equilibrio habitual entre centroides y filas por lista."""
+    return max(1, int(round(np.sqrt(num_filas))))
+
+
+def asignar_a_centroides(matriz, centroides):
+    """Índice del centroide más cercano (mayor producto punto) de cada fila de matriz (normalizada)."""
+    asignaciones = np.empty(len(matriz), dtype=np.int32)
+    for inicio in range(0, len(matriz), FILAS_POR_BLOQUE):
+        bloque = np.asarray(matriz[inicio:inicio + FILAS_POR_BLOQUE], dtype=np.float32)
+        asignaciones[inicio:inicio + len(bloque)] = np.argmax(bloque @ centroides.T, axis=1)
+    return asignaciones
+
+
+def entrenar_centroides(matriz, n_listas, iteraciones=10, filas_por_lista=256, semilla=0):
+    """
+    K-means esférico sobre una muestra de hasta n_listas * filas_por_lista filas de matriz (normalizada).
+    Devuelve una matriz (n_listas, D) float32 de centroides normalizados. Es determinista para una misma semilla.
+    """
+    rng = np.random.default_rng(semilla)
+    n_listas = min(n_listas, len(matriz))
+    tamano_muestra = min(len(matriz), n_listas * filas_por_lista)
+    muestra = np.asarray(matriz[np.sort(rng.choice(len(matriz), tamano_muestra, replace=False))], dtype=np.float32)
+    centroides = muestra[rng.choice(len(muestra), n_listas, replace=False)].copy()
+
+    for _ in range(iteraciones):
+        asignaciones = asignar_a_centroides(muestra, centroides)
+        orden = np.argsort(asignaciones, kind='stable')
+        presentes, inicios = np.unique(asignaciones[orden], return_index=True)
+        sumas = np.add.reduceat(muestra[orden], inicios, axis=0)
+        nuevos = muestra[rng.choice(len(muestra), n_listas, replace=False)].copy() # Listas vacías: reiniciar al azar
+        nuevos[presentes] = sumas
+        centroides = normalizar_l2(nuevos)
+    return centroides
+
+
+class IndiceIVF(IndiceGaleria):
+    """
+    IndiceGaleria con búsqueda aproximada para las búsquedas sin candidatos (toda la galería).
+    - n_listas: cantidad de centroides (None: ~sqrt(N)).
+    - n_sondas: listas que se revisan por consulta; más sondas, más recall@1 y más tiempo.
+      Con n_sondas >= n_listas la búsqueda es exacta.
+    - centroides / asignaciones (opcionales): ya calculados, por ejemplo al mapear una galería publicada.
+      Con centroides y sin asignaciones, las filas se asignan a esos centroides sin volver a entrenar.
+    Las búsquedas restringidas a candidatos (por ejemplo, los alumnos de un horario) siguen siendo exactas.
+    """
+
+    def __init__(self, embeddings=None, ids=None, roles=None, metrica='cosine', claves=None, huellas=None, fuentes=None,
+                 normalizados=False, n_listas=None, n_sondas=8, centroides=None, asignaciones=None):
+        super().__init__(embeddings, ids, roles, metrica=metrica, claves=claves, huellas=huellas, fuentes=fuentes,
+                         normalizados=normalizados)
+        self.n_sondas = max(1, int(n_sondas))
+        if len(self) == 0:
+            self.centroides = np.zeros((0, 0), dtype=np.float32)
+            self.asignaciones = np.zeros(0, dtype=np.int32)
+        else:
+            if centroides is None:
+                centroides = entrenar_centroides(self.embeddings, n_listas or listas_automaticas(len(self)))
+            self.centroides = np.asarray(centroides, dtype=np.float32)
+            if asignaciones is None:
+                asignaciones = asignar_a_centroides(self.embeddings, self.centroides)
+            self.asignaciones = np.asarray(asignaciones, dtype=np.int32)
+
+        # Listas invertidas: filas de cada centroide, como cortes de un único arreglo ordenado
+        self._orden = np.argsort(self.asignaciones, kind='stable').astype(np.int64)
+        self._cortes = np.searchsorted(self.asignaciones[self._orden], np.arange(len(self.centroides) + 1))
+
+    @classmethod
+    def desde_indice(cls, indice, n_listas=None, n_sondas=8, centroides=None):
+        """Construye un IndiceIVF con las mismas filas que indice (sin copiar la matriz de embeddings)."""
+        return cls(indice.embeddings, indice.ids, indice.roles, metrica=indice.metrica, claves=indice.claves,
+                   huellas=indice.huellas, fuentes=indice.fuentes, normalizados=True,
+                   n_listas=n_listas, n_sondas=n_sondas, centroides=centroides)
+
+    @classmethod
+    def reconstruir(cls, indice, anterior=None, auxiliares=None, n_listas=None, n_sondas=8):
+        """
+        Fábrica para GaleriaVersionada: convierte una generación de la galería en IndiceIVF.
+        - Con los centroides y asignaciones publicados (auxiliares) no se calcula nada.
+        - Si la generación anterior era IVF con una cantidad de listas parecida, se reutilizan sus centroides
+          y solo se asignan las filas; si no, se entrenan centroides nuevos.
+        """
+        auxiliares = auxiliares or {}
+        if "centroides" in auxiliares and len(auxiliares.get("asignaciones", ())) == len(indice):
+            return cls(indice.embeddings, indice.ids, indice.roles, metrica=indice.metrica, claves=indice.claves,
+                       huellas=indice.huellas, fuentes=indice.fuentes, normalizados=True, n_sondas=n_sondas,
+                       centroides=auxiliares["centroides"], asignaciones=auxiliares["asignaciones"])
+
+        centroides = None
+        objetivo = n_listas or listas_automaticas(len(indice))
+        if (isinstance(anterior, IndiceIVF) and anterior.n_listas and anterior.dimension == indice.dimension
+                and objetivo / 2 <= anterior.n_listas <= objetivo * 2):
+            centroides = anterior.centroides
+        return cls.desde_indice(indice, n_listas=objetivo, n_sondas=n_sondas, centroides=centroides)
+
+    def arreglos_auxiliares(self):
+        return {"centroides": self.centroides, "asignaciones": self.asignaciones}
+
+    @property
+    def n_listas(self):
+        return len(self.centroides)
+
+    def filas_de_lista(self, lista):
+        return self._orden[self._cortes[lista]:self._cortes[lista + 1]]
+
+    def buscar_lote(self, consultas, candidatos=None):
+        if candidatos is not None or len(self) == 0 or self.n_sondas >= self.n_listas:
+            return super().buscar_lote(consultas, candidatos)
+
+        consultas = normalizar_l2(consultas)
+        if consultas.shape[1] != self.dimension:
+            raise ValueError(f"Dimensión de consulta {consultas.shape[1]} distinta a la de la galería {self.dimension}.")
+
+        # Las n_sondas listas más cercanas de cada consulta, en una sola multiplicación contra los centroides
+        sondas = np.argpartition(-(consultas @ self.centroides.T), self.n_sondas - 1, axis=1)[:, :self.n_sondas]
+        posiciones = np.full(len(consultas), -1, dtype=np.int64)
+        mejores = np.full(len(consultas), -np.inf, dtype=np.float32)
+        for i, listas in enumerate(sondas):
+            filas = np.concatenate([self.filas_de_lista(lista) for lista in listas])
+            if len(filas) == 0:
+                continue
+            similitudes = self.embeddings[filas] @ consultas[i]
+            mejor = int(np.argmax(similitudes))
+            posiciones[i] = filas[mejor]
+            mejores[i] = similitudes[mejor]
+
+        distancias = np.where(posiciones >= 0, self._similitud_a_distancia(mejores), np.inf).astype(np.float32)
+        return posiciones, distancias
@@ -0,0 +1,153 @@
+# backend/metricas.py
+# Métricas del backend en formato de texto de Prometheus (GET /metrics): contadores, medidores e histogramas
+# con etiquetas. Registrar una observación es un bisect y una suma bajo un lock, así que pueden quedar
+# activas en producción; el texto solo se arma cuando Prometheus consulta /metrics.
+import threading
+from bisect import bisect_left
+
+# Límites (en segundos) de los histogramas de latencia: de 1 ms a 15 s (el timeout del kiosco)
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+
+
+def escapar_etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def formatear_etiquetas(nombres, valores, extra=()):
+    pares = [f'{nombre}="{escapar_etiqueta(valor)}"' for nombre, valor in list(zip(nombres, valores)) + list(extra)]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def formatear_numero(valor):
+    if valor == float('inf'):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    """Base de las métricas: nombre, ayuda, nombres de etiquetas y valores por combinación de etiquetas."""
+
+    tipo = "untyped"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {} # tupla de valores de etiquetas -> valor (o estado del histograma)
+        self._lock = threading.Lock()
+
+    def _clave(self, valores_etiquetas):
+        if len(valores_etiquetas) != len(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}")
+        return tuple(str(valor) for valor in valores_etiquetas)
+
+    def lineas(self):
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        with self._lock:
+            valores = list(self._valores.items())
+        for clave, valor in valores:
+            yield from self._lineas_muestra(clave, valor)
+
+    def _lineas_muestra(self, clave, valor):
+        yield f"{self.nombre}{formatear_etiquetas(self.etiquetas, clave)} {formatear_numero(valor)}"
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def incrementar(self, *valores_etiquetas, cantidad=1):
+        clave = self._clave(valores_etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+
+class Medidor(Metrica):
+    """
+    Gauge. Con funcion (sin etiquetas), el valor se lee al exponer las métricas, por ejemplo el tamaño de la
+    galería; si no, se actualiza con sumar / fijar (por ejemplo, las peticiones en curso).
+    """
+
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def sumar(self, *valores_etiquetas, cantidad=1):
+        clave = self._clave(valores_etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def fijar(self, *valores_etiquetas, valor):
+        with self._lock:
+            self._valores[self._clave(valores_etiquetas)] = valor
+
+    def valor(self, *valores_etiquetas):
+        with self._lock:
+            return self._valores.get(self._clave(valores_etiquetas), 0)
+
+    def lineas(self):
+        if self.funcion is not None:
+            try:
+                self.fijar(valor=self.funcion())
+            except Exception:
+                pass # Se expone el último valor leído
+        yield from super().lineas()
+
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, *valores_etiquetas, valor):
+        clave = self._clave(valores_etiquetas)
+        posicion = bisect_left(self.limites, valor)
+        with self._lock:
+            estado = self._valores.get(clave)
+            if estado is None:
+                # [conteos por cubeta (+ la de +Inf), suma, cantidad]
+                estado = self._valores[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            estado[0][posicion] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def lineas(self):
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        with self._lock:
+            valores = [(clave, (list(conteos), suma, cantidad)) for clave, (conteos, suma, cantidad) in self._valores.items()]
+        for clave, (conteos, suma, cantidad) in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (float('inf'),), conteos):
+                acumulado += conteo
+                etiquetas = formatear_etiquetas(self.etiquetas, clave, [("le", formatear_numero(float(limite)))])
+                yield f"{self.nombre}_bucket{etiquetas} {acumulado}"
+            etiquetas = formatear_etiquetas(self.etiquetas, clave)
+            yield f"{self.nombre}_sum{etiquetas} {formatear_numero(suma)}"
+            yield f"{self.nombre}_count{etiquetas} {cantidad}"
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self.registrar(Contador(nombre, ayuda, etiquetas))
+
+    def medidor(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self.registrar(Medidor(nombre, ayuda, etiquetas, funcion))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self.registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def exponer(self):
+        """Texto de todas las métricas (text/plain; version=0.0.4)."""
+        return "\n".join(linea for metrica in self._metricas for linea in metrica.lineas()) + "\n"
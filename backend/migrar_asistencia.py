@@ -0,0 +1,74 @@
+# backend/migrar_asistencia.py
+# Migración única para que /asistencia sea idempotente: crea los índices únicos (id_horario, persona, fecha) de
+# asistencia_alumno y asistencia_profesor. Antes hay que borrar los duplicados que dejaron los reintentos del
+# kiosco; de cada grupo se conserva la fila más reciente (id mayor). Sin --aplicar solo informa qué borraría.
+#   python migrar_asistencia.py              (informe de duplicados, sin cambios)
+#   python migrar_asistencia.py --aplicar    (borra los duplicados y crea los índices en una transacción)
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+from flask import Flask
+from sqlalchemy import text
+
+from asistencias import TABLAS_POR_ROL, indices_faltantes
+from database import db
+
+
+def consulta_duplicados(tabla, columna):
+    """Ids de las filas con otra más reciente para la misma persona, horario y fecha (SQL válido en PostgreSQL y SQLite)."""
+    return (f"SELECT a.id FROM {tabla} a JOIN {tabla} b ON a.id_horario = b.id_horario "
+            f"AND a.{columna} = b.{columna} AND a.fecha = b.fecha AND a.id < b.id")
+
+
+def migrar(aplicar, mostrar=20):
+    """Informa (y con aplicar, borra) los duplicados de cada tabla y crea los índices que falten. Devuelve las filas borradas."""
+    faltantes = indices_faltantes(db.engine)
+    if not faltantes:
+        print("Los índices únicos de asistencia ya existen; no hay nada que migrar.")
+        return 0
+
+    total = 0
+    for modelo, columna in TABLAS_POR_ROL.values():
+        tabla = modelo.__tablename__
+        ids = sorted({fila.id for fila in db.session.execute(text(consulta_duplicados(tabla, columna)))})
+        total += len(ids)
+        print(f"{tabla}: {len(ids)} filas duplicadas" + (f" (ids {ids[:mostrar]}{' ...' if len(ids) > mostrar else ''})" if ids else ""))
+        if aplicar and ids:
+            db.session.execute(text(f"DELETE FROM {tabla} WHERE id IN ({consulta_duplicados(tabla, columna)})"))
+
+    if not aplicar:
+        print(f"Sin cambios. Con --aplicar se borrarían {total} filas y se crearían {', '.join(faltantes)}.")
+        db.session.rollback()
+        return 0
+
+    conexion = db.session.connection()
+    for modelo, _ in TABLAS_POR_ROL.values():
+        for indice in modelo.__table__.indexes:
+            if indice.name in faltantes:
+                indice.create(bind=conexion)
+    db.session.commit()
+    print(f"Borradas {total} filas duplicadas; índices creados: {', '.join(faltantes)}.")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea los índices únicos de asistencia, borrando antes los duplicados.")
+    parser.add_argument("--aplicar", action="store_true", help="Borra los duplicados y crea los índices (por defecto solo informa)")
+    parser.add_argument("--bd", default=None, help="SQLALCHEMY_DATABASE_URI (por defecto, la del .env)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    uri = args.bd or os.getenv('SQLALCHEMY_DATABASE_URI')
+    if not uri:
+        sys.exit("Falta SQLALCHEMY_DATABASE_URI (en el .env o con --bd).")
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    db.init_app(app)
+    with app.app_context():
+        migrar(args.aplicar)
+
+
+if __name__ == '__main__':
+    main()
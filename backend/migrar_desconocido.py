@@ -0,0 +1,60 @@
+# backend/migrar_desconocido.py
+# Migración única de la tabla desconocido: agrega la columna cantidad (frames de la misma persona agrupados en
+# cada imagen, 1 en las filas que ya existen). Sin --aplicar solo informa si falta.
+#   python migrar_desconocido.py              (informe, sin cambios)
+#   python migrar_desconocido.py --aplicar    (agrega la columna)
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+from flask import Flask
+from sqlalchemy import inspect, text
+
+from database import db
+from schemas import Desconocido
+
+COLUMNA_CANTIDAD = "cantidad"
+
+
+def falta_columna_cantidad(engine):
+    """True si la tabla desconocido todavía no tiene la columna cantidad."""
+    columnas = {columna["name"] for columna in inspect(engine).get_columns(Desconocido.__tablename__)}
+    return COLUMNA_CANTIDAD not in columnas
+
+
+def migrar(aplicar):
+    """Informa (y con aplicar, agrega) la columna cantidad. Devuelve True si se agregó."""
+    if not falta_columna_cantidad(db.engine):
+        print(f"La columna {Desconocido.__tablename__}.{COLUMNA_CANTIDAD} ya existe; no hay nada que migrar.")
+        return False
+    if not aplicar:
+        print(f"Sin cambios. Con --aplicar se agregaría la columna {Desconocido.__tablename__}.{COLUMNA_CANTIDAD}.")
+        return False
+
+    # Sin IF NOT EXISTS (solo PostgreSQL): ya se comprobó que falta, y así también funciona en SQLite
+    db.session.execute(text(f"ALTER TABLE {Desconocido.__tablename__} ADD COLUMN {COLUMNA_CANTIDAD} INTEGER DEFAULT 1"))
+    db.session.commit()
+    print(f"Columna {Desconocido.__tablename__}.{COLUMNA_CANTIDAD} agregada.")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrega la columna cantidad a la tabla desconocido.")
+    parser.add_argument("--aplicar", action="store_true", help="Agrega la columna (por defecto solo informa)")
+    parser.add_argument("--bd", default=None, help="SQLALCHEMY_DATABASE_URI (por defecto, la del .env)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    uri = args.bd or os.getenv('SQLALCHEMY_DATABASE_URI')
+    if not uri:
+        sys.exit("Falta SQLALCHEMY_DATABASE_URI (en el .env o con --bd).")
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    db.init_app(app)
+    with app.app_context():
+        migrar(args.aplicar)
+
+
+if __name__ == '__main__':
+    main()
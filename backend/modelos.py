@@ -0,0 +1,191 @@
+# backend/modelos.py
+# Acceso a los modelos de DeepFace para el reconocimiento: detección + anti-spoofing y embeddings.
+# La cara detectada y alineada en el paso de anti-spoofing se pasa directamente al modelo de
+# embeddings, sin volver a leer la imagen ni ejecutar el detector una segunda vez.
+# El modelo de embeddings puede ejecutarse con TensorFlow (el de DeepFace) o con ONNX Runtime en CPU,
+# a partir del grafo exportado con exportar_onnx.py.
+import time
+import cv2
+import numpy as np
+from deepface import DeepFace
+from deepface.modules import preprocessing
+
+from galeria import normalizar_l2
+
+# Resultados posibles de la detección + anti-spoofing (MotorReconocimiento.analizar_imagen)
+ESTADO_REAL = "real"                  # Cara real: se puede buscar en la galería
+ESTADO_SPOOF = "spoof"                # Posible imagen falsa
+ESTADO_SIN_CARA = "sin_cara"          # extract_faces no devolvió caras
+ESTADO_NO_DETECTADO = "no_detectado"  # extract_faces lanzó ValueError (rostro no detectado)
+ESTADO_ERROR = "error"                # Error inesperado durante la detección
+ESTADO_IMAGEN_INVALIDA = "imagen_invalida"
+
+
+def decodificar_imagen(datos):
+    """
+    Decodifica en memoria los bytes de una imagen subida (JPEG/PNG) a un arreglo BGR.
+    Devuelve None si los bytes no corresponden a una imagen válida.
+    """
+    if not datos:
+        return None
+    return cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def calidad_cara(face_obj):
+    """
+    Calidad de una cara devuelta por extract_faces: nitidez (varianza del laplaciano) por confianza del detector.
+    Sirve para elegir la mejor imagen entre varios frames de la misma persona.
+    """
+    gris = cv2.cvtColor((np.asarray(face_obj["face"]) * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
+    return float(cv2.Laplacian(gris, cv2.CV_64F).var() * (face_obj.get("confidence") or 1.0))
+
+
+class ModeloOnnx:
+    """
+    Modelo de embeddings exportado a ONNX, ejecutado con ONNX Runtime en CPU.
+    Expone input_shape (alto, ancho) como los modelos de DeepFace y procesa lotes (N, alto, ancho, 3).
+    """
+
+    def __init__(self, ruta, hilos=0):
+        import onnxruntime # Dependencia opcional: solo hace falta con MOTOR_INFERENCIA = 'onnx'
+        opciones = onnxruntime.SessionOptions()
+        opciones.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if hilos:
+            opciones.intra_op_num_threads = hilos
+        self.sesion = onnxruntime.InferenceSession(ruta, sess_options=opciones, providers=["CPUExecutionProvider"])
+        entrada = self.sesion.get_inputs()[0]
+        self.nombre_entrada = entrada.name
+        self.input_shape = tuple(entrada.shape[1:3])
+
+    def forward_lote(self, lote):
+        return self.sesion.run(None, {self.nombre_entrada: np.asarray(lote, dtype=np.float32)})[0]
+
+
+class MotorReconocimiento:
+    """
+    Envuelve el detector y el modelo de reconocimiento configurados.
+    - extraer_caras: detecta, alinea y (opcionalmente) evalúa anti-spoofing en una sola pasada.
+    - embeber_caras: calcula los embeddings de caras ya recortadas, en un único forward del modelo.
+    - ruta_onnx (opcional): grafo ONNX del modelo de reconocimiento; si se indica, los embeddings se calculan
+      con ONNX Runtime (hilos_onnx hilos, 0: los que elija ONNX Runtime) en lugar de TensorFlow.
+    """
+
+    def __init__(self, model_name, detector_backend, normalizacion='base', ruta_onnx=None, hilos_onnx=0):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.normalizacion = normalizacion
+        self.ruta_onnx = ruta_onnx
+        self.hilos_onnx = hilos_onnx
+        self._modelo = None
+
+    @property
+    def modelo(self):
+        # DeepFace guarda los modelos construidos en caché, pero evitamos la búsqueda en cada llamada
+        if self._modelo is None:
+            if self.ruta_onnx:
+                self._modelo = ModeloOnnx(self.ruta_onnx, self.hilos_onnx)
+            else:
+                self._modelo = DeepFace.build_model(self.model_name)
+        return self._modelo
+
+    def precargar(self):
+        """
+        Construye el modelo de reconocimiento, el detector y el modelo anti-spoofing, y ejecuta una
+        inferencia de prueba para calentarlos. Devuelve el tiempo (s) de cada paso.
+        """
+        tiempos = {}
+
+        t0 = time.perf_counter()
+        self.modelo
+        tiempos["modelo_reconocimiento"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        DeepFace.build_model(self.detector_backend, task="face_detector")
+        tiempos["detector"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        DeepFace.build_model("Fasnet", task="spoofing")
+        tiempos["anti_spoofing"] = time.perf_counter() - t0
+
+        # Inferencia de prueba: sin rostro, extract_faces devuelve la imagen completa como "cara",
+        # así que se ejercitan el detector, el anti-spoofing y el forward del modelo de embeddings
+        t0 = time.perf_counter()
+        imagen_prueba = np.full((224, 224, 3), 127, dtype=np.uint8)
+        caras = DeepFace.extract_faces(
+            img_path=imagen_prueba,
+            detector_backend=self.detector_backend,
+            enforce_detection=False,
+            anti_spoofing=True,
+            align=True
+        )
+        self.embeber_caras([caras[0]["face"]])
+        tiempos["calentamiento"] = time.perf_counter() - t0
+        return tiempos
+
+    def extraer_caras(self, img, anti_spoofing=True):
+        """
+        Detecta y alinea las caras de img (ruta o arreglo BGR).
+        Cada elemento tiene "face" (RGB en [0, 1]), "facial_area", "confidence" y, con anti_spoofing, "is_real".
+        Lanza ValueError si no se detecta ningún rostro.
+        """
+        return DeepFace.extract_faces(
+            img_path=img,
+            detector_backend=self.detector_backend,
+            enforce_detection=True, # Asegura que se detecte al menos una cara
+            anti_spoofing=anti_spoofing,
+            align=True
+        )
+
+    def analizar_imagen(self, img):
+        """
+        Detección + anti-spoofing de img en una sola pasada.
+        Devuelve un dict con "estado" (ver ESTADO_*), "cara" y "calidad" (ver calidad_cara) cuando el estado
+        es ESTADO_REAL y "detalle" con el texto del error cuando lo hubo.
+        """
+        try:
+            face_objs = self.extraer_caras(img, anti_spoofing=True)
+        except ValueError as ve: # DeepFace lanza ValueError si no detecta cara
+            return {"estado": ESTADO_NO_DETECTADO, "detalle": str(ve)}
+        except Exception as e:
+            return {"estado": ESTADO_ERROR, "detalle": str(e)}
+
+        if not face_objs:
+            return {"estado": ESTADO_SIN_CARA}
+        # Nota: extract_faces puede encontrar múltiples caras; todas deben ser reales
+        if not all(face_obj.get("is_real", False) for face_obj in face_objs):
+            return {"estado": ESTADO_SPOOF}
+        return {"estado": ESTADO_REAL, "cara": face_objs[0]["face"], "calidad": calidad_cara(face_objs[0])}
+
+    def preparar_cara(self, cara):
+        """
+        Convierte una cara devuelta por extraer_caras al tensor (1, H, W, 3) que espera el modelo,
+        con el mismo preprocesamiento que aplica DeepFace.represent.
+        """
+        cara = cara[:, :, ::-1] # extract_faces entrega RGB; el modelo espera BGR como en DeepFace.represent
+        alto, ancho = self.modelo.input_shape
+        cara = preprocessing.resize_image(img=cara, target_size=(ancho, alto))
+        return preprocessing.normalize_input(img=cara, normalization=self.normalizacion)
+
+    def embeber_caras(self, caras):
+        """
+        Calcula los embeddings de una lista de caras (salida "face" de extraer_caras).
+        Devuelve una matriz (N, D) float32 normalizada (L2).
+        """
+        if len(caras) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        lote = np.concatenate([self.preparar_cara(cara) for cara in caras], axis=0)
+        modelo = self.modelo
+        if isinstance(modelo, ModeloOnnx):
+            embeddings = modelo.forward_lote(lote)
+        elif hasattr(modelo, 'model'):
+            # Forward directo del modelo Keras: procesa todo el lote en una sola llamada
+            salida = modelo.model(lote, training=False)
+            embeddings = salida.numpy() if hasattr(salida, 'numpy') else np.asarray(salida)
+        else:
+            embeddings = [modelo.forward(lote[i:i + 1]) for i in range(len(lote))]
+        return normalizar_l2(embeddings)
+
+    def representar(self, img):
+        """Embedding de la primera cara de img (sin anti-spoofing). Lanza ValueError si no hay rostro."""
+        caras = self.extraer_caras(img, anti_spoofing=False)
+        return self.embeber_caras([caras[0]["face"]])[0]
@@ -0,0 +1,109 @@
+# backend/planificador.py
+# Micro-batching entre peticiones: cuando muchos kioscos llaman a /ia a la vez, cada petición deja
+# su cara en una cola y un único hilo las agrupa para pasarlas por el modelo de embeddings en un solo lote.
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class PlanificadorLotes:
+    """
+    Agrupa trabajos concurrentes y los procesa en lotes con funcion_lote(lista) -> secuencia de resultados.
+    - max_lote: cantidad máxima de trabajos por lote.
+    - max_espera_ms: cuánto puede esperar el primer trabajo de un lote a que lleguen más.
+    Con max_espera_ms = 0 solo se agrupan los trabajos que ya estaban en cola.
+    """
+
+    def __init__(self, funcion_lote, max_lote=16, max_espera_ms=5, tamano_historial=1000):
+        self.funcion_lote = funcion_lote
+        self.max_lote = max(1, int(max_lote))
+        self.max_espera = max(0.0, float(max_espera_ms)) / 1000.0
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+        # Estadísticas para ajustar max_lote / max_espera_ms (latencia p99 vs. throughput)
+        self._lotes = 0
+        self._trabajos = 0
+        self._tamanos = deque(maxlen=tamano_historial)
+        self._esperas = deque(maxlen=tamano_historial)
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="planificador-lotes", daemon=True)
+                self._hilo.start()
+
+    def enviar(self, trabajo):
+        """Encola un trabajo y devuelve un Future con su resultado."""
+        self._iniciar()
+        future = Future()
+        self._cola.put((trabajo, future, time.perf_counter()))
+        return future
+
+    def procesar(self, trabajo, timeout=None):
+        """Encola un trabajo y espera su resultado (bloquea el hilo de la petición)."""
+        return self.enviar(trabajo).result(timeout=timeout)
+
+    def _recolectar_lote(self):
+        primero = self._cola.get()
+        lote = [primero]
+        limite = primero[2] + self.max_espera
+        while len(lote) < self.max_lote:
+            restante = limite - time.perf_counter()
+            try:
+                if restante > 0:
+                    lote.append(self._cola.get(timeout=restante))
+                else:
+                    lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self):
+        while True:
+            lote = self._recolectar_lote()
+            inicio_lote = time.perf_counter()
+            trabajos = [trabajo for trabajo, _, _ in lote]
+            try:
+                resultados = self.funcion_lote(trabajos)
+                for (_, future, _), resultado in zip(lote, resultados):
+                    future.set_result(resultado)
+            except Exception as e:
+                for _, future, _ in lote:
+                    future.set_exception(e)
+
+            with self._lock:
+                self._lotes += 1
+                self._trabajos += len(lote)
+                self._tamanos.append(len(lote))
+                self._esperas.extend(inicio_lote - encolado for _, _, encolado in lote)
+
+    def estadisticas(self):
+        """Profundidad de cola, tamaño de lote y tiempo de espera en cola (ms) de los últimos trabajos."""
+        with self._lock:
+            tamanos = np.asarray(self._tamanos, dtype=np.float64)
+            esperas = np.asarray(self._esperas, dtype=np.float64) * 1000
+            lotes, trabajos = self._lotes, self._trabajos
+
+        def percentiles(valores):
+            if len(valores) == 0:
+                return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+            p50, p95, p99 = np.percentile(valores, [50, 95, 99])
+            return {"p50": round(float(p50), 3), "p95": round(float(p95), 3),
+                    "p99": round(float(p99), 3), "max": round(float(valores.max()), 3)}
+
+        return {
+            "max_lote": self.max_lote,
+            "max_espera_ms": self.max_espera * 1000,
+            "profundidad_cola": self._cola.qsize(),
+            "lotes_procesados": lotes,
+            "trabajos_procesados": trabajos,
+            "tamano_lote_promedio": round(float(tamanos.mean()), 3) if len(tamanos) else 0.0,
+            "tamano_lote": percentiles(tamanos),
+            "espera_cola_ms": percentiles(esperas),
+        }
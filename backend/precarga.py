@@ -0,0 +1,116 @@
+# backend/precarga.py
+# Precarga de galerías: en lugar de esperar a que el kiosco llame a /usuarios al empezar la clase (cuando los
+# alumnos ya están llegando), un hilo del backend revisa periódicamente qué horarios empiezan pronto y deja su
+# roster en la galería (fotos descargadas y embebidas) mientras el backend está desocupado.
+# Con varios procesos del backend, solo precarga el que obtiene el bloqueo (flock) del archivo ruta_bloqueo.
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+try:
+    import fcntl
+except ImportError: # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+
+class PrecargaHorarios:
+    """
+    - horarios_proximos(): ids de los horarios que empiezan dentro de la ventana de anticipación.
+    - preparar(id_horario): deja el roster del horario en la galería; devuelve True si hubo que cargarlo.
+    - ocupado(): True si hay tráfico de reconocimiento; el ciclo se salta y se reintenta en el siguiente.
+    - intervalo_s: segundos entre ciclos. max_concurrentes: horarios que se preparan a la vez.
+    Cada horario se prepara una vez por día; si falla, se reintenta en el siguiente ciclo.
+    """
+
+    def __init__(self, horarios_proximos, preparar, ocupado=None, intervalo_s=60, max_concurrentes=2, ruta_bloqueo=None):
+        self.horarios_proximos = horarios_proximos
+        self.preparar = preparar
+        self.ocupado = ocupado or (lambda: False)
+        self.intervalo_s = intervalo_s
+        self.max_concurrentes = max(1, int(max_concurrentes))
+        self.ruta_bloqueo = ruta_bloqueo
+        self._archivo_bloqueo = None
+        self._preparados = {} # id_horario -> fecha en que se preparó
+        self._hilo = None
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+        self._estado = {"ciclos": 0, "ciclos_omitidos": 0, "cargados": 0, "ya_residentes": 0, "fallidos": 0,
+                        "ultimo_ciclo": None, "ultimo_error": None}
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="precarga-horarios", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _tomar_bloqueo(self):
+        """True si este proceso es el que precarga (o si no hay bloqueo entre procesos)."""
+        if self.ruta_bloqueo is None or fcntl is None:
+            return True
+        if self._archivo_bloqueo is not None:
+            return True
+        os.makedirs(os.path.dirname(self.ruta_bloqueo) or ".", exist_ok=True)
+        archivo = open(self.ruta_bloqueo, 'a')
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError: # Otro proceso ya precarga
+            archivo.close()
+            return False
+        self._archivo_bloqueo = archivo # Se mantiene abierto (y bloqueado) mientras viva el proceso
+        return True
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                self.ejecutar_ciclo()
+            except Exception as e:
+                with self._lock:
+                    self._estado["ultimo_error"] = str(e)
+            self._detener.wait(self.intervalo_s)
+
+    def ejecutar_ciclo(self):
+        """Prepara los horarios próximos que todavía no se prepararon hoy. Devuelve los ids preparados."""
+        if not self._tomar_bloqueo():
+            return []
+        with self._lock:
+            self._estado["ciclos"] += 1
+            self._estado["ultimo_ciclo"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        if self.ocupado():
+            with self._lock:
+                self._estado["ciclos_omitidos"] += 1
+            return []
+
+        hoy = date.today()
+        with self._lock:
+            self._preparados = {id_horario: fecha for id_horario, fecha in self._preparados.items() if fecha == hoy}
+            pendientes = [id_horario for id_horario in self.horarios_proximos() if id_horario not in self._preparados]
+        if not pendientes:
+            return []
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrentes, thread_name_prefix="precarga") as executor:
+            futures = {id_horario: executor.submit(self.preparar, id_horario) for id_horario in pendientes}
+        preparados = []
+        for id_horario, future in futures.items():
+            try:
+                cargado = future.result()
+            except Exception as e:
+                with self._lock:
+                    self._estado["fallidos"] += 1
+                    self._estado["ultimo_error"] = f"Horario {id_horario}: {e}"
+                continue
+            with self._lock:
+                self._preparados[id_horario] = hoy
+                self._estado["cargados" if cargado else "ya_residentes"] += 1
+            preparados.append(id_horario)
+        return preparados
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._estado, activo=self._hilo is not None and self._hilo.is_alive(),
+                        proceso_precarga=self._archivo_bloqueo is not None or self.ruta_bloqueo is None or fcntl is None,
+                        preparados_hoy=sorted(str(id_horario) for id_horario in self._preparados))
@@ -1,5 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, BigInteger, String, Integer, Time, Date, ForeignKey, Enum
+from sqlalchemy import Column, BigInteger, String, Integer, Time, Date, DateTime, ForeignKey, Enum, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from database import db
 
@@ -52,6 +52,7 @@ class Desconocido(db.Model):
     id_horario = Column(BigInteger, ForeignKey('horario.id'))
     url_img = Column(String(255))
     fecha = Column(Date)
+    cantidad = Column(Integer, default=1) # Frames de la misma persona agrupados en esta imagen
 
     horario = relationship("Horario", back_populates="desconocidos")
 
@@ -66,6 +67,7 @@ class Alumno(db.Model):
 
     asistencia = relationship("AsistenciaAlumno", back_populates="alumno")
     matriculas = relationship("Matricula", back_populates="alumno")
+    embeddings = relationship("EmbeddingAlumno", back_populates="alumno")
 
 class Profesor(db.Model):
     __tablename__ = 'profesor'
@@ -79,9 +81,40 @@ class Profesor(db.Model):
 
     asistencia = relationship("AsistenciaProfesor", back_populates="profesor")
     horarios = relationship("Horario", back_populates="profesor")
+    embeddings = relationship("EmbeddingProfesor", back_populates="profesor")
+
+# Embedding de la foto (url_img) de cada persona, calculado una sola vez por modelo de reconocimiento.
+# version identifica la versión de DeepFace y el detector con que se calculó; url_img, la foto de origen.
+class EmbeddingAlumno(db.Model):
+    __tablename__ = 'embedding_alumno'
+    id_alumno = Column(BigInteger, ForeignKey('alumno.id'), primary_key=True)
+    modelo = Column(String(50), primary_key=True)
+    version = Column(String(50))
+    url_img = Column(String(255))
+    formato = Column(String(10))
+    dimension = Column(Integer)
+    vector = Column(LargeBinary)
+    fecha = Column(DateTime)
+
+    alumno = relationship("Alumno", back_populates="embeddings")
+
+class EmbeddingProfesor(db.Model):
+    __tablename__ = 'embedding_profesor'
+    id_profesor = Column(BigInteger, ForeignKey('profesor.id'), primary_key=True)
+    modelo = Column(String(50), primary_key=True)
+    version = Column(String(50))
+    url_img = Column(String(255))
+    formato = Column(String(10))
+    dimension = Column(Integer)
+    vector = Column(LargeBinary)
+    fecha = Column(DateTime)
+
+    profesor = relationship("Profesor", back_populates="embeddings")
 
 class AsistenciaAlumno(db.Model):
     __tablename__ = 'asistencia_alumno'
+    # Una asistencia por alumno, horario y día: /asistencia escribe con INSERT ... ON CONFLICT sobre este índice
+    __table_args__ = (Index('uq_asistencia_alumno', 'id_horario', 'id_alumno', 'fecha', unique=True),)
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     id_horario = Column(BigInteger, ForeignKey('horario.id'))
     id_alumno = Column(BigInteger, ForeignKey('alumno.id'))
@@ -94,6 +127,7 @@ class AsistenciaAlumno(db.Model):
 
 class AsistenciaProfesor(db.Model):
     __tablename__ = 'asistencia_profesor'
+    __table_args__ = (Index('uq_asistencia_profesor', 'id_horario', 'id_profesor', 'fecha', unique=True),)
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     id_horario = Column(BigInteger, ForeignKey('horario.id'))
     id_profesor = Column(BigInteger, ForeignKey('profesor.id'))
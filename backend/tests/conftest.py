@@ -0,0 +1,6 @@
+# backend/tests/conftest.py
+# Los módulos del backend se importan como hermanos (from galeria import ...), igual que al ejecutar app_flask.py.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,99 @@
+# backend/tests/test_asgi.py
+# Concurrencia del middleware ASGI: las rutas "async def" de Flask tienen que ejecutarse en los hilos del grupo,
+# varias a la vez, y no en el bucle de eventos del servidor. asgi.py importa app_flask (DeepFace, TensorFlow,
+# la base de datos); aquí se reemplaza por una app Flask mínima con rutas que bloquean su hilo.
+#   python -m pytest tests
+import asyncio
+import importlib
+import sys
+import threading
+import time
+import types
+
+import pytest
+from flask import Flask, jsonify
+
+ESPERA_S = 0.5
+PETICIONES = 4
+
+
+def crear_app():
+    app = Flask(__name__)
+
+    @app.route('/ia', methods=['POST'])
+    async def ia():
+        time.sleep(ESPERA_S) # Como DeepFace o la base de datos: bloquea el hilo que ejecuta la ruta
+        return jsonify({"hilo": threading.current_thread().name})
+
+    @app.route('/salon')
+    def salon():
+        time.sleep(ESPERA_S)
+        return jsonify({"hilo": threading.current_thread().name})
+
+    return app
+
+
+@pytest.fixture
+def asgi(monkeypatch):
+    monkeypatch.setitem(sys.modules, "app_flask", types.SimpleNamespace(app=crear_app()))
+    monkeypatch.delitem(sys.modules, "asgi", raising=False)
+    modulo = importlib.import_module("asgi")
+    yield modulo
+    for grupo in modulo.application.grupos.values():
+        grupo.cerrar()
+    sys.modules.pop("asgi", None)
+
+
+async def pedir(aplicacion, metodo, ruta, cuerpo=b""):
+    """Una petición HTTP al app ASGI; devuelve (estado, cuerpo de la respuesta)."""
+    scope = {"type": "http", "http_version": "1.1", "method": metodo, "path": ruta, "root_path": "",
+             "query_string": b"", "headers": [(b"content-length", str(len(cuerpo)).encode())]}
+    mensajes = [{"type": "http.request", "body": cuerpo, "more_body": False}]
+    enviados = []
+
+    async def receive():
+        return mensajes.pop(0) if mensajes else {"type": "http.disconnect"}
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    await aplicacion(scope, receive, send)
+    estado = next(m["status"] for m in enviados if m["type"] == "http.response.start")
+    return estado, b"".join(m.get("body", b"") for m in enviados if m["type"] == "http.response.body")
+
+
+async def pedir_concurrentes(aplicacion, metodo, ruta):
+    hilo_bucle = threading.current_thread().name
+    inicio = time.perf_counter()
+    respuestas = await asyncio.gather(*(pedir(aplicacion, metodo, ruta) for _ in range(PETICIONES)))
+    return time.perf_counter() - inicio, hilo_bucle, respuestas
+
+
+@pytest.mark.parametrize("metodo,ruta", [("POST", "/ia"), ("GET", "/salon")])
+def test_peticiones_concurrentes_se_superponen(asgi, metodo, ruta):
+    duracion, hilo_bucle, respuestas = asyncio.run(pedir_concurrentes(asgi.application, metodo, ruta))
+
+    assert [estado for estado, _ in respuestas] == [200] * PETICIONES
+    hilos = [cuerpo.decode() for _, cuerpo in respuestas]
+    assert not any(hilo_bucle in hilo for hilo in hilos)
+    # En serie serían PETICIONES * ESPERA_S
+    assert duracion < 2 * ESPERA_S
+
+
+def test_ruta_async_no_bloquea_el_bucle(asgi):
+    async def escenario():
+        latidos = 0
+
+        async def latir():
+            nonlocal latidos
+            while True:
+                await asyncio.sleep(0.01)
+                latidos += 1
+
+        latido = asyncio.create_task(latir())
+        await pedir(asgi.application, "POST", "/ia")
+        latido.cancel()
+        return latidos
+
+    # Si la ruta corriera en el bucle, no habría latidos mientras duerme
+    assert asyncio.run(escenario()) > ESPERA_S / 0.01 / 2
@@ -0,0 +1,139 @@
+# backend/trabajadores.py
+# Pool de procesos de inferencia: la detección, el anti-spoofing y el embedding se ejecutan fuera del hilo
+# de Flask, en procesos de larga duración que cargan los modelos una sola vez (sin competir por el GIL).
+# La cola es acotada: si está llena, el trabajo se rechaza de inmediato para que /ia responda 503
+# con un Retry-After en lugar de dejar que el kiosco agote su timeout.
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cache_resultados import huella_cara
+from modelos import MotorReconocimiento, decodificar_imagen, ESTADO_REAL, ESTADO_IMAGEN_INVALIDA
+
+# Motor propio de cada proceso trabajador (se crea en _inicializar_trabajador)
+_motor = None
+_tiempos_carga = {}
+
+
+def _inicializar_trabajador(model_name, detector_backend, ruta_onnx=None):
+    global _motor, _tiempos_carga
+    _motor = MotorReconocimiento(model_name, detector_backend, ruta_onnx=ruta_onnx)
+    # Carga y calienta los modelos una sola vez por proceso, antes de recibir trabajos
+    _tiempos_carga = _motor.precargar()
+
+
+def _tiempos_carga_trabajador():
+    return _tiempos_carga
+
+
+def _analizar_en_trabajador(datos_imagen):
+    """
+    Decodifica la imagen, ejecuta detección + anti-spoofing y, si la cara es real, calcula su embedding.
+    Devuelve el dict de MotorReconocimiento.analizar_imagen con "embedding" y "huella" (para la caché de
+    resultados) en lugar de "cara" (mucho más livianos de enviar de vuelta al proceso principal) y los
+    "tiempos" por etapa.
+    """
+    tiempos = {}
+    t0 = time.perf_counter()
+    img = decodificar_imagen(datos_imagen)
+    tiempos["carga"] = time.perf_counter() - t0
+    if img is None:
+        return {"estado": ESTADO_IMAGEN_INVALIDA, "tiempos": tiempos}
+
+    t0 = time.perf_counter()
+    resultado = _motor.analizar_imagen(img)
+    tiempos["deteccion_anti_spoofing"] = time.perf_counter() - t0
+
+    if resultado["estado"] == ESTADO_REAL:
+        t0 = time.perf_counter()
+        cara = resultado.pop("cara")
+        resultado["huella"] = huella_cara(cara)
+        resultado["embedding"] = _motor.embeber_caras([cara])[0]
+        tiempos["embedding"] = time.perf_counter() - t0
+
+    resultado["tiempos"] = tiempos
+    return resultado
+
+
+class ColaLlena(Exception):
+    """La cola de inferencia está llena; reintentar_en es la espera sugerida en segundos."""
+
+    def __init__(self, reintentar_en):
+        super().__init__(f"Cola de inferencia llena, reintentar en {reintentar_en}s")
+        self.reintentar_en = reintentar_en
+
+
+class PoolInferencia:
+    """
+    Pool de num_procesos procesos con una cola acotada a max_cola trabajos en espera.
+    enviar() devuelve un Future con el resultado de _analizar_en_trabajador o lanza ColaLlena.
+    """
+
+    def __init__(self, num_procesos, max_cola, model_name, detector_backend, ruta_onnx=None):
+        self.num_procesos = num_procesos
+        self.max_cola = max_cola
+        self._cupos = threading.BoundedSemaphore(num_procesos + max_cola)
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._rechazados = 0
+        self._duracion_promedio = 1.0 # Segundos por trabajo (media móvil), usada para el Retry-After
+        # "spawn" para no heredar el estado de TensorFlow del proceso principal
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_procesos,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inicializar_trabajador,
+            initargs=(model_name, detector_backend, ruta_onnx)
+        )
+
+    def estimar_reintento(self):
+        """Segundos estimados hasta que se libere un cupo en la cola."""
+        with self._lock:
+            pendientes, duracion = self._pendientes, self._duracion_promedio
+        return max(1, math.ceil(pendientes / self.num_procesos * duracion))
+
+    def _terminar(self, inicio):
+        duracion = time.perf_counter() - inicio
+        with self._lock:
+            self._pendientes -= 1
+            self._duracion_promedio = 0.9 * self._duracion_promedio + 0.1 * duracion
+        self._cupos.release()
+
+    def enviar(self, datos_imagen):
+        if not self._cupos.acquire(blocking=False):
+            with self._lock:
+                self._rechazados += 1
+            raise ColaLlena(self.estimar_reintento())
+
+        inicio = time.perf_counter()
+        with self._lock:
+            self._pendientes += 1
+        try:
+            future = self._executor.submit(_analizar_en_trabajador, datos_imagen)
+        except Exception:
+            self._terminar(inicio)
+            raise
+        future.add_done_callback(lambda _: self._terminar(inicio))
+        return future
+
+    def calentar(self):
+        """
+        Arranca los procesos del pool y espera a que todos hayan cargado sus modelos.
+        Devuelve los tiempos de carga informados por los trabajadores.
+        """
+        futures = [self._executor.submit(_tiempos_carga_trabajador) for _ in range(self.num_procesos)]
+        return [future.result() for future in futures]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "procesos": self.num_procesos,
+                "max_cola": self.max_cola,
+                "pendientes": self._pendientes,
+                "rechazados": self._rechazados,
+                "duracion_promedio_s": round(self._duracion_promedio, 4),
+            }
+
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
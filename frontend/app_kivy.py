@@ -21,6 +21,7 @@ from kivy.storage.jsonstore import JsonStore
 from endpoints import endpoints
 from flask import jsonify
 import os
+import json
 from dotenv import load_dotenv
 import cloudinary
 import cloudinary.uploader
@@ -41,6 +42,9 @@ cloudinary.config(
     secure = True
 )
 
+# Días como los guarda el backend (Horario.dia_semana), en el orden de datetime.weekday()
+DIAS_SEMANA = ('lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo')
+
 # Es la pantalla principal donde se inicia la aplicacion si no se tiene el local.json
 class InicioSesionScreen(Screen):
     def __init__(self, **kwargs):
@@ -64,6 +68,8 @@ class InicioSesionScreen(Screen):
             self.mostrar_popup("Error", "Por favor, ingrese el código de administrador.")
         else:
             try:
+                # La semana completa: es la copia local con la que el kiosco arranca si luego /salon no responde.
+                # Cada día solo se piden los horarios de ese día (ver ReconocimientoFacialApp.actualizar_horario_dia)
                 response = requests.post(endpoints["salon"], json={"salon": salon_ingresado})
                 if response.status_code == 200 and codigo_ingresado == "admin":
                     self.storage.put("salon",salon = salon_ingresado)
@@ -101,17 +107,7 @@ class InicioSesionScreen(Screen):
         popup.open()
 
     def obtener_dia_semana(self):
-        dia_ingles = datetime.now().strftime('%A').lower()
-        dias_espanol = {
-            'monday': 'lunes',
-            'tuesday': 'martes',
- 'wednesday': 'miércoles',
-            'thursday': 'jueves',
-            'friday': 'viernes',
-            'saturday': 'sábado',
-            'sunday': 'domingo'
-        }
-        return dias_espanol.get(dia_ingles, 'Día no reconocido')
+        return DIAS_SEMANA[datetime.now().weekday()] # Con weekday() no depende del idioma del sistema
 
     def actualizar_horario_dia(self):
         self.storage = JsonStore('local.json')
@@ -138,6 +134,7 @@ class CamaraScreen(Screen):
         self.padding = dp(10)
         self.spacing = dp(10)
         self.horarios_procesados_cierre = {}
+        self.etags_usuarios = {} # id_horario -> ETag de la última lista de usuarios recibida
         self._popup_carga = None
 
         self.layout_botones_imagen = BoxLayout(orientation='vertical', spacing=dp(10))
@@ -328,9 +325,15 @@ class CamaraScreen(Screen):
 
     def actualizar_lista_alumnos(self, id_horario):
         try:
-            response = requests.get(f'{endpoints["usuarios"]}/{id_horario}')
-            if response.status_code == 200:
+            # Con el ETag de la última respuesta, el backend contesta 304 si la lista no cambió y ya está cargada
+            headers = {"If-None-Match": self.etags_usuarios[id_horario]} if id_horario in self.etags_usuarios else {}
+            response = requests.get(f'{endpoints["usuarios"]}/{id_horario}', headers=headers)
+            if response.status_code == 304:
+                print("Lista de alumnos sin cambios.")
+            elif response.status_code == 200:
                 usuarios = response.json()
+                if response.headers.get("ETag"):
+                    self.etags_usuarios[id_horario] = response.headers["ETag"]
                 print(f"Lista de alumnos actualizada: {usuarios}")
                 # Aquí podrías guardar la lista de alumnos en JsonStore si es necesario
             else:
@@ -363,8 +366,12 @@ class CamaraScreen(Screen):
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             _, encoded_image = cv2.imencode('.jpg', frame)
             files_to_send = {'image_file': ('captured_frame.jpg', encoded_image.tobytes(), 'image/jpeg')}
+            # El backend limita la búsqueda a los alumnos y al profesor del horario actual
+            data_to_send = {}
+            if self.storage.exists("horario_actual"):
+                data_to_send["id_horario"] = self.storage.get("horario_actual")["horario"]["id"]
 
-            response = requests.post(api_url, files=files_to_send, timeout=15)
+            response = requests.post(api_url, files=files_to_send, data=data_to_send, timeout=15)
             response.raise_for_status()
             datos_respuesta = response.json()
 
@@ -582,6 +589,14 @@ class CamaraScreen(Screen):
         try:
             folder = "desconocidos_clase_actual"
             urls = []
+            cantidades = []
+
+            # El backend agrupa los frames de una misma persona en una sola imagen y anota cuántos frames agrupó
+            ruta_cantidades = os.path.join(folder, "desconocidos.json")
+            cantidades_por_archivo = {}
+            if os.path.exists(ruta_cantidades):
+                with open(ruta_cantidades, encoding="utf-8") as f:
+                    cantidades_por_archivo = json.load(f)
 
             # Recorre todos los archivos de imagen en el directorio
             for filename in os.listdir(folder):
@@ -592,13 +607,14 @@ class CamaraScreen(Screen):
                         upload_result = cloudinary.uploader.upload(img_file, resource_type="image")
                         imagen_url = upload_result['secure_url']
                         urls.append(imagen_url)
+                        cantidades.append(cantidades_por_archivo.get(filename, 1))
                         print(f"Imagen subida a Cloudinary: {imagen_url}")
 
             # Envía la lista de URLs al backend
             if urls:
                 response = requests.post(
                     f'{endpoints["desconocido"]}/{id_horario}',
-                    json={"url_img": urls}
+                    json={"url_img": urls, "cantidades": cantidades}
                 )
                 if response.status_code == 200:
                     print('Desconocidos guardados correctamente')
@@ -695,22 +711,24 @@ class ReconocimientoFacialApp(App):
             self.sm.current = 'inicio_sesion_screen'
 
     def obtener_dia_semana(self):
-        dia_ingles = datetime.now().strftime('%A').lower()
-        dias_espanol = {
-            'monday': 'lunes', 'tuesday': 'martes', 'wednesday': 'miércoles',
-            'thursday': 'jueves', 'friday': 'viernes', 'saturday': 'sábado', 'sunday': 'domingo'
-        }
-        return dias_espanol.get(dia_ingles, 'Día no reconocido')
+        return DIAS_SEMANA[datetime.now().weekday()] # Con weekday() no depende del idioma del sistema
 
     def actualizar_horario_dia(self):
         try:
             dia_semana = self.obtener_dia_semana()
-            response = requests.post(endpoints["salon"], json={"salon": self.storage.get('salon')['salon']})
-            if response.status_code == 200:
-                self.storage.put("horario", horario=response.json())
+            horario = self.storage.get('horario')['horario']
+            try:
+                response = requests.post(endpoints["salon"], json={"salon": self.storage.get('salon')['salon'], "dia_semana": dia_semana})
+                if response.status_code == 200:
+                    # Solo llegan los horarios de hoy: reemplazan los de este día en la semana guardada, sin perder
+                    # los demás días (la copia local con la que se arranca si /salon no responde)
+                    otros_dias = [h for h in horario['horarios'] if h['dia_semana'] != dia_semana]
+                    horario = dict(horario, horarios=otros_dias + response.json()['horarios'])
+                    self.storage.put("horario", horario=horario)
+            except requests.exceptions.RequestException as e:
+                print(f"No se pudo actualizar el horario, se usa el guardado: {e}")
 
-            horarios = self.storage.get('horario')['horario']['horarios']
-            horarios_dia = [h for h in horarios if h['dia_semana'] == dia_semana]
+            horarios_dia = [h for h in horario['horarios'] if h['dia_semana'] == dia_semana]
             self.storage.put('horario_dia', horario_dia=horarios_dia)
         except Exception as e:
             print(f"Error al actualizar horario: {e}")